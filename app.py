@@ -1,10 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from rag_engine import RAGEngine
+import metrics
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -26,12 +28,15 @@ rag_engine = RAGEngine()
 class ChatRequest(BaseModel):
     message: str
     conversation_history: list = []
+    session_id: Optional[str] = None  # 上一轮响应返回的会话ID，会话存在时使用服务端会话历史
 
 class ChatResponse(BaseModel):
     response: str
     sources: list = []
     stage: Optional[str] = None  # 对话阶段: 'empathy', 'reflection', 'support', None
     risk_level: str = 'none'  # 风险级别
+    session_id: Optional[str] = None  # 服务端生成的会话ID，下一轮请求带上
+    session_reset: bool = False  # 请求的会话已失效（过期、重启等），已用conversation_history开始新会话
 
 @app.get("/")
 async def read_root():
@@ -41,9 +46,10 @@ async def read_root():
 async def chat(request: ChatRequest):
     try:
         # 调用RAG引擎生成回复
-        result = rag_engine.chat(
+        result = await rag_engine.chat(
             user_message=request.message,
-            conversation_history=request.conversation_history
+            conversation_history=request.conversation_history,
+            session_id=request.session_id
         )
         
         # 确保 response 字段存在且不为空
@@ -54,7 +60,9 @@ async def chat(request: ChatRequest):
             response=result["response"],
             sources=result.get("sources", []),
             stage=result.get("stage"),  # 可以是None（高风险情况下）
-            risk_level=result.get("risk_level", "none")
+            risk_level=result.get("risk_level", "none"),
+            session_id=result.get("session_id"),
+            session_reset=result.get("session_reset", False)
         )
     except Exception as e:
         import traceback
@@ -62,10 +70,48 @@ async def chat(request: ChatRequest):
         print(f"Error in /api/chat: {error_detail}")  # 打印完整错误到控制台
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """流式聊天（Server-Sent Events）：先发 meta 事件，再逐段发 token 事件，最后发 done 事件"""
+    async def event_source():
+        try:
+            async for event, data in rag_engine.chat_stream(
+                user_message=request.message,
+                conversation_history=request.conversation_history,
+                session_id=request.session_id
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            import traceback
+            error_detail = f"{str(e)}\n{traceback.format_exc()}"
+            print(f"Error in /api/chat/stream: {error_detail}")  # 打印完整错误到控制台
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 禁止代理缓冲，保证逐段送达
+    )
+
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """缓存命中率等统计"""
+    return rag_engine.cache_stats()
+
+@app.get("/api/fast-path/stats")
+async def fast_path_stats():
+    """问候语快速通道处理的轮次占比"""
+    return rag_engine.fast_path_stats()
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """各步骤延迟、LLM调用和token、缓存命中、降级次数（Prometheus文本格式）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     import sys
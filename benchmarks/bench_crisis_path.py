@@ -0,0 +1,114 @@
+"""危机路径延迟基准：翻译前多语言风险筛查 开 vs 关
+
+用带固定延迟的模拟 AsyncOpenAI 客户端代替真实API（不需要API Key、不产生费用），
+对 zh/es/fr/en 的高风险消息分别测量 chat() 返回危机响应的耗时和LLM调用次数。
+
+用法（在项目根目录）：
+    python benchmarks/bench_crisis_path.py [--latency-ms 400] [--repeat 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Settings  # noqa: E402
+from rag_engine import RAGEngine  # noqa: E402
+
+# (语言, 高风险消息, 英文翻译)
+SCENARIOS = [
+    ('zh', '我不想活了，我想结束自己的生命', 'I do not want to live anymore, I want to end my own life'),
+    ('es', 'Ya no quiero vivir, quiero suicidarme', 'I do not want to live anymore, I want to kill myself'),
+    ('fr', "Je veux me suicider, je n'en peux plus", "I want to kill myself, I can't take it anymore"),
+    ('en', 'I want to kill myself tonight', 'I want to kill myself tonight'),
+]
+
+
+class FakeCompletions:
+    """模拟 chat.completions：每次调用等待固定延迟，按提示词类型返回合理的内容"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def _scenario(self, text: str):
+        for scenario in SCENARIOS:
+            if scenario[1] in text:
+                return scenario
+        return None
+
+    async def create(self, model=None, messages=None, response_format=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        system = messages[0]['content']
+        prompt = messages[-1]['content']
+        scenario = self._scenario(prompt)
+
+        if response_format is not None:
+            language, _, message_en = scenario or ('en', prompt, prompt)
+            content = json.dumps({'language': language, 'message_en': message_en, 'stage': 'reflection'})
+        elif 'language detection' in system:
+            content = scenario[0] if scenario else 'en'
+        elif 'Translate' in prompt or 'translator' in system:
+            content = scenario[2] if scenario else prompt.split('\n\n', 1)[-1]
+        else:
+            content = 'I hear you. You are not alone.'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [0.0] * 8
+
+    async def aembed_query(self, text):
+        return [0.0] * 8
+
+
+class FakeVectorStore:
+    def similarity_search_with_score(self, query, k=4):
+        return []
+
+
+async def measure(prescreen: bool, latency: float, repeat: int):
+    Settings.RISK_PRESCREEN_ENABLED = prescreen
+    rows = []
+    for language, message, _ in SCENARIOS:
+        durations = []
+        calls = 0
+        for _ in range(repeat):
+            completions = FakeCompletions(latency)
+            client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+            engine = RAGEngine(client=client, embeddings=FakeEmbeddings(), vectorstore=FakeVectorStore())
+            started = time.perf_counter()
+            result = await engine.chat(message)
+            durations.append((time.perf_counter() - started) * 1000)
+            calls = completions.calls
+            assert result['risk_level'] == 'high', f"{language}: crisis not detected"
+        rows.append((language, statistics.median(durations), calls))
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=400, help='模拟的每次LLM调用延迟（毫秒）')
+    parser.add_argument('--repeat', type=int, default=3, help='每条消息重复次数（取中位数）')
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    before = await measure(False, latency, args.repeat)
+    after = await measure(True, latency, args.repeat)
+
+    print(f"\n危机路径延迟（模拟LLM延迟 {args.latency_ms:.0f}ms，中位数）")
+    print(f"{'语言':<6}{'筛查关 ms':>12}{'LLM调用':>10}{'筛查开 ms':>12}{'LLM调用':>10}{'加速':>8}")
+    for (language, before_ms, before_calls), (_, after_ms, after_calls) in zip(before, after):
+        speedup = before_ms / after_ms if after_ms else float('inf')
+        print(f"{language:<6}{before_ms:>12.1f}{before_calls:>10}{after_ms:>12.1f}{after_calls:>10}{speedup:>7.1f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""本地向量索引的维度/精度权衡基准：每个文档块的内存、检索延迟、recall@k
+
+以全维度 float32 的精确检索结果为基准，比较缩短维度（EMBEDDING_DIMENSIONS）与 float16/int8 存储
+（VECTOR_INDEX_DTYPE）的组合。text-embedding-3 的缩短维度等价于截取前 d 维后重新归一化，
+这里对同一批向量做同样的处理，不需要重新调用Embedding API。
+
+向量来源：
+- 默认读取 init_kb.py 导出的索引（Settings.VECTOR_INDEX_PATH，需为全维度导出），用随机文档块加噪声作查询
+- 索引不存在或指定 --synthetic 时生成带主题聚类的随机向量
+  （合成向量的各维度同等重要，缩短维度后的 recall 明显低于真实 text-embedding-3 向量，只适合比较存储精度）
+
+用法（在项目根目录）：
+    python benchmarks/bench_vector_index.py [--synthetic --count 50000] [--dims 1536,1024,512,256] [--k 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Settings  # noqa: E402
+from vector_index import DTYPES, NumpyVectorIndex  # noqa: E402
+
+
+def synthetic_vectors(count: int, dimension: int, topics: int, seed: int) -> np.ndarray:
+    """带主题聚类的单位向量（真实Embedding在少数主题方向上聚集，纯随机向量会高估量化误差）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, size=count)] + rng.normal(scale=0.8, size=(count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def shorten(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    """截取前 dimension 维并重新归一化（与 text-embedding-3 的 dimensions 参数一致）"""
+    shortened = np.ascontiguousarray(vectors[:, :dimension], dtype=np.float32)
+    return shortened / np.maximum(np.linalg.norm(shortened, axis=1, keepdims=True), 1e-12)
+
+
+def top_ids(index: NumpyVectorIndex, queries: np.ndarray, k: int):
+    return [[document.metadata['row'] for document, _ in results] for results in index.search_batch(queries, k)]
+
+
+def measure(vectors, queries, dimension, dtype, space, k, baseline, workdir):
+    texts = [''] * len(vectors)
+    metadatas = [{'row': i} for i in range(len(vectors))]
+    index = NumpyVectorIndex(shorten(vectors, dimension), texts, metadatas, space=space, dtype=dtype)
+    # 与服务进程一样从磁盘内存映射加载
+    path = os.path.join(workdir, f"{dimension}-{dtype}")
+    index.save(path)
+    index = NumpyVectorIndex.load(path, mmap=True)
+
+    shortened_queries = shorten(queries, dimension)
+    durations = []
+    for query in shortened_queries:
+        started = time.perf_counter()
+        index.search(query, k)
+        durations.append((time.perf_counter() - started) * 1000)
+
+    results = top_ids(index, shortened_queries, k)
+    recall = statistics.mean(len(set(found) & set(expected)) / k for found, expected in zip(results, baseline))
+    return index.bytes_per_vector, statistics.median(durations), np.percentile(durations, 95), recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default=Settings.VECTOR_INDEX_PATH, help='全维度导出的索引目录')
+    parser.add_argument('--synthetic', action='store_true', help='使用合成向量')
+    parser.add_argument('--count', type=int, default=20000, help='合成向量数量')
+    parser.add_argument('--dims', default='1536,1024,512,256', help='比较的维度（逗号分隔，不超过原始维度）')
+    parser.add_argument('--dtypes', default=','.join(DTYPES), help='比较的存储精度')
+    parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    parser.add_argument('--k', type=int, default=Settings.TOP_K_RETRIEVAL, help='recall@k 的 k')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if not args.synthetic and os.path.exists(os.path.join(args.index, 'index.json')):
+        source = NumpyVectorIndex.load(args.index, mmap=False)
+        vectors = source.dequantize()
+        space = source.space
+        print(f"向量来源: {args.index}（{len(vectors)} 个，{vectors.shape[1]}维 {source.dtype}，{space}距离）")
+    else:
+        vectors = synthetic_vectors(args.count, 1536, topics=64, seed=args.seed)
+        space = 'l2'
+        print(f"向量来源: 合成（{len(vectors)} 个，1536维，{space}距离）")
+
+    full_dimension = vectors.shape[1]
+    dims = [d for d in (int(x) for x in args.dims.split(',')) if d <= full_dimension]
+    dtypes = args.dtypes.split(',')
+    picks = rng.integers(0, len(vectors), size=args.queries)
+    queries = vectors[picks] + rng.normal(scale=0.02, size=(args.queries, full_dimension)).astype(np.float32)
+
+    # 基准：全维度 float32 精确检索
+    baseline_index = NumpyVectorIndex(vectors, [''] * len(vectors), [{'row': i} for i in range(len(vectors))], space=space)
+    baseline = top_ids(baseline_index, queries, args.k)
+
+    print(f"\n{'维度':>6}{'精度':>9}{'字节/块':>10}{'索引MB':>10}{'p50 ms':>9}{'p95 ms':>9}{f'recall@{args.k}':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for dimension in dims:
+            for dtype in dtypes:
+                bytes_per_vector, p50, p95, recall = measure(
+                    vectors, queries, dimension, dtype, space, args.k, baseline, workdir
+                )
+                total_mb = bytes_per_vector * len(vectors) / 1024 / 1024
+                print(f"{dimension:>6}{dtype:>9}{bytes_per_vector:>10}{total_mb:>10.1f}{p50:>9.2f}{p95:>9.2f}{recall:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
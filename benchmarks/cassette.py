@@ -0,0 +1,512 @@
+"""OpenAI / Embeddings / ChromaDB 调用的录制与回放（cassette）
+
+对接真实服务运行时，把 RAGEngine 发出的 chat.completions.create、Embedding 和向量检索
+（本地ChromaDB的 similarity_search_with_score，或ChromaDB Cloud异步集合的 query/get）
+的请求和响应连同实际耗时写入 cassette 文件；回放时按请求查找录制的响应，按原始耗时
+（可以用 time_scale 压缩）等待后返回。生产环境的对话记录因此可以离线重跑，
+不同的流水线实现可以在完全相同的输入上比较。
+
+cassette 是 gzip 压缩的 JSON Lines：第一行是文件头（版本、录制时间和调用方提供的元数据），
+之后每行一次调用或一轮对话。为了保持文件紧凑，请求只保存哈希和一段便于查看的摘要，
+Embedding 向量保存为 base64 编码的 float32。
+
+模式：
+- record：全部调用真实服务并录制（覆盖已有文件）
+- replay：只回放，找不到录制的请求时抛出 CassetteMiss
+- new：能回放的回放，找不到的调用真实服务并追加录制（流水线改动后补录新增的请求）
+
+相同的请求按录制顺序依次回放，用完后重复使用最后一次的响应。录制时真实服务抛出的异常也会录制下来，
+回放时以 CassetteReplayError 抛出，引擎的降级处理与录制时一致。
+"""
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+CASSETTE_VERSION = 1
+MODES = ('record', 'replay', 'new')
+
+_SUMMARY_CHARS = 200
+
+
+class CassetteMiss(KeyError):
+    """回放时找不到录制的请求"""
+
+
+class CassetteReplayError(RuntimeError):
+    """录制时真实服务抛出的异常"""
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _encode_vectors(vectors) -> List[str]:
+    return [base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii') for vector in vectors]
+
+
+def _decode_vectors(encoded: List[str]) -> List[List[float]]:
+    return [np.frombuffer(base64.b64decode(item), dtype=np.float32).tolist() for item in encoded]
+
+
+def _vector_key(vectors) -> str:
+    """查询向量按float32取哈希（回放时的向量是从float32解码的，录制时的float64向量需要得到同样的键）"""
+    digest = hashlib.sha256()
+    for vector in vectors:
+        digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+class Cassette:
+    """一个 cassette 文件：录制的调用按请求键分组，回放时按录制顺序取出"""
+
+    def __init__(self, path: str, mode: str = 'replay', time_scale: float = 1.0, metadata: Optional[Dict] = None):
+        """
+        Args:
+            path: 文件路径（建议使用 .jsonl.gz 后缀）
+            mode: record / replay / new
+            time_scale: 回放时的耗时缩放系数（1.0 按原始耗时，0 不等待）
+            metadata: record 模式写入文件头的元数据（如提交、配置）
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.header = {'type': 'header', 'version': CASSETTE_VERSION,
+                       'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'metadata': metadata or {}}
+        self.entries: List[Dict] = []  # 按录制顺序
+        self.turns: List[Dict] = []  # 录制的对话轮次 {'session_id', 'message'}
+        self._queues: Dict[str, deque] = {}
+        self._last: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.reused = Counter()
+        self.recorded = Counter()
+        if mode != 'record':
+            self.load()
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry['type'] == 'header':
+                    if entry.get('version') != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version {entry.get('version')} in {self.path}")
+                    self.header = entry
+                elif entry['type'] == 'turn':
+                    self.turns.append(entry)
+                else:
+                    self._add(entry)
+
+    def _add(self, entry: Dict):
+        self.entries.append(entry)
+        self._queues.setdefault(entry['key'], deque()).append(entry)
+
+    @staticmethod
+    def key(kind: str, request) -> str:
+        return hashlib.sha256(f"{kind}\x00{_canonical(request)}".encode('utf-8')).hexdigest()
+
+    def lookup(self, kind: str, key: str) -> Optional[Dict]:
+        """取出下一条录制的响应；record 模式或找不到时返回None（replay 模式下找不到抛出 CassetteMiss）"""
+        if self.mode == 'record':
+            return None
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                entry = self._last[key] = queue.popleft()
+                self.hits[kind] += 1
+                return entry
+            if key in self._last:
+                self.reused[kind] += 1
+                return self._last[key]
+            self.misses[kind] += 1
+        if self.mode == 'replay':
+            raise CassetteMiss(f"No recorded {kind} call for request {key[:12]}")
+        return None
+
+    def record(self, kind: str, key: str, summary: Dict, latency_ms: float, response: Optional[Dict] = None,
+               error: Optional[BaseException] = None):
+        entry = {'type': kind, 'key': key, 'request': summary, 'latency_ms': round(latency_ms, 3)}
+        if error is not None:
+            entry['error'] = f"{error.__class__.__name__}: {error}"
+        else:
+            entry['response'] = response
+        with self._lock:
+            self.entries.append(entry)
+            self._last.setdefault(key, entry)
+            self.recorded[kind] += 1
+
+    def record_turn(self, session_id: str, message: str):
+        with self._lock:
+            self.turns.append({'type': 'turn', 'session_id': session_id, 'message': message})
+
+    def delay(self, latency_ms: float) -> float:
+        """回放时应等待的秒数"""
+        return latency_ms * self.time_scale / 1000
+
+    @staticmethod
+    def raise_recorded_error(entry: Dict):
+        if 'error' in entry:
+            raise CassetteReplayError(entry['error'])
+
+    def save(self):
+        """写入文件（先写临时文件再替换）"""
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for entry in [self.header, *self.turns, *self.entries]:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'entries': len(self.entries),
+            'turns': len(self.turns),
+            'hits': dict(self.hits),
+            'reused': dict(self.reused),
+            'misses': dict(self.misses),
+            'recorded': dict(self.recorded),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.mode != 'replay':
+            self.save()
+        return False
+
+
+# === OpenAI chat.completions ===
+
+def _usage_to_list(usage) -> Optional[List[int]]:
+    if usage is None:
+        return None
+    cached = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', 0) or 0
+    return [usage.prompt_tokens or 0, usage.completion_tokens or 0, cached]
+
+
+def _usage_from_list(values: Optional[List[int]]):
+    if values is None:
+        return None
+    prompt_tokens, completion_tokens, cached_tokens = values
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+
+
+def _chat_summary(kwargs: Dict) -> Dict:
+    messages = kwargs.get('messages') or []
+    return {
+        'model': kwargs.get('model'),
+        'stream': bool(kwargs.get('stream')),
+        'system': (messages[0].get('content') or '')[:_SUMMARY_CHARS] if messages and messages[0].get('role') == 'system' else None,
+        'last': (messages[-1].get('content') or '')[-_SUMMARY_CHARS:] if messages else None,
+    }
+
+
+class _CassetteCompletions:
+    def __init__(self, cassette: Cassette, completions=None):
+        self.cassette = cassette
+        self.completions = completions
+        self.calls: List[Dict] = []  # 每次调用的 messages、response_format 和用量 [输入, 输出, 缓存命中]
+
+    async def create(self, **kwargs):
+        call = {'messages': kwargs.get('messages'), 'response_format': kwargs.get('response_format'), 'usage': None}
+        self.calls.append(call)
+        # stream_options 只影响是否返回用量，不参与匹配
+        key = Cassette.key('chat', {name: value for name, value in kwargs.items() if name != 'stream_options'})
+        entry = self.cassette.lookup('chat', key)
+        if entry is not None:
+            call['usage'] = (entry.get('response') or {}).get('usage')
+            return await self._replay(entry, kwargs)
+        if self.completions is None:
+            raise CassetteMiss(f"No recorded chat call for request {key[:12]} and no live client")
+
+        started = time.perf_counter()
+        try:
+            response = await self.completions.create(**kwargs)
+        except Exception as e:
+            self.cassette.record('chat', key, _chat_summary(kwargs), (time.perf_counter() - started) * 1000, error=e)
+            raise
+        latency_ms = (time.perf_counter() - started) * 1000
+        if kwargs.get('stream'):
+            return self._record_stream(response, key, kwargs, latency_ms, call)
+        call['usage'] = _usage_to_list(getattr(response, 'usage', None))
+        self.cassette.record('chat', key, _chat_summary(kwargs), latency_ms, {
+            'content': response.choices[0].message.content,
+            'usage': call['usage'],
+        })
+        return response
+
+    async def _record_stream(self, stream, key: str, kwargs: Dict, latency_ms: float, call: Dict):
+        """边转发边录制流式片段：[距上一片段的毫秒数, 文本]"""
+        chunks, usage = [], None
+        last = time.perf_counter()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                now = time.perf_counter()
+                chunks.append([round((now - last) * 1000, 3), chunk.choices[0].delta.content])
+                last = now
+            if getattr(chunk, 'usage', None) is not None:
+                usage = _usage_to_list(chunk.usage)
+            yield chunk
+        call['usage'] = usage
+        self.cassette.record('chat', key, _chat_summary(kwargs), latency_ms, {'chunks': chunks, 'usage': usage})
+
+    async def _replay(self, entry: Dict, kwargs: Dict):
+        await asyncio.sleep(self.cassette.delay(entry['latency_ms']))
+        Cassette.raise_recorded_error(entry)
+        response = entry['response']
+        if not kwargs.get('stream'):
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=response['content']))],
+                usage=_usage_from_list(response['usage'])
+            )
+        include_usage = bool((kwargs.get('stream_options') or {}).get('include_usage'))
+        return self._replay_stream(response, include_usage)
+
+    async def _replay_stream(self, response: Dict, include_usage: bool):
+        # 按累计的截止时间等待，避免逐个片段 sleep 的误差累积
+        deadline = time.perf_counter()
+        for delay_ms, text in response['chunks']:
+            deadline += self.cassette.delay(delay_ms)
+            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+        if include_usage and response['usage'] is not None:
+            yield SimpleNamespace(choices=[], usage=_usage_from_list(response['usage']))
+
+
+class CassetteAsyncOpenAI:
+    """AsyncOpenAI 的录制/回放封装：client 为真实客户端（replay 模式可以为None）"""
+
+    def __init__(self, cassette: Cassette, client=None):
+        self.client = client
+        self.completions = _CassetteCompletions(cassette, client.chat.completions if client is not None else None)
+        self.chat = SimpleNamespace(completions=self.completions)
+
+    @property
+    def calls(self) -> List[Dict]:
+        return self.completions.calls
+
+
+# === Embeddings ===
+
+class CassetteEmbeddings(Embeddings):
+    """Embeddings 的录制/回放封装"""
+
+    def __init__(self, cassette: Cassette, embeddings: Optional[Embeddings] = None):
+        self.cassette = cassette
+        self.embeddings = embeddings
+
+    def _lookup(self, texts: List[str]) -> Tuple[str, Optional[Dict]]:
+        key = Cassette.key('embedding', texts)
+        entry = self.cassette.lookup('embedding', key)
+        if entry is None and self.embeddings is None:
+            raise CassetteMiss(f"No recorded embedding call for request {key[:12]} and no live embeddings")
+        return key, entry
+
+    def _record(self, key: str, texts: List[str], started: float, vectors=None, error=None):
+        self.cassette.record('embedding', key, {'texts': len(texts), 'first': texts[0][:_SUMMARY_CHARS] if texts else ''},
+                             (time.perf_counter() - started) * 1000,
+                             {'vectors': _encode_vectors(vectors)} if vectors is not None else None, error)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        key, entry = self._lookup(texts)
+        if entry is not None:
+            time.sleep(self.cassette.delay(entry['latency_ms']))
+            Cassette.raise_recorded_error(entry)
+            return _decode_vectors(entry['response']['vectors'])
+        started = time.perf_counter()
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            self._record(key, texts, started, error=e)
+            raise
+        self._record(key, texts, started, vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        key, entry = self._lookup(texts)
+        if entry is not None:
+            await asyncio.sleep(self.cassette.delay(entry['latency_ms']))
+            Cassette.raise_recorded_error(entry)
+            return _decode_vectors(entry['response']['vectors'])
+        started = time.perf_counter()
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as e:
+            self._record(key, texts, started, error=e)
+            raise
+        self._record(key, texts, started, vectors)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+# === 向量检索 ===
+
+def _encode_documents(results: List[Tuple[Document, float]]) -> List[List]:
+    return [[document.id, document.page_content, document.metadata, float(score)] for document, score in results]
+
+
+def _decode_documents(results: List[List]) -> List[Tuple[Document, float]]:
+    return [(Document(page_content=text, metadata=metadata, id=chunk_id), score)
+            for chunk_id, text, metadata, score in results]
+
+
+class CassetteVectorStore:
+    """LangChain Chroma 向量库（similarity_search_with_score）的录制/回放封装"""
+
+    def __init__(self, cassette: Cassette, vectorstore=None):
+        self.cassette = cassette
+        self.vectorstore = vectorstore
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None
+                                     ) -> List[Tuple[Document, float]]:
+        request = {'query': query, 'k': k, 'filter': filter}
+        key = Cassette.key('vector_search', request)
+        entry = self.cassette.lookup('vector_search', key)
+        if entry is not None:
+            time.sleep(self.cassette.delay(entry['latency_ms']))
+            Cassette.raise_recorded_error(entry)
+            return _decode_documents(entry['response']['results'])
+        if self.vectorstore is None:
+            raise CassetteMiss(f"No recorded vector search for request {key[:12]} and no live vectorstore")
+        started = time.perf_counter()
+        try:
+            results = self.vectorstore.similarity_search_with_score(query, k=k, filter=filter)
+        except Exception as e:
+            self.cassette.record('vector_search', key, request, (time.perf_counter() - started) * 1000, error=e)
+            raise
+        self.cassette.record('vector_search', key, request, (time.perf_counter() - started) * 1000,
+                             {'results': _encode_documents(results)})
+        return results
+
+    @property
+    def _collection(self):
+        # 混合检索补查向量距离时使用；回放时没有集合，只被BM25召回的文档块不补距离
+        return getattr(self.vectorstore, '_collection', None)
+
+
+def _jsonable(value):
+    """ChromaDB返回结果中的numpy数组转成列表"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {name: _jsonable(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+class CassetteCollection:
+    """ChromaDB Cloud 异步集合（query / get）的录制/回放封装"""
+
+    def __init__(self, cassette: Cassette, collection=None):
+        self.cassette = cassette
+        self.collection = collection
+        self.metadata = collection.metadata if collection is not None else cassette.header['metadata'].get('collection_metadata')
+
+    async def _call(self, kind: str, request: Dict, method: str, **kwargs):
+        key = Cassette.key(kind, request)
+        entry = self.cassette.lookup(kind, key)
+        if entry is not None:
+            await asyncio.sleep(self.cassette.delay(entry['latency_ms']))
+            Cassette.raise_recorded_error(entry)
+            return entry['response']
+        if self.collection is None:
+            raise CassetteMiss(f"No recorded {kind} for request {key[:12]} and no live collection")
+        started = time.perf_counter()
+        try:
+            results = await getattr(self.collection, method)(**kwargs)
+        except Exception as e:
+            self.cassette.record(kind, key, request, (time.perf_counter() - started) * 1000, error=e)
+            raise
+        results = _jsonable(dict(results))
+        self.cassette.record(kind, key, request, (time.perf_counter() - started) * 1000, results)
+        return results
+
+    async def query(self, query_embeddings, n_results: int, where: Optional[Dict] = None, include=None):
+        request = {'embedding': _vector_key(query_embeddings), 'n_results': n_results, 'where': where, 'include': include}
+        return await self._call('collection_query', request, 'query', query_embeddings=query_embeddings,
+                                n_results=n_results, where=where, include=include)
+
+    async def get(self, ids: List[str], include=None):
+        return await self._call('collection_get', {'ids': ids, 'include': include}, 'get', ids=ids, include=include)
+
+
+def instrument(engine, cassette: Cassette):
+    """给已创建的 RAGEngine 装上录制封装（record / new 模式，引擎使用真实的客户端和向量库）"""
+    engine.client = CassetteAsyncOpenAI(cassette, engine.client)
+    engine.history_manager.client = engine.client
+    engine.embeddings = CassetteEmbeddings(cassette, engine.embeddings)
+    if engine.vectorstore is not None:
+        engine.vectorstore = CassetteVectorStore(cassette, engine.vectorstore)
+    elif engine.vector_index is None:
+        # ChromaDB Cloud：异步集合在首次检索时创建，创建后再封装
+        get_collection = engine._get_async_collection
+
+        async def get_recorded_collection():
+            collection = await get_collection()
+            if not isinstance(collection, CassetteCollection):
+                collection = engine._async_collection = CassetteCollection(cassette, collection)
+                cassette.header['metadata']['collection_metadata'] = collection.metadata
+            return collection
+
+        engine._get_async_collection = get_recorded_collection
+    return engine
+
+
+def replay_engine(cassette: Cassette):
+    """创建只使用 cassette 的 RAGEngine（replay 模式，无需网络）
+
+    录制时用的是本地ChromaDB时注入回放向量库；用的是ChromaDB Cloud时预先放入回放集合；
+    用的是进程内NumPy索引时只回放Embedding，检索仍使用本地索引文件。
+    """
+    from config import Settings
+    from rag_engine import RAGEngine
+
+    kinds = {entry['type'] for entry in cassette.entries}
+    backend = cassette.header['metadata'].get('retrieval_backend')
+    if 'vector_search' in kinds or backend == 'chroma_local':
+        return RAGEngine(client=CassetteAsyncOpenAI(cassette), embeddings=CassetteEmbeddings(cassette),
+                         vectorstore=CassetteVectorStore(cassette))
+    if 'collection_query' in kinds or backend == 'chroma_cloud':
+        engine = RAGEngine(client=CassetteAsyncOpenAI(cassette), embeddings=CassetteEmbeddings(cassette),
+                           vectorstore=CassetteVectorStore(cassette))
+        engine.vectorstore = None
+        engine._async_collection = CassetteCollection(cassette)
+        return engine
+    if Settings.RETRIEVAL_BACKEND != 'numpy':
+        print("[WARNING] Cassette has no vector search calls, replaying with the in-process numpy index")
+        Settings.RETRIEVAL_BACKEND = 'numpy'
+    return RAGEngine(client=CassetteAsyncOpenAI(cassette), embeddings=CassetteEmbeddings(cassette))
+
+
+def retrieval_backend(engine) -> str:
+    """引擎实际使用的检索后端（写入 cassette 文件头，回放时据此创建引擎）"""
+    if engine.vectorstore is not None:
+        return 'chroma_local'
+    if engine.vector_index is not None:
+        return 'numpy'
+    return 'chroma_cloud'
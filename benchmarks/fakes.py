@@ -0,0 +1,406 @@
+"""离线基准测试用的替身：AsyncOpenAI 客户端、Embeddings、ChromaDB向量库
+
+三者都可以直接注入 RAGEngine(client=..., embeddings=..., vectorstore=...)，不需要网络和API Key：
+- 每次调用按调用类型（轮次分析、语言检测、翻译、阶段检测、历史摘要、生成、Embedding、向量检索）
+  从可配置的延迟分布中取样并等待；延迟由 (种子, 调用类型, 输入内容) 决定，与调用的先后顺序无关，结果可以跨提交比较
+- 输出来自场景登记的固定内容（见 scenarios.py）：每条用户消息的语言、英文翻译和对话阶段，
+  以及各语言的生成回复；未登记的文本按本地规则给出确定的结果
+- 记录每次LLM调用的类型、输入/输出token和模拟的提示词缓存命中，供 run_benchmarks.py 汇总
+
+模拟的提示词缓存与OpenAI的规则一致：提示词不少于1024个token时，与之前请求相同的最长前缀
+（这里按消息粒度判断）以128个token为单位计为 cached_tokens。
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from history_manager import count_tokens
+from language_detector import detect_language as detect_language_locally
+from rag_engine import LANGUAGE_NAMES
+from vector_index import matches_where
+
+# LLM调用类型（与 rag_engine 中 _complete 的调用位置对应，翻译两个方向合并为 translation）
+CALL_KINDS = ('turn_analysis', 'language_detection', 'translation', 'stage_detection', 'history_summary', 'generation')
+
+
+@dataclass(frozen=True)
+class Latency:
+    """对数正态延迟分布：中位数 median_ms，离散程度 sigma（0 表示固定延迟）"""
+    median_ms: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """取样，返回秒"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.sigma * rng.gauss(0.0, 1.0)) / 1000
+
+
+# 延迟配置：调用类型 -> 延迟分布；generation 为首token延迟，generation_token 为之后每个输出token的间隔
+PROFILES: Dict[str, Dict[str, Latency]] = {
+    'zero': {},
+    'realistic': {
+        'turn_analysis': Latency(700, 0.3),
+        'language_detection': Latency(350, 0.3),
+        'translation': Latency(600, 0.35),
+        'stage_detection': Latency(450, 0.3),
+        'history_summary': Latency(900, 0.3),
+        'generation': Latency(600, 0.3),
+        'generation_token': Latency(12, 0.1),
+        'embedding': Latency(90, 0.3),
+        'vector_search': Latency(60, 0.4),
+    },
+}
+
+
+class LatencyModel:
+    """按调用类型取样延迟；同样的 (类型, 输入) 总是得到同样的延迟"""
+
+    def __init__(self, profile: Dict[str, Latency], seed: int = 0, time_scale: float = 1.0):
+        self.profile = profile
+        self.seed = seed
+        self.time_scale = time_scale
+
+    def rng(self, kind: str, key: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}\x00{kind}\x00{key}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def sample(self, kind: str, key: str, rng: Optional[random.Random] = None) -> float:
+        latency = self.profile.get(kind)
+        if latency is None:
+            return 0.0
+        return latency.sample(rng or self.rng(kind, key)) * self.time_scale
+
+
+@dataclass
+class CallRecord:
+    kind: str
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    latency_ms: float
+
+
+@dataclass(frozen=True)
+class CannedTurn:
+    """一条用户消息的固定分析结果"""
+    message: str
+    language: str
+    message_en: str
+    stage: str
+
+
+# 生成时各阶段的英文回复（模型没有直接用用户语言回复时，引擎会再调用一次翻译）
+ENGLISH_REPLIES = {
+    'empathy': "That sounds really heavy, and I'm glad you told me. I'm here and I'm listening. "
+               "What's been weighing on you the most?",
+    'reflection': "Yeah, I hear you. Actually, a lot of people feel exactly this way after losing someone close - "
+                  "like the world suddenly got quieter and nobody quite gets it. You're not the only one, "
+                  "and it makes sense that it hurts this much. What has the loneliness been like for you day to day?",
+    'support': "I wish I could take some of that weight off you. One thing that helps many people is a short "
+               "'worry window' earlier in the evening: write down what's on your mind, and next to each worry, "
+               "one small step you could take tomorrow. At night, if the thoughts come back, you can remind yourself "
+               "they're already on paper. A steady wake-up time and getting up for a few minutes when you can't sleep "
+               "also help your body relearn that bed is for sleeping. I'll still be here to chat with you. "
+               "Which of these feels doable for you this week?",
+}
+
+_SUMMARY_TEXT = ("The user has been feeling low and lonely since their partner left last month; "
+                 "they have trouble sleeping because of overthinking at night. The companion has listened "
+                 "and suggested a worry window and a steady wake-up time.")
+
+_LANGUAGE_CODES = {name: code for code, name in LANGUAGE_NAMES.items()}
+_TARGET_LANGUAGE = re.compile(r"Translate the English text to (.+?) accurately")
+_LANGUAGE_REQUIREMENT = re.compile(r"\(language code: ([a-z]{2})\)")
+
+
+def _message(content: str, usage) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def _usage(prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+
+
+class FakeCompletions:
+    """模拟 AsyncOpenAI().chat.completions"""
+
+    def __init__(self, latency: LatencyModel, turns: Sequence[CannedTurn] = (),
+                 localized_replies: Optional[Dict[str, str]] = None, follow_language_requirement: bool = True):
+        """
+        Args:
+            latency: 延迟模型
+            turns: 登记的用户消息（原文和英文都可以用来查找）
+            localized_replies: 各语言的生成回复；系统提示词要求用某种语言回复且这里有该语言时直接用它回复
+            follow_language_requirement: False 时总是用英文回复（模拟模型不遵守语言要求，引擎需要回译）
+        """
+        self.latency = latency
+        self.localized_replies = localized_replies or {}
+        self.follow_language_requirement = follow_language_requirement
+        self.calls: List[CallRecord] = []
+        self._turns: Dict[str, CannedTurn] = {}
+        for turn in turns:
+            self.register(turn)
+        self._seen_prefixes = set()
+
+    def register(self, turn: CannedTurn):
+        self._turns[turn.message] = turn
+        self._turns.setdefault(turn.message_en, turn)
+
+    def _find_turn(self, text: str) -> Optional[CannedTurn]:
+        """文本中最后出现的已登记消息（阶段检测等提示词里当前消息在历史之后）"""
+        turn = self._turns.get(text.strip())
+        if turn is not None:
+            return turn
+        best, best_position = None, -1
+        for key, candidate in self._turns.items():
+            position = text.rfind(key)
+            if position > best_position:
+                best, best_position = candidate, position
+        return best
+
+    @staticmethod
+    def classify(messages: List[Dict], response_format) -> str:
+        """根据提示词判断调用类型"""
+        system = messages[0]['content'] if messages[0]['role'] == 'system' else ''
+        prompt = messages[-1]['content']
+        if response_format is not None:
+            return 'turn_analysis'
+        if system.startswith('You are a language detection expert'):
+            return 'language_detection'
+        if system.startswith('You are a professional translator'):
+            return 'translation'
+        if system.startswith('You are a conversation stage analyzer'):
+            return 'stage_detection'
+        if prompt.startswith('You maintain a running summary'):
+            return 'history_summary'
+        return 'generation'
+
+    def _cached_tokens(self, messages: List[Dict], prompt_tokens: int) -> int:
+        """按消息粒度模拟OpenAI的前缀缓存"""
+        digest = hashlib.sha256()
+        cached = tokens = 0
+        prefixes = []
+        for message in messages:
+            digest.update(f"\x00{message.get('role')}\x00{message.get('content')}".encode('utf-8'))
+            tokens += count_tokens(message.get('content') or '') + 4
+            key = digest.hexdigest()
+            prefixes.append(key)
+            if key in self._seen_prefixes:
+                cached = tokens
+        self._seen_prefixes.update(prefixes)
+        if prompt_tokens < 1024 or cached < 1024:
+            return 0
+        return min(prompt_tokens, cached) // 128 * 128
+
+    def _respond(self, kind: str, messages: List[Dict]) -> str:
+        system = messages[0]['content'] if messages[0]['role'] == 'system' else ''
+        prompt = messages[-1]['content']
+        if kind == 'turn_analysis':
+            message = prompt.rsplit('User message: ', 1)[-1]
+            turn = self._turns.get(message.strip())
+            if turn is None:
+                language, _ = detect_language_locally(message)
+                language = language if language != 'other' else 'en'
+                analysis = {'language': language, 'message_en': message, 'stage': 'empathy'}
+            else:
+                analysis = {'language': turn.language, 'message_en': turn.message_en, 'stage': turn.stage}
+            if 'message_en:' not in prompt:  # 预计是英文的消息不请求翻译
+                del analysis['message_en']
+            return json.dumps(analysis)
+        if kind == 'language_detection':
+            text = prompt.split('\n\n', 1)[-1]
+            turn = self._find_turn(text)
+            if turn is not None and text.strip() in (turn.message, turn.message[:500]):
+                return turn.language
+            language, _ = detect_language_locally(text)
+            return language if language != 'other' else 'en'
+        if kind == 'translation':
+            text = prompt.split('\n\n', 1)[-1]
+            target = _TARGET_LANGUAGE.search(system)
+            if target is None:  # 翻译成英文
+                turn = self._turns.get(text.strip())
+                return turn.message_en if turn is not None else text
+            language = _LANGUAGE_CODES.get(target.group(1), target.group(1))
+            return f"[{language}] {text}"
+        if kind == 'stage_detection':
+            turn = self._find_turn(prompt)
+            return turn.stage if turn is not None else 'empathy'
+        if kind == 'history_summary':
+            return _SUMMARY_TEXT
+        # 生成：系统提示词中的阶段决定英文回复；有语言要求且有该语言的回复时直接用用户语言回复
+        requirement = _LANGUAGE_REQUIREMENT.search(system)
+        if requirement and self.follow_language_requirement and requirement.group(1) in self.localized_replies:
+            return self.localized_replies[requirement.group(1)]
+        if 'Resource Guide' in system:
+            return ENGLISH_REPLIES['support']
+        if 'Understanding Guide' in system:
+            return ENGLISH_REPLIES['reflection']
+        return ENGLISH_REPLIES['empathy']
+
+    async def create(self, model=None, messages=None, response_format=None, stream=False, stream_options=None,
+                     max_tokens=None, **kwargs):
+        kind = self.classify(messages, response_format)
+        prompt_text = "\n".join(message.get('content') or '' for message in messages)
+        prompt_tokens = sum(count_tokens(message.get('content') or '') + 4 for message in messages)
+        cached_tokens = self._cached_tokens(messages, prompt_tokens)
+        content = self._respond(kind, messages)
+        completion_tokens = count_tokens(content)
+        rng = self.latency.rng(kind, prompt_text)
+        delay = self.latency.sample(kind, prompt_text, rng)
+
+        if not stream:
+            if kind == 'generation':
+                delay += sum(self.latency.sample('generation_token', '', rng) for _ in range(completion_tokens))
+            await asyncio.sleep(delay)
+            self.calls.append(CallRecord(kind, prompt_tokens, cached_tokens, completion_tokens, delay * 1000))
+            return _message(content, _usage(prompt_tokens, cached_tokens, completion_tokens))
+
+        await asyncio.sleep(delay)
+        record = CallRecord(kind, prompt_tokens, cached_tokens, completion_tokens, delay * 1000)
+        self.calls.append(record)
+        include_usage = bool(stream_options and stream_options.get('include_usage'))
+        return self._stream(content, rng, record, _usage(prompt_tokens, cached_tokens, completion_tokens)
+                            if include_usage else None)
+
+    async def _stream(self, content: str, rng: random.Random, record: CallRecord, usage):
+        """按词逐块输出（每块等待相应数量输出token的间隔），最后一块携带用量"""
+        for piece in re.findall(r'\S+\s*|\s+', content):
+            interval = sum(self.latency.sample('generation_token', '', rng) for _ in range(count_tokens(piece)))
+            record.latency_ms += interval * 1000
+            await asyncio.sleep(interval)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if usage is not None:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeAsyncOpenAI:
+    """可注入 RAGEngine(client=...) 的 AsyncOpenAI 替身"""
+
+    def __init__(self, latency: LatencyModel, turns: Sequence[CannedTurn] = (),
+                 localized_replies: Optional[Dict[str, str]] = None, follow_language_requirement: bool = True):
+        self.completions = FakeCompletions(latency, turns, localized_replies, follow_language_requirement)
+        self.chat = SimpleNamespace(completions=self.completions)
+
+    @property
+    def calls(self) -> List[CallRecord]:
+        return self.completions.calls
+
+
+class FakeEmbeddings(Embeddings):
+    """确定性的 OpenAIEmbeddings 替身：向量由文本哈希生成，同样的文本得到同样的向量"""
+
+    def __init__(self, latency: LatencyModel, dimensions: int = 64):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency.sample('embedding', "\n".join(texts)))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency.sample('embedding', "\n".join(texts)))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+# 模拟知识库：(来源路径, 文本)，来源路径决定 stage_bucket 和类别（与 init_kb.py 入库时一致）
+CORPUS: List[Tuple[str, str]] = [
+    ('data/knowledge_base/assessment/loneliness_and_friendship.txt',
+     "Loneliness after a breakup is one of the most common experiences people describe. Many feel that friends "
+     "don't understand, and that the world has become quieter. Feeling this way is not a sign of weakness."),
+    ('data/knowledge_base/assessment/loneliness_and_friendship.txt',
+     "Research on social connection shows that feeling lonely is linked to poorer sleep and more rumination, "
+     "and that even small moments of contact can ease it."),
+    ('data/knowledge_base/assessment/depression_symptoms.txt',
+     "Common signs of low mood include losing interest in things you used to enjoy, changes in sleep and "
+     "appetite, low energy, and feeling hopeless. Many people experience several of these at once."),
+    ('data/knowledge_base/assessment/anxiety_overview.txt',
+     "Anxiety often shows up at night as racing thoughts. It is a very common experience, and it usually "
+     "becomes easier to manage once people understand what is happening."),
+    ('data/knowledge_base/support/sleep_and_rumination.txt',
+     "A 'worry window' - 15 minutes earlier in the evening to write down worries and one next step for each - "
+     "helps reduce overthinking at bedtime."),
+    ('data/knowledge_base/support/sleep_and_rumination.txt',
+     "Keeping a steady wake-up time and getting out of bed for a few minutes when you cannot sleep helps the "
+     "body relearn that bed is for sleeping."),
+    ('data/knowledge_base/support/mens_depression_treatment.txt',
+     "Talking therapies such as CBT help people notice unhelpful thought patterns and try small behavioural "
+     "experiments. A family doctor can be a first point of contact."),
+    ('data/knowledge_base/support/how_to_get_motivated_to_exercise.txt',
+     "Movement releases dopamine and serotonin. Start with a 'walk and talk' or a ten-minute walk rather than a "
+     "big goal - small keystone habits make the next step easier."),
+    ('data/knowledge_base/support/reaching_out.txt',
+     "Reaching out to one trusted person, even with a short message, is often the hardest and most helpful step. "
+     "Empathetic curiosity - asking others how they are - can rebuild connection."),
+    ('data/knowledge_base/general/mental_health_basics.txt',
+     "Mental health is part of overall health. Everyone has difficult periods, and asking for help is a sign of "
+     "strength."),
+    ('data/knowledge_base/general/mental_health_basics.txt',
+     "Self-care basics - sleep, food, movement and connection - support mood, but they are not a substitute "
+     "for professional care when things feel overwhelming."),
+]
+
+
+def corpus_documents() -> List[Document]:
+    """模拟知识库的文档块（元数据与 init_kb.py 写入的一致）"""
+    from kb_metadata import chunk_metadata, relative_source
+    return [
+        Document(page_content=text, metadata={'source': source, **chunk_metadata(relative_source(source))},
+                 id=f"chunk-{i}")
+        for i, (source, text) in enumerate(CORPUS)
+    ]
+
+
+class FakeVectorStore:
+    """ChromaDB(LangChain) 向量库替身：提供同步的 similarity_search_with_score（支持 filter 元数据过滤）
+
+    距离由 (查询, 文档块) 的哈希确定，落在 0.35 ~ 0.95 之间（低于引擎的相似度阈值，检索总能返回内容）
+    """
+
+    def __init__(self, latency: LatencyModel, documents: Optional[List[Document]] = None):
+        self.latency = latency
+        self.documents = documents if documents is not None else corpus_documents()
+        self.searches = 0
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None
+                                     ) -> List[Tuple[Document, float]]:
+        self.searches += 1
+        time.sleep(self.latency.sample('vector_search', f"{query}\x00{k}\x00{filter}"))
+        results = []
+        for document in self.documents:
+            if filter and not matches_where(document.metadata, filter):
+                continue
+            digest = hashlib.sha256(f"{query}\x00{document.id}".encode('utf-8')).digest()
+            results.append((document, 0.35 + 0.6 * digest[0] / 255))
+        results.sort(key=lambda item: item[1])
+        return results[:k]
@@ -0,0 +1,219 @@
+"""录制真实对话记录的服务调用，离线回放并比较流水线的不同实现
+
+对话记录（trace）是 JSON Lines，每行一轮：{"session_id": "...", "message": "..."}，按文件顺序执行
+（同一会话的消息使用服务端会话保存历史）。
+
+    # 对接真实服务（需要 .env 中的 API Key）运行对话记录，录制所有 OpenAI / Embedding / 向量检索调用
+    python benchmarks/replay_traces.py record --trace traces.jsonl --cassette traces.jsonl.gz
+
+    # 离线回放（不需要网络）：按原始耗时的 0.1 倍等待，重复3次，保存结果
+    python benchmarks/replay_traces.py replay --cassette traces.jsonl.gz --time-scale 0.1 --output before.json
+
+    # 修改流水线后在同样的输入上回放并对比
+    python benchmarks/replay_traces.py replay --cassette traces.jsonl.gz --time-scale 0.1 --compare before.json
+
+    # 流水线改动产生了新的请求（回放时 misses 不为0）：能回放的回放，新请求调用真实服务并补录
+    python benchmarks/replay_traces.py update --cassette traces.jsonl.gz
+
+回放报告总墙钟时间、每轮耗时 p50/p95、按类型统计的LLM调用次数和token（取自录制的用量），
+以及 cassette 的命中/未命中次数。有未命中的请求（流水线发出了录制中没有的调用）时退出码为1。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from run_benchmarks import ROOT, git_revision, percentile, run_turn  # noqa: F401 (ROOT 加入 sys.path)
+
+from config import Settings  # noqa: E402
+from rag_engine import RAGEngine  # noqa: E402
+from cassette import Cassette, instrument, replay_engine, retrieval_backend  # noqa: E402
+from fakes import CALL_KINDS, FakeCompletions  # noqa: E402
+
+# 文件头中记录的配置项
+SETTINGS_SNAPSHOT = (
+    'FINETUNED_MODEL', 'EMBEDDING_MODEL', 'RETRIEVAL_BACKEND', 'RETRIEVAL_MODE', 'USE_TURN_ANALYSIS',
+    'RISK_PRESCREEN_ENABLED', 'FAST_PATH_ENABLED', 'RESPONSE_CACHE_ENABLED', 'HISTORY_TOKEN_BUDGET',
+)
+
+
+def load_trace(path: str) -> List[Dict]:
+    turns = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                turns.append({'session_id': str(item['session_id']), 'message': item['message']})
+    return turns
+
+
+async def run_turns(engine: RAGEngine, turns: List[Dict], stream: bool, cassette: Optional[Cassette] = None,
+                    verbose: bool = False) -> Dict:
+    """依次执行各轮对话，返回每轮耗时和出错的轮次"""
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    turn_ms, errors = [], []
+    sessions: Dict[str, str] = {}  # 对话记录中的会话ID -> 服务端生成的会话ID
+    with quiet:
+        started = time.perf_counter()
+        for index, turn in enumerate(turns):
+            if cassette is not None:
+                cassette.record_turn(turn['session_id'], turn['message'])
+            turn_started = time.perf_counter()
+            try:
+                outcome = await run_turn(engine, turn['message'], sessions.get(turn['session_id']), stream)
+                sessions[turn['session_id']] = outcome['session_id']
+            except Exception as e:
+                errors.append({'turn': index, 'error': f"{e.__class__.__name__}: {e}"})
+            turn_ms.append((time.perf_counter() - turn_started) * 1000)
+        wall_ms = (time.perf_counter() - started) * 1000
+    return {'wall_ms': wall_ms, 'turn_ms': turn_ms, 'errors': errors}
+
+
+def llm_summary(calls: List[Dict]) -> Dict:
+    """按调用类型统计LLM调用次数，汇总录制的token用量"""
+    kinds = Counter(FakeCompletions.classify(call['messages'], call['response_format']) for call in calls)
+    usages = [call['usage'] for call in calls if call['usage']]
+    return {
+        'llm_calls': len(calls),
+        'llm_calls_by_kind': {kind: kinds.get(kind, 0) for kind in CALL_KINDS},
+        'tokens': {
+            'input': sum(usage[0] for usage in usages),
+            'cached_input': sum(usage[2] for usage in usages),
+            'output': sum(usage[1] for usage in usages),
+        },
+    }
+
+
+def metadata(engine: RAGEngine, stream: bool) -> Dict:
+    return {
+        **git_revision(),
+        'stream': stream,
+        'retrieval_backend': retrieval_backend(engine),
+        'settings': {name: getattr(Settings, name, None) for name in SETTINGS_SNAPSHOT},
+    }
+
+
+async def record(args):
+    turns = load_trace(args.trace)
+    with Cassette(args.cassette, mode='record') as cassette:
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            engine = instrument(RAGEngine(), cassette)
+        cassette.header['metadata'].update(metadata(engine, args.stream))
+        result = await run_turns(engine, turns, args.stream, cassette, args.verbose)
+    print(f"✅ Recorded {len(turns)} turns, {len(cassette.entries)} calls in {result['wall_ms']:.0f} ms "
+          f"-> {args.cassette}")
+    for error in result['errors']:
+        print(f"❌ turn {error['turn']}: {error['error']}")
+
+
+async def update(args):
+    """补录：回放已录制的调用，新的请求调用真实服务并追加"""
+    with Cassette(args.cassette, mode='new') as cassette:
+        stream = cassette.header['metadata'].get('stream', False)
+        turns = [{'session_id': turn['session_id'], 'message': turn['message']} for turn in cassette.turns]
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            engine = instrument(RAGEngine(), cassette)
+        # 重新执行对话时不重复记录轮次
+        result = await run_turns(engine, turns, stream, verbose=args.verbose)
+    stats = cassette.stats()
+    print(f"✅ Replayed {sum(stats['hits'].values())} calls, recorded {sum(stats['recorded'].values())} new calls "
+          f"in {result['wall_ms']:.0f} ms -> {args.cassette}")
+
+
+async def replay(args):
+    runs = []
+    for _ in range(args.repeat):
+        cassette = Cassette(args.cassette, mode='replay', time_scale=args.time_scale)
+        stream = cassette.header['metadata'].get('stream', False)
+        turns = [{'session_id': turn['session_id'], 'message': turn['message']} for turn in cassette.turns]
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            engine = replay_engine(cassette)
+        result = await run_turns(engine, turns, stream, verbose=args.verbose)
+        runs.append((result, cassette.stats(), llm_summary(engine.client.calls)))
+
+    first, stats, llm = runs[0]
+    wall = [result['wall_ms'] for result, _, _ in runs]
+    turn_ms = [ms for result, _, _ in runs for ms in result['turn_ms']]
+    report = {
+        'version': 1,
+        **git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cassette': args.cassette,
+        'recorded': {'created_at': cassette.header.get('created_at'), **cassette.header['metadata']},
+        'time_scale': args.time_scale,
+        'repeat': args.repeat,
+        'turns': len(first['turn_ms']),
+        'wall_ms': {'median': statistics.median(wall), 'min': min(wall), 'max': max(wall)},
+        'turn_ms': {'p50': percentile(turn_ms, 0.5), 'p95': percentile(turn_ms, 0.95)} if turn_ms else None,
+        **llm,
+        'cassette_stats': stats,
+        'errors': first['errors'],
+    }
+
+    misses = sum(stats['misses'].values())
+    print(f"turns: {report['turns']}, wall: {report['wall_ms']['median']:.1f} ms (median of {args.repeat}), "
+          f"turn p50/p95: {report['turn_ms']['p50']:.1f}/{report['turn_ms']['p95']:.1f} ms" if turn_ms else
+          f"turns: 0")
+    print(f"LLM calls: {llm['llm_calls']} {llm['llm_calls_by_kind']}")
+    print(f"tokens: {llm['tokens']['input']} input ({llm['tokens']['cached_input']} cached), "
+          f"{llm['tokens']['output']} output")
+    print(f"cassette: {sum(stats['hits'].values())} hits, {sum(stats['reused'].values())} reused, {misses} misses")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('time_scale') != args.time_scale:
+            print("[WARNING] Baseline was replayed with a different time scale")
+        old_wall = baseline['wall_ms']['median']
+        print(f"vs {str(baseline.get('commit'))[:12]}: wall {report['wall_ms']['median'] - old_wall:+.1f} ms "
+              f"({(report['wall_ms']['median'] / old_wall - 1) * 100 if old_wall else 0.0:+.1f}%), "
+              f"LLM calls {llm['llm_calls'] - baseline['llm_calls']:+d}, "
+              f"input tokens {llm['tokens']['input'] - baseline['tokens']['input']:+d}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Results written to {args.output}")
+    for error in report['errors']:
+        print(f"❌ turn {error['turn']}: {error['error']}")
+    if misses:
+        print("❌ The pipeline made calls that are not in the cassette (run `update` to record them)")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='对接真实服务运行对话记录并录制')
+    record_parser.add_argument('--trace', required=True, help='对话记录（JSON Lines）')
+    record_parser.add_argument('--cassette', required=True, help='输出的 cassette 文件（.jsonl.gz）')
+    record_parser.add_argument('--stream', action='store_true', help='使用 chat_stream（回放时沿用）')
+
+    update_parser = subparsers.add_parser('update', help='回放已录制的调用，补录新的请求')
+    update_parser.add_argument('--cassette', required=True)
+
+    replay_parser = subparsers.add_parser('replay', help='离线回放')
+    replay_parser.add_argument('--cassette', required=True)
+    replay_parser.add_argument('--time-scale', type=float, default=1.0, help='录制耗时的缩放系数（0 不等待）')
+    replay_parser.add_argument('--repeat', type=int, default=3, help='重复次数（墙钟时间取中位数）')
+    replay_parser.add_argument('--output', help='把结果写入JSON文件')
+    replay_parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+
+    for subparser in (record_parser, update_parser, replay_parser):
+        subparser.add_argument('--verbose', action='store_true', help='显示引擎的调试输出')
+    args = parser.parse_args()
+
+    # 会话只保存在内存中，录制和回放都从空会话开始
+    Settings.SESSION_BACKEND = 'memory'
+    asyncio.run({'record': record, 'update': update, 'replay': replay}[args.command](args))
+
+
+if __name__ == '__main__':
+    main()
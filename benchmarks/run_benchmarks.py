@@ -0,0 +1,262 @@
+"""离线基准测试：用模拟的 OpenAI / Embeddings / 向量库跑脚本化的多轮对话
+
+不需要网络、API Key 和知识库文件，笔记本上即可运行。模拟客户端的延迟和输出都是确定的
+（由种子、调用类型和输入决定），同样的参数在不同提交上的结果可以直接比较：
+LLM调用次数和token数完全可复现，耗时只受本机CPU开销影响。
+
+每个场景报告：墙钟时间（多次重复取中位数）、每轮耗时 p50/p95、按类型统计的LLM调用次数、
+输入/命中缓存/输出token、Embedding和向量检索次数，以及阶段/风险级别与预期不符的轮次。
+
+用法（在项目根目录）：
+    python benchmarks/run_benchmarks.py                              # 全部场景，realistic 延迟缩放到 0.1
+    python benchmarks/run_benchmarks.py --scenarios stages_zh crisis --repeat 5
+    python benchmarks/run_benchmarks.py --profile zero               # 只测本地CPU开销和调用次数
+    python benchmarks/run_benchmarks.py --output bench.json          # 保存机器可读结果
+    python benchmarks/run_benchmarks.py --compare bench.json         # 与之前保存的结果对比
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Settings  # noqa: E402
+import history_manager  # noqa: E402
+from rag_engine import RAGEngine  # noqa: E402
+from fakes import CALL_KINDS, PROFILES, FakeAsyncOpenAI, FakeEmbeddings, FakeVectorStore, LatencyModel  # noqa: E402
+from scenarios import LOCALIZED_REPLIES, SCENARIOS, Scenario, select  # noqa: E402
+
+RESULT_VERSION = 1
+
+# 结果中记录的配置项（影响调用次数和耗时）
+SETTINGS_SNAPSHOT = (
+    'USE_TURN_ANALYSIS', 'RISK_PRESCREEN_ENABLED', 'FAST_PATH_ENABLED', 'RESPONSE_CACHE_ENABLED',
+    'RETRIEVAL_MODE', 'HISTORY_TOKEN_BUDGET', 'HISTORY_SUMMARY_EVERY_N_TURNS', 'HISTORY_SUMMARY_MAX_TOKENS',
+)
+
+
+def git_revision() -> Dict:
+    """当前提交和工作区是否有未提交的修改"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_turn(engine: RAGEngine, message: str, session_id: str, stream: bool) -> Dict:
+    """执行一轮对话，返回阶段、风险级别、首token耗时和服务端返回的会话ID"""
+    if not stream:
+        result = await engine.chat(message, session_id=session_id)
+        return {'stage': result.get('stage'), 'risk_level': result.get('risk_level'), 'first_token_ms': None,
+                'session_id': result.get('session_id')}
+    started = time.perf_counter()
+    meta, first_token_ms = {}, None
+    async for event, data in engine.chat_stream(message, session_id=session_id):
+        if event == 'meta':
+            meta = data
+        elif event == 'token' and first_token_ms is None:
+            first_token_ms = (time.perf_counter() - started) * 1000
+    return {'stage': meta.get('stage'), 'risk_level': meta.get('risk_level'), 'first_token_ms': first_token_ms,
+            'session_id': meta.get('session_id')}
+
+
+async def run_scenario_once(scenario: Scenario, args, repeat: int) -> Dict:
+    """在新建的引擎上完整跑一遍场景"""
+    latency = LatencyModel(PROFILES[args.profile], seed=args.seed, time_scale=args.time_scale)
+    client = FakeAsyncOpenAI(latency, [turn.canned() for turn in scenario.turns], LOCALIZED_REPLIES,
+                             follow_language_requirement=not args.english_replies)
+    embeddings = FakeEmbeddings(latency)
+    vectorstore = FakeVectorStore(latency)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    turns, mismatches = [], []
+    sessions: Dict[str, str] = {}  # 场景内的会话名 -> 服务端生成的会话ID
+    with quiet:
+        engine = RAGEngine(client=client, embeddings=embeddings, vectorstore=vectorstore)
+        started = time.perf_counter()
+        for index, turn in enumerate(scenario.turns):
+            session_name = f"bench-{scenario.name}-{repeat}" + (f"-{index}" if scenario.new_session_per_turn else "")
+            calls_before = len(client.calls)
+            turn_started = time.perf_counter()
+            outcome = await run_turn(engine, turn.message, sessions.get(session_name), args.stream)
+            sessions[session_name] = outcome.pop('session_id')
+            outcome['ms'] = (time.perf_counter() - turn_started) * 1000
+            outcome['llm_calls'] = len(client.calls) - calls_before
+            turns.append(outcome)
+            for field, expected in (('stage', turn.expect_stage), ('risk_level', turn.expect_risk)):
+                if expected is not None and outcome[field] != expected:
+                    mismatches.append({'turn': index, 'field': field, 'expected': expected, 'actual': outcome[field]})
+        wall_ms = (time.perf_counter() - started) * 1000
+
+    calls = client.calls
+    return {
+        'wall_ms': wall_ms,
+        'turns': turns,
+        'mismatches': mismatches,
+        'llm_calls': len(calls),
+        'llm_calls_by_kind': dict(Counter(call.kind for call in calls)),
+        'tokens': {
+            'input': sum(call.prompt_tokens for call in calls),
+            'cached_input': sum(call.cached_tokens for call in calls),
+            'output': sum(call.completion_tokens for call in calls),
+        },
+        'embedding_calls': embeddings.calls,
+        'vector_searches': vectorstore.searches,
+    }
+
+
+async def run_scenario(scenario: Scenario, args) -> Dict:
+    """重复运行场景，耗时取中位数（调用次数和token数每次都相同，取第一次）"""
+    runs = [await run_scenario_once(scenario, args, repeat) for repeat in range(args.repeat)]
+    first = runs[0]
+    turn_ms = [turn['ms'] for run in runs for turn in run['turns']]
+    first_token_ms = [turn['first_token_ms'] for run in runs for turn in run['turns']
+                      if turn['first_token_ms'] is not None]
+    wall = [run['wall_ms'] for run in runs]
+    return {
+        'name': scenario.name,
+        'language': scenario.language,
+        'tags': list(scenario.tags),
+        'turns': len(scenario.turns),
+        'wall_ms': {'median': statistics.median(wall), 'min': min(wall), 'max': max(wall)},
+        'turn_ms': {'p50': percentile(turn_ms, 0.5), 'p95': percentile(turn_ms, 0.95)},
+        'first_token_ms': {'p50': percentile(first_token_ms, 0.5)} if first_token_ms else None,
+        'llm_calls': first['llm_calls'],
+        'llm_calls_per_turn': [turn['llm_calls'] for turn in first['turns']],
+        'llm_calls_by_kind': {kind: first['llm_calls_by_kind'].get(kind, 0) for kind in CALL_KINDS},
+        'tokens': first['tokens'],
+        'embedding_calls': first['embedding_calls'],
+        'vector_searches': first['vector_searches'],
+        'stages': [turn['stage'] for turn in first['turns']],
+        'risk_levels': [turn['risk_level'] for turn in first['turns']],
+        'mismatches': first['mismatches'],
+    }
+
+
+def totals(results: List[Dict]) -> Dict:
+    return {
+        'wall_ms': sum(result['wall_ms']['median'] for result in results),
+        'llm_calls': sum(result['llm_calls'] for result in results),
+        'tokens': {key: sum(result['tokens'][key] for result in results) for key in ('input', 'cached_input', 'output')},
+        'mismatches': sum(len(result['mismatches']) for result in results),
+    }
+
+
+def print_table(results: List[Dict], baseline: Optional[Dict] = None):
+    """打印结果表；有基线时附上墙钟时间、LLM调用次数和输入token的变化"""
+    previous = {result['name']: result for result in (baseline or {}).get('scenarios', [])}
+    header = f"{'scenario':<20}{'turns':>6}{'wall ms':>10}{'p50 ms':>9}{'calls':>7}{'in tok':>8}{'cached':>8}{'out tok':>8}{'bad':>5}"
+    if baseline:
+        header += f"{'Δ wall':>9}{'Δ calls':>9}{'Δ in tok':>10}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        line = (f"{result['name']:<20}{result['turns']:>6}{result['wall_ms']['median']:>10.1f}"
+                f"{result['turn_ms']['p50']:>9.1f}{result['llm_calls']:>7}{result['tokens']['input']:>8}"
+                f"{result['tokens']['cached_input']:>8}{result['tokens']['output']:>8}{len(result['mismatches']):>5}")
+        old = previous.get(result['name'])
+        if old:
+            wall_change = (result['wall_ms']['median'] / old['wall_ms']['median'] - 1) * 100 if old['wall_ms']['median'] else 0.0
+            line += (f"{wall_change:>+8.1f}%{result['llm_calls'] - old['llm_calls']:>+9}"
+                     f"{result['tokens']['input'] - old['tokens']['input']:>+10}")
+        print(line)
+    for result in results:
+        for mismatch in result['mismatches']:
+            print(f"❌ {result['name']} turn {mismatch['turn']}: {mismatch['field']} = {mismatch['actual']!r}, "
+                  f"expected {mismatch['expected']!r}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='*', help='场景名称前缀或标签（stages/crisis/fast_path/history），默认全部')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的重复次数')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='realistic', help='模拟延迟配置')
+    parser.add_argument('--time-scale', type=float, default=0.1, help='模拟延迟的缩放系数（1.0 为真实量级）')
+    parser.add_argument('--seed', type=int, default=0, help='延迟取样的种子')
+    parser.add_argument('--stream', action='store_true', help='使用 chat_stream 并报告首token耗时')
+    parser.add_argument('--english-replies', action='store_true',
+                        help='模拟模型总用英文回复（非英文对话每轮多一次回译）')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+    parser.add_argument('--list', action='store_true', help='列出场景后退出')
+    parser.add_argument('--verbose', action='store_true', help='显示引擎的调试输出')
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<20}{scenario.language:<8}{len(scenario.turns):>3} turns  {', '.join(scenario.tags)}")
+        return
+
+    # 模拟向量库由构造函数注入；会话只保存在内存中，不写磁盘
+    Settings.SESSION_BACKEND = 'memory'
+    Settings.EMBEDDING_CACHE_ENABLED = False
+    scenarios = select(args.scenarios)
+    if not scenarios:
+        sys.exit(f"No scenario matches {args.scenarios}")
+
+    results = []
+    for scenario in scenarios:
+        results.append(await run_scenario(scenario, args))
+
+    report = {
+        'version': RESULT_VERSION,
+        **git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'tokenizer': 'tiktoken' if history_manager._get_encoding() is not None else 'estimate',
+        'profile': args.profile,
+        'time_scale': args.time_scale,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'stream': args.stream,
+        'english_replies': args.english_replies,
+        'settings': {name: getattr(Settings, name) for name in SETTINGS_SNAPSHOT},
+        'scenarios': results,
+        'totals': totals(results),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if (baseline.get('profile'), baseline.get('time_scale'), baseline.get('stream')) != \
+                (args.profile, args.time_scale, args.stream):
+            print("[WARNING] Baseline was recorded with a different profile/time scale/stream mode")
+
+    print_table(results, baseline)
+    total = report['totals']
+    print(f"\ntotal: {total['wall_ms']:.1f} ms, {total['llm_calls']} LLM calls, "
+          f"{total['tokens']['input']} input tokens ({total['tokens']['cached_input']} cached), "
+          f"{total['tokens']['output']} output tokens")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Results written to {args.output}")
+    if total['mismatches']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""离线基准测试的对话脚本
+
+每个场景是同一会话中的若干轮用户消息。每轮登记了模拟模型应给出的分析结果（语言、英文翻译、阶段），
+以及可选的预期结果（阶段、风险级别），run_benchmarks.py 会检查引擎的实际输出是否符合预期。
+
+- stages_<语言>：倾听 → 理解 → 支持 三轮，覆盖 en 和 rag_engine.LANGUAGE_NAMES 中的全部语言
+- crisis_<语言>：高风险消息（危机路径）
+- greetings：不同用户的首轮问候和致谢（零LLM调用的快速路径）
+- long_conversation：十几轮的长对话（历史超出token预算，触发滚动摘要）
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fakes import CannedTurn
+
+
+@dataclass(frozen=True)
+class Turn:
+    message: str
+    language: str
+    message_en: str
+    stage: str
+    expect_stage: Optional[str] = None
+    expect_risk: Optional[str] = None
+
+    def canned(self) -> CannedTurn:
+        return CannedTurn(self.message, self.language, self.message_en, self.stage)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    language: str
+    turns: Tuple[Turn, ...]
+    tags: Tuple[str, ...] = field(default_factory=tuple)
+    new_session_per_turn: bool = False  # 每轮使用新会话（不同用户的首轮消息）
+
+
+# 三个阶段的英文原文
+_STAGES_EN = (
+    "I've been feeling really down lately.",
+    "My partner left me last month and I feel so lonely, like nobody understands me.",
+    "What can I do to stop overthinking at night so I can sleep?",
+)
+
+# 各语言的三轮消息（与 _STAGES_EN 一一对应）
+STAGE_MESSAGES: Dict[str, Tuple[str, str, str]] = {
+    'en': _STAGES_EN,
+    'zh': ("我最近心情一直很低落。",
+           "上个月我的伴侣离开了我，我觉得好孤独，好像没有人理解我。",
+           "我该怎么做才能晚上不再胡思乱想，能睡着觉？"),
+    'es': ("Últimamente me he sentido muy decaído.",
+           "Mi pareja me dejó el mes pasado y me siento muy solo, como si nadie me entendiera.",
+           "¿Qué puedo hacer para dejar de pensar tanto por la noche y poder dormir?"),
+    'fr': ("Je me sens vraiment déprimé ces derniers temps.",
+           "Mon partenaire m'a quitté le mois dernier et je me sens tellement seul, comme si personne ne me comprenait.",
+           "Que puis-je faire pour arrêter de trop réfléchir la nuit et réussir à dormir ?"),
+    'de': ("Ich fühle mich in letzter Zeit wirklich niedergeschlagen.",
+           "Mein Partner hat mich letzten Monat verlassen und ich fühle mich so einsam, als würde mich niemand verstehen.",
+           "Was kann ich tun, um nachts nicht mehr so viel zu grübeln, damit ich schlafen kann?"),
+    'it': ("Ultimamente mi sento davvero giù.",
+           "Il mio partner mi ha lasciato il mese scorso e mi sento così solo, come se nessuno mi capisse.",
+           "Cosa posso fare per smettere di rimuginare la notte e riuscire a dormire?"),
+    'pt': ("Ultimamente tenho me sentido muito para baixo.",
+           "Meu parceiro me deixou no mês passado e me sinto tão sozinho, como se ninguém me entendesse.",
+           "O que posso fazer para parar de pensar demais à noite e conseguir dormir?"),
+    'ru': ("В последнее время мне очень плохо на душе.",
+           "Мой партнёр ушёл от меня в прошлом месяце, и мне так одиноко, будто меня никто не понимает.",
+           "Что мне сделать, чтобы перестать накручивать себя по ночам и наконец уснуть?"),
+    'ja': ("最近ずっと気分が落ち込んでいます。",
+           "先月パートナーに去られて、とても孤独で、誰も私のことを分かってくれない気がします。",
+           "夜に考えすぎるのをやめて眠れるようになるには、どうしたらいいですか？"),
+    'ko': ("요즘 계속 기분이 너무 우울해요.",
+           "지난달에 애인이 저를 떠났고, 너무 외로워요. 아무도 저를 이해하지 못하는 것 같아요.",
+           "밤에 생각이 너무 많아서 잠을 못 자는데, 어떻게 하면 좋을까요?"),
+    'ar': ("أشعر بالإحباط الشديد في الآونة الأخيرة.",
+           "تركني شريكي الشهر الماضي وأشعر بوحدة شديدة، وكأن لا أحد يفهمني.",
+           "ماذا يمكنني أن أفعل لأتوقف عن التفكير الزائد في الليل وأتمكن من النوم؟"),
+    'hi': ("मैं आजकल बहुत उदास महसूस कर रहा हूँ।",
+           "मेरे साथी ने पिछले महीने मुझे छोड़ दिया और मैं बहुत अकेला महसूस करता हूँ, जैसे कोई मुझे समझता ही नहीं।",
+           "रात को ज़्यादा सोचना बंद करके सो पाने के लिए मैं क्या कर सकता हूँ?"),
+}
+
+# 模拟模型遵守语言要求时，用用户语言给出的回复
+LOCALIZED_REPLIES: Dict[str, str] = {
+    'zh': "听起来真的很沉重，谢谢你愿意告诉我。最让你难受的是什么呢？",
+    'es': "Eso suena muy pesado, y me alegra que me lo cuentes. ¿Qué es lo que más te pesa?",
+    'fr': "Ça a l'air vraiment lourd, et je suis content que tu m'en parles. Qu'est-ce qui te pèse le plus ?",
+    'de': "Das klingt wirklich schwer, und ich bin froh, dass du es mir erzählst. Was belastet dich am meisten?",
+    'it': "Sembra davvero pesante, e sono contento che tu me lo dica. Cosa ti pesa di più?",
+    'pt': "Isso parece muito pesado, e fico feliz que você me contou. O que mais tem pesado para você?",
+    'ru': "Звучит очень тяжело, и я рад, что ты мне рассказал. Что тебя тревожит больше всего?",
+    'ja': "それは本当につらいですね。話してくれてありがとう。いちばん重く感じているのは何ですか？",
+    'ko': "정말 힘들게 들려요. 이야기해 줘서 고마워요. 가장 마음을 무겁게 하는 건 뭐예요?",
+    'ar': "يبدو هذا ثقيلاً حقاً، ويسعدني أنك أخبرتني. ما الذي يثقل عليك أكثر؟",
+    'hi': "यह सच में बहुत भारी लगता है, और मुझे खुशी है कि आपने मुझे बताया। आपको सबसे ज़्यादा क्या परेशान कर रहा है?",
+}
+
+# (语言, 高风险消息, 英文翻译)
+CRISIS_MESSAGES: Tuple[Tuple[str, str, str], ...] = (
+    ('en', "I want to kill myself tonight", "I want to kill myself tonight"),
+    ('zh', "我不想活了，我想结束自己的生命", "I do not want to live anymore, I want to end my own life"),
+    ('es', "Ya no quiero vivir, quiero suicidarme", "I do not want to live anymore, I want to kill myself"),
+)
+
+# 长对话：反复倾诉，累积的历史超出token预算
+_LONG_MESSAGES = (
+    "Work has been overwhelming and I come home completely drained every single day.",
+    "My manager keeps adding projects and I can't say no because I'm scared of looking weak.",
+    "On weekends I just lie in bed scrolling, and then I feel guilty that I wasted the time.",
+    "My friends invite me out but I keep cancelling, and now they've mostly stopped asking.",
+    "I used to love playing guitar, but I haven't touched it in months. It just feels pointless.",
+    "My mom calls every Sunday and I pretend everything is fine because I don't want her to worry.",
+    "I keep replaying conversations from work at night and thinking about what I should have said.",
+    "Sometimes I wonder if I'm just not cut out for this job, or for being an adult in general.",
+    "I tried going for a run last week and it actually helped a bit, but I couldn't keep it up.",
+    "I think what scares me most is that this is just how life is going to feel from now on.",
+    "Last night I stayed up until three again, rereading old messages from when things felt easier.",
+    "My sister noticed I seemed off and asked if I was okay, and I just changed the subject.",
+    "I keep telling myself I'll rest after this deadline, but there is always another deadline.",
+    "Even small things like answering emails feel like climbing a hill right now.",
+    "What could I realistically change this week to feel a little less stuck?",
+    "How do I talk to my manager about my workload without it sounding like I can't cope?",
+)
+
+
+def _stages(language: str) -> Scenario:
+    english = _STAGES_EN
+    turns = tuple(
+        Turn(message, language, english[i], stage, expect_stage=stage, expect_risk='none')
+        for i, (message, stage) in enumerate(zip(STAGE_MESSAGES[language], ('empathy', 'reflection', 'support')))
+    )
+    return Scenario(f"stages_{language}", language, turns, ('stages',))
+
+
+def _crisis(language: str, message: str, message_en: str) -> Scenario:
+    return Scenario(f"crisis_{language}", language,
+                    (Turn(message, language, message_en, 'support', expect_risk='high'),), ('crisis',))
+
+
+def _long_conversation() -> Scenario:
+    turns = tuple(
+        Turn(message, 'en', message, 'reflection' if i < len(_LONG_MESSAGES) - 2 else 'support', expect_risk='none')
+        for i, message in enumerate(_LONG_MESSAGES)
+    )
+    return Scenario('long_conversation', 'en', turns, ('history',))
+
+
+def _greetings() -> Scenario:
+    turns = (
+        Turn("hi", 'en', "hi", 'empathy', expect_stage='empathy', expect_risk='none'),
+        Turn("thank you", 'en', "thank you", 'empathy', expect_stage='empathy', expect_risk='none'),
+        Turn("你好", 'zh', "hello", 'empathy', expect_stage='empathy', expect_risk='none'),
+        Turn("hola", 'es', "hello", 'empathy', expect_stage='empathy', expect_risk='none'),
+    )
+    return Scenario('greetings', 'mixed', turns, ('fast_path',), new_session_per_turn=True)
+
+
+SCENARIOS: List[Scenario] = (
+    [_stages(language) for language in STAGE_MESSAGES]
+    + [_crisis(*item) for item in CRISIS_MESSAGES]
+    + [_greetings(), _long_conversation()]
+)
+
+
+def select(patterns: Optional[List[str]]) -> List[Scenario]:
+    """按名称或标签筛选场景（支持前缀，如 stages_ 或 crisis）"""
+    if not patterns:
+        return list(SCENARIOS)
+    return [
+        scenario for scenario in SCENARIOS
+        if any(scenario.name.startswith(pattern) or pattern in scenario.tags for pattern in patterns)
+    ]
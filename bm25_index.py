@@ -0,0 +1,239 @@
+"""本地BM25倒排索引（混合检索的词法部分）
+
+纯向量检索对"症状""治疗"这类具体词语不够敏感，_build_semantic_search_query 原来靠在查询后面拼接
+手选的关键词把结果引向正确的文档。混合检索（RETRIEVAL_MODE=hybrid）改为同时做BM25词法检索和向量检索，
+再用倒数排名融合（reciprocal rank fusion，见 reciprocal_rank_fusion）合并两边的排名。
+
+- 索引由 init_kb.py 在同步知识库后从集合中的同一批文档块构建，保存到 Settings.BM25_INDEX_PATH
+- 倒排表按词项连续存储（CSR），每个posting预先算好BM25权重，查询只是对命中词项的权重求和，
+  几千个文档块的检索在微秒到亚毫秒级
+- 索引自带文档块文本和元数据，可以与任何向量检索后端配合；支持与向量检索相同的 where 过滤
+
+也可以直接从已有集合构建：
+    python bm25_index.py
+"""
+import json
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from vector_index import matches_where
+
+INDEX_VERSION = 1
+
+_POSTINGS_FILE = 'postings.npz'
+_CHUNKS_FILE = 'chunks.json'
+_META_FILE = 'index.json'
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[一-鿿]")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+our ours ourselves out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yourself yourselves i'm i've it's don't can't
+""".split())
+
+
+def _stem(token: str) -> str:
+    """很轻的英文词形归一（复数、-ing、-ed），让 worries/worry、feeling/feel 命中同一词项"""
+    if len(token) <= 3 or not token.isascii():
+        return token
+    if token.endswith("'s"):
+        token = token[:-2]
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('ing') and len(token) > 5:
+        return token[:-3]
+    if token.endswith('ed') and len(token) > 4:
+        return token[:-2]
+    if token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """小写、去停用词、轻量词形归一；中文按单字切分（知识库为英文，中文只作兜底）"""
+    return [_stem(token) for token in _TOKEN_PATTERN.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank)，rank 从1开始；返回按融合分数降序的 (ID, 分数)
+
+    只使用排名，不需要把BM25分数和向量距离换算到同一尺度
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 倒排索引"""
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                 k1: float = 1.5, b: float = 0.75, _postings: Optional[Tuple] = None):
+        """
+        Args:
+            ids: 文档块ID（与向量库一致，融合时按ID合并两边的结果）
+            texts: 文档块文本
+            metadatas: 文档块元数据
+            k1, b: BM25参数
+        """
+        if not (len(ids) == len(texts) == len(metadatas)):
+            raise ValueError("ids, texts and metadatas must have the same length")
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+        if _postings is None:
+            _postings = self._build()
+        self.vocabulary, self._offsets, self._docs, self._weights = _postings
+        self._where_masks: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _build(self):
+        """统计词频并生成CSR倒排表：词项 -> 槽位，offsets[槽位:槽位+1] 切出该词项的文档和权重"""
+        term_frequencies: List[Dict[str, int]] = []
+        lengths = np.zeros(len(self.texts), dtype=np.float32)
+        document_frequency: Dict[str, int] = {}
+        for row, text in enumerate(self.texts):
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token in counts:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+            term_frequencies.append(counts)
+            lengths[row] = len(tokens)
+
+        vocabulary = {term: slot for slot, term in enumerate(sorted(document_frequency))}
+        postings: List[List[Tuple[int, float]]] = [[] for _ in vocabulary]
+        n = len(self.texts)
+        average_length = float(lengths.mean()) if n else 0.0
+        for row, counts in enumerate(term_frequencies):
+            norm = self.k1 * (1 - self.b + self.b * lengths[row] / average_length) if average_length else self.k1
+            for term, tf in counts.items():
+                idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                postings[vocabulary[term]].append((row, idf * tf * (self.k1 + 1) / (tf + norm)))
+
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(items) for items in postings])
+        docs = np.fromiter((row for items in postings for row, _ in items), dtype=np.int32, count=int(offsets[-1]))
+        weights = np.fromiter((weight for items in postings for _, weight in items), dtype=np.float32, count=int(offsets[-1]))
+        return vocabulary, offsets, docs, weights
+
+    def _where_mask(self, where: Dict) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True)
+        mask = self._where_masks.get(key)
+        if mask is None:
+            mask = np.array([matches_where(metadata, where) for metadata in self.metadatas], dtype=bool)
+            self._where_masks[key] = mask
+        return mask
+
+    def search(self, query: str, k: int, where: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """返回按BM25分数降序的 top-k (Document, 分数)，没有命中任何词项的文档块不返回
+
+        Args:
+            query: 查询文本
+            k: 返回的数量
+            where: 可选的元数据过滤条件（与向量检索相同的 where 语法）
+        """
+        slots = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not slots or len(self) == 0:
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        for slot in slots:
+            start, stop = self._offsets[slot], self._offsets[slot + 1]
+            scores[self._docs[start:stop]] += self._weights[start:stop]
+        if where:
+            scores[~self._where_mask(where)] = 0.0
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [
+            (Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]), id=self.ids[row]), float(scores[row]))
+            for row in hits.tolist()
+        ]
+
+    def save(self, path: str):
+        """保存到目录（先写临时文件再替换，元数据最后写入）"""
+        os.makedirs(path, exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        files = {
+            _POSTINGS_FILE: lambda f: np.savez(f, offsets=self._offsets, docs=self._docs, weights=self._weights),
+            _CHUNKS_FILE: lambda f: f.write(json.dumps(
+                {'ids': self.ids, 'texts': self.texts, 'metadatas': self.metadatas, 'terms': terms}, ensure_ascii=False
+            ).encode('utf-8')),
+            _META_FILE: lambda f: f.write(json.dumps(
+                {'version': INDEX_VERSION, 'count': len(self), 'terms': len(terms), 'k1': self.k1, 'b': self.b}
+            ).encode('utf-8')),
+        }
+        for name, write in files.items():
+            tmp_path = os.path.join(path, f"{name}.tmp")
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        meta_path = os.path.join(path, _META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(
+                f"BM25 index not found at {path}. Please run init_kb.py (or python bm25_index.py) to build it"
+            )
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"BM25 index version {meta.get('version')} != {INDEX_VERSION}, please rebuild it")
+        with open(os.path.join(path, _CHUNKS_FILE), encoding='utf-8') as f:
+            chunks = json.load(f)
+        with np.load(os.path.join(path, _POSTINGS_FILE)) as postings:
+            arrays = (postings['offsets'], postings['docs'], postings['weights'])
+        vocabulary = {term: slot for slot, term in enumerate(chunks['terms'])}
+        return cls(chunks['ids'], chunks['texts'], chunks['metadatas'], k1=meta['k1'], b=meta['b'],
+                   _postings=(vocabulary, *arrays))
+
+
+def build_from_collection(collection, page_size: int = 1000) -> BM25Index:
+    """从ChromaDB集合中的全部文档块构建BM25索引（只读取文本和元数据，不读取向量）"""
+    ids, texts, metadatas = [], [], []
+    while True:
+        page = collection.get(include=['documents', 'metadatas'], limit=page_size, offset=len(ids))
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        texts.extend(text or '' for text in page['documents'])
+        metadatas.extend(metadata or {} for metadata in page['metadatas'])
+        if len(page['ids']) < page_size:
+            break
+    return BM25Index(ids, texts, metadatas)
+
+
+if __name__ == "__main__":
+    import chromadb
+    from config import Settings
+
+    if Settings.USE_CHROMA_CLOUD:
+        client = chromadb.CloudClient(
+            api_key=Settings.CHROMA_API_KEY,
+            tenant=Settings.CHROMA_TENANT,
+            database=Settings.CHROMA_DATABASE
+        )
+    else:
+        client = chromadb.PersistentClient(path=Settings.VECTOR_DB_PATH)
+    index = build_from_collection(client.get_collection(name=Settings.COLLECTION_NAME))
+    index.save(Settings.BM25_INDEX_PATH)
+    print(f"✅ 已构建BM25索引：{len(index)} 个文档块，{len(index.vocabulary)} 个词项，保存到 {Settings.BM25_INDEX_PATH}")
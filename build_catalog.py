@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""预渲染多语言静态消息目录
+
+把危机响应（语言 × 省份 × 是否有明确计划）和"知识库中没有相关内容"提示离线翻译成所有支持的语言，
+写入 Settings.MESSAGE_CATALOG_PATH。每条译文都会校验原文中的电话号码、短信号码和网址是否完整保留，
+缺失时带着缺失清单重新翻译，多次仍失败则中止，不写出不完整的目录。
+
+修改危机模板、各省资源或静态消息后需要重新运行：
+    python build_catalog.py [--concurrency 8]
+"""
+import sys
+import io
+# Force UTF-8 encoding for Windows console
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from openai import AsyncOpenAI
+
+from config import Settings
+from message_catalog import (
+    CATALOG_LANGUAGES, CATALOG_VERSION, STATIC_MESSAGES_EN,
+    catalog_variants, crisis_key, missing_contacts, render_crisis_response, source_hash
+)
+from rag_engine import LANGUAGE_NAMES
+
+MAX_ATTEMPTS = 3
+
+
+class CatalogBuildError(Exception):
+    """译文多次校验失败"""
+
+
+async def translate(client: AsyncOpenAI, semaphore: asyncio.Semaphore, text: str, language: str) -> str:
+    """翻译一条静态文本，并校验联系方式完整保留"""
+    target_lang_name = LANGUAGE_NAMES[language]
+    instruction = (f"Translate the following English text to {target_lang_name}. Keep ALL phone numbers, "
+                   f"text numbers and website addresses exactly as written, and keep the Markdown formatting.")
+    missing = []
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        prompt = f"{instruction}\n\n{text}"
+        if missing:
+            prompt = (f"{instruction} Your previous translation omitted: {', '.join(missing)}. "
+                      f"Include every one of them.\n\n{text}")
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=Settings.FINETUNED_MODEL,
+                messages=[
+                    {"role": "system", "content": f"You are a professional translator. Translate the English text to {target_lang_name} accurately while preserving the original meaning, tone, emotional nuance, and natural conversation style. IMPORTANT: You MUST keep ALL phone numbers, emergency contacts, and resource information complete. Do NOT omit any emergency contact details."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=2000
+            )
+        translated = response.choices[0].message.content.strip()
+        missing = missing_contacts(text, translated)
+        if not missing:
+            return translated
+        print(f"  [WARNING] {language} 译文缺少 {missing}（第{attempt}次）")
+    raise CatalogBuildError(f"{language}: translation keeps dropping contacts {missing}")
+
+
+async def build_catalog(concurrency: int) -> dict:
+    client = AsyncOpenAI(api_key=Settings.OPENAI_API_KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    jobs = {}
+    for language in CATALOG_LANGUAGES:
+        for province, has_explicit_plan in catalog_variants():
+            source = render_crisis_response(has_explicit_plan, language, province)
+            jobs[('crisis', crisis_key(language, province, has_explicit_plan))] = (source, language)
+        for name, text in STATIC_MESSAGES_EN.items():
+            jobs[('messages', f"{name}:{language}")] = (text, language)
+
+    print(f"正在翻译 {len(jobs)} 条静态消息（{len(CATALOG_LANGUAGES)} 种语言，并发 {concurrency}）...")
+    results = await asyncio.gather(*(translate(client, semaphore, text, language) for text, language in jobs.values()))
+
+    catalog = {
+        'version': CATALOG_VERSION,
+        'source_hash': source_hash(),
+        'model': Settings.FINETUNED_MODEL,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'crisis': {},
+        'messages': {}
+    }
+    for (section, key), translated in zip(jobs, results):
+        if section == 'crisis':
+            catalog['crisis'][key] = translated
+        else:
+            name, language = key.split(':')
+            catalog['messages'].setdefault(name, {})[language] = translated
+    return catalog
+
+
+def write_catalog(catalog: dict, path: str):
+    """先写临时文件再替换，运行中的服务不会读到写了一半的目录"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预渲染多语言静态消息目录")
+    parser.add_argument('--concurrency', type=int, default=8, help='并发翻译请求数')
+    parser.add_argument('--output', default=Settings.MESSAGE_CATALOG_PATH, help='目录文件路径')
+    args = parser.parse_args()
+
+    try:
+        catalog = asyncio.run(build_catalog(args.concurrency))
+        write_catalog(catalog, args.output)
+        print(f"✅ 目录已生成: {args.output}")
+        print(f"   危机响应: {len(catalog['crisis'])} 条，静态消息: {sum(len(v) for v in catalog['messages'].values())} 条")
+    except Exception as e:
+        print(f"❌ 目录生成失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -9,6 +9,8 @@ class Settings:
     
     # 模型配置
     EMBEDDING_MODEL = "text-embedding-3-small"
+    # 缩短的Embedding维度（text-embedding-3 系列支持，如 512/256），为空时使用模型默认维度（1536）
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
     FINETUNED_MODEL = os.getenv("FINETUNED_MODEL", "gpt-4o-mini")  # 你的fine-tuned模型ID
     
     # 向量数据库配置 - ChromaDB Cloud
@@ -18,16 +20,81 @@ class Settings:
     CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
     CHROMA_TENANT = os.getenv("CHROMA_TENANT")
     CHROMA_DATABASE = os.getenv("CHROMA_DATABASE")
+    CHROMA_HOST = os.getenv("CHROMA_HOST", "api.trychroma.com")  # 异步HTTP客户端连接的Cloud地址
     
     # 本地ChromaDB配置（备用）
     VECTOR_DB_PATH = "./data/db/chroma"
     
     COLLECTION_NAME = "mental_health_kb"
     
+    # 检索后端：chroma（ChromaDB Cloud/本地）或 numpy（进程内精确检索，索引由 init_kb.py 导出）
+    RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+    VECTOR_INDEX_PATH = "./data/db/numpy_index"
+    VECTOR_INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "true").lower() == "true"  # 内存映射加载，多worker共享页缓存
+    VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # 本地索引的向量存储精度：float32 / float16 / int8
+    
+    # 检索模式：vector（纯向量检索）或 hybrid（BM25 + 向量检索，倒数排名融合；BM25索引由 init_kb.py 构建）
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+    BM25_INDEX_PATH = "./data/db/bm25_index"
+    HYBRID_VECTOR_K = int(os.getenv("HYBRID_VECTOR_K", "8"))  # 混合检索时向量检索的候选数
+    HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", "20"))  # 混合检索时BM25的候选数
+    RRF_K = 60  # 倒数排名融合的平滑常数
+    
+    # 增量入库配置
+    KB_MANIFEST_PATH = "./data/db/kb_manifest.json"  # 已入库文件和文档块的内容哈希清单
+    KB_WATCH_INTERVAL_SECONDS = float(os.getenv("KB_WATCH_INTERVAL_SECONDS", "5"))  # init_kb.py --watch 的轮询间隔
+    KB_PARSE_WORKERS = int(os.getenv("KB_PARSE_WORKERS", str(os.cpu_count() or 2)))  # 解析/切分文档的进程数
+    KB_CHECKPOINT_FILES = 50  # 每完成多少个文件保存一次清单（断点续传的检查点）
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))  # 每次Embedding请求的文档块数（API上限2048条/300k tokens）
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))  # 同时进行的Embedding请求数
+    
+    # 会话存储配置
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory（单worker）或 sqlite（多worker共享）
+    SESSION_DB_PATH = "./data/db/sessions.sqlite3"
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))  # 会话闲置超过该时间后淘汰
+    SESSION_MAX_MESSAGES = 50  # 每个会话保留的最近消息条数
+    
     # RAG配置
     CHUNK_SIZE = 800
     CHUNK_OVERLAP = 150
     TOP_K_RETRIEVAL = 6  # 增加检索文档数量，以便引用更多知识库内容
     SIMILARITY_THRESHOLD = 1.2  # 放宽阈值以提高召回率 (ChromaDB cosine distance: 0=perfect, 2=opposite)
     TEMPERATURE = 0.7
+    
+    # Embedding缓存配置
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH = "./data/db/embedding_cache.sqlite3"
+    
+    # 翻译缓存配置
+    TRANSLATION_CACHE_MAX_BYTES = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # LRU淘汰的字节上限
+    TRANSLATION_CACHE_TTL_SECONDS = float(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", "0")) or None  # 0表示不过期
+    
+    # 对话历史配置（按token预算保留最近消息，较早的消息折叠进滚动摘要）
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))  # 原样保留的最近消息的总token上限
+    HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "400"))  # 单条历史消息的token上限
+    HISTORY_SUMMARY_EVERY_N_TURNS = int(os.getenv("HISTORY_SUMMARY_EVERY_N_TURNS", "4"))  # 一次至少折叠的轮数（一次摘要调用通常管N轮）
+    HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))  # 滚动摘要的token上限
+    HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")  # 更新摘要使用的便宜模型
+    HISTORY_SNIPPET_TOKENS = 40  # 阶段检测、轮次分析中每条历史消息的token上限
+    HISTORY_TOKENIZER_ENCODING = os.getenv("HISTORY_TOKENIZER_ENCODING", "o200k_base")  # tiktoken编码（gpt-4o系列）
+    
+    # 问候语快速通道（问候、致谢、简单应答不调用LLM，直接使用本地化模板回复）
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    
+    # 语义回复缓存配置（只缓存倾听阶段、无历史、无风险的开场消息，如"hi""I feel sad"）
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95"))  # 查询向量的余弦相似度下限
+    RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))  # 每条缓存保存的不同回复数，避免千篇一律
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))  # LRU淘汰的条目上限
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")) or None  # 0表示不过期
+    
+    # 预渲染消息目录（build_catalog.py 生成）
+    MESSAGE_CATALOG_PATH = "./data/catalog/messages.json"
+    
+    # 风险筛查配置
+    RISK_PRESCREEN_ENABLED = os.getenv("RISK_PRESCREEN_ENABLED", "true").lower() == "true"  # 翻译前在原文上用多语言短语库筛查
+    
+    # 语言检测配置
+    LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD = float(os.getenv("LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD", "0.8"))  # 本地检测低于该置信度时才调用LLM
+    USE_TURN_ANALYSIS = os.getenv("USE_TURN_ANALYSIS", "true").lower() == "true"  # 用一次结构化调用同时完成语言检测、翻译和阶段检测
 
@@ -0,0 +1,139 @@
+"""持久化的Embedding缓存
+
+包装 OpenAIEmbeddings：向量以 float32 二进制存入 SQLite，键为 (模型, 文本) 的 SHA-256。
+检索时的查询（_build_semantic_search_query 生成的查询高度重复）和 init_kb.py 重建知识库时的文档块
+都先查缓存，只有未命中的文本才调用Embedding API。
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from config import Settings
+
+# SQLite 单条语句的参数数量上限较低，批量查询时分段
+_LOOKUP_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """带SQLite持久化缓存的Embeddings，接口与被包装的Embeddings一致"""
+
+    def __init__(self, embeddings: Embeddings, model: str, db_path: str):
+        self.embeddings = embeddings
+        self.model = model
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[i:i + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array('f', vector).tobytes()) for key, vector in items.items()]
+            )
+            self._conn.commit()
+
+    def _split(self, texts: List[str]):
+        """返回 (每个文本的键, 已缓存的向量, 需要计算的去重文本)"""
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in cached)
+            self.misses += len(keys) - sum(1 for key in keys if key in cached)
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite读写放到线程池执行，不阻塞事件循环
+        keys, cached, missing = await asyncio.to_thread(self._split, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+
+def embedding_model_id() -> str:
+    """Embedding模型及输出维度的标识（缓存键、文档块ID和入库清单都用它区分不同的向量空间）"""
+    if Settings.EMBEDDING_DIMENSIONS:
+        return f"{Settings.EMBEDDING_MODEL}@{Settings.EMBEDDING_DIMENSIONS}"
+    return Settings.EMBEDDING_MODEL
+
+
+def create_embeddings() -> Embeddings:
+    """创建知识库和检索统一使用的Embeddings（按配置包一层持久化缓存）"""
+    embeddings = OpenAIEmbeddings(
+        model=Settings.EMBEDDING_MODEL,
+        dimensions=Settings.EMBEDDING_DIMENSIONS,
+        openai_api_key=Settings.OPENAI_API_KEY
+    )
+    if not Settings.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, model=embedding_model_id(), db_path=Settings.EMBEDDING_CACHE_PATH)
+
+
+def embedding_cache_stats(embeddings: Embeddings) -> Optional[Dict]:
+    """返回Embedding缓存统计，未启用缓存时返回None"""
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.stats()
+    return None
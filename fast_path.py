@@ -0,0 +1,315 @@
+"""问候语快速通道
+
+"hi""你好""gracias" 这样的消息原来也要走完整流程：语言检测、阶段检测、一次向量检索（倾听阶段又会丢弃结果），
+再调用一次生成模型。这里在主流程之前识别各支持语言的问候、致谢和简单应答，直接从本地化的回复模板池中取一条，
+不调用OpenAI，也不访问向量库。
+
+- 整条消息（去掉标点、表情和重复字母后）必须完全由登记的短语组成，"hi, I feel sad" 这样带内容的消息不会命中
+- 简单应答（"ok""好的"）只在没有对话历史时命中：对话中途它们是在回答上一句话，需要结合上下文
+- 不登记告别语（"bye""再见"）：告别可能是危机信号，必须走完整的风险检测
+- 各语言的模板池按下标一一对应（同一下标是同一句话的译文），英文版本记入会话历史供后续轮次使用
+
+风险筛查必须先于快速通道执行（见 RAGEngine._prepare_turn）。
+"""
+import random
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# 类别 -> 语言 -> 短语（语言顺序决定歧义短语的默认语言，如 "ok"）
+FAST_PATH_PHRASES: Dict[str, Dict[str, List[str]]] = {
+    'greeting': {
+        'en': ['hi', 'hello', 'hey', 'hiya', 'howdy', 'hi there', 'hello there', 'hey there', 'good morning',
+               'good afternoon', 'good evening', 'morning', 'how are you', 'how are you doing', "how's it going",
+               "what's up"],
+        'zh': ['你好', '您好', '嗨', '哈喽', '哈啰', '你好啊', '早上好', '早安', '早', '下午好', '晚上好', '在吗', '在么'],
+        'es': ['hola', 'buenos días', 'buenas tardes', 'buenas noches', 'buenas', 'qué tal', 'cómo estás'],
+        'fr': ['bonjour', 'salut', 'bonsoir', 'coucou', 'ça va', 'comment ça va'],
+        'de': ['hallo', 'guten morgen', 'guten tag', 'guten abend', 'servus', 'moin', "wie geht's", 'wie geht es dir'],
+        'it': ['ciao', 'buongiorno', 'buonasera', 'salve', 'come stai'],
+        'pt': ['olá', 'oi', 'bom dia', 'boa tarde', 'boa noite', 'tudo bem', 'como vai'],
+        'ru': ['привет', 'здравствуйте', 'здравствуй', 'добрый день', 'доброе утро', 'добрый вечер', 'как дела'],
+        'ja': ['こんにちは', 'こんばんは', 'おはよう', 'おはようございます', 'やあ', 'はじめまして'],
+        'ko': ['안녕', '안녕하세요', '반가워요', '반갑습니다'],
+        'ar': ['مرحبا', 'مرحباً', 'أهلا', 'أهلاً', 'السلام عليكم', 'صباح الخير', 'مساء الخير'],
+        'hi': ['नमस्ते', 'नमस्कार', 'हेलो', 'हाय'],
+    },
+    'thanks': {
+        'en': ['thanks', 'thank you', 'thank you so much', 'thanks a lot', 'many thanks', 'thx', 'ty'],
+        'zh': ['谢谢', '谢谢你', '谢谢您', '多谢', '感谢', '非常感谢', '谢啦'],
+        'es': ['gracias', 'muchas gracias', 'mil gracias'],
+        'fr': ['merci', 'merci beaucoup', 'merci bien'],
+        'de': ['danke', 'danke schön', 'dankeschön', 'vielen dank'],
+        'it': ['grazie', 'grazie mille'],
+        'pt': ['obrigado', 'obrigada', 'muito obrigado', 'muito obrigada', 'valeu'],
+        'ru': ['спасибо', 'большое спасибо'],
+        'ja': ['ありがとう', 'ありがとうございます', 'どうも'],
+        'ko': ['고마워', '고마워요', '감사합니다', '고맙습니다'],
+        'ar': ['شكرا', 'شكراً', 'شكرا جزيلا'],
+        'hi': ['धन्यवाद', 'शुक्रिया'],
+    },
+    'acknowledgement': {
+        'en': ['ok', 'okay', 'sure', 'yes', 'yeah', 'yep', 'alright', 'cool'],
+        'zh': ['好的', '好', '嗯', '嗯嗯', '行', '可以', '是的'],
+        'es': ['vale', 'sí', 'claro', 'de acuerdo'],
+        'fr': ["d'accord", 'oui'],
+        'de': ['ja', 'alles klar'],
+        'it': ['va bene', 'sì', 'certo'],
+        'pt': ['tá bom', 'sim', 'certo', 'beleza'],
+        'ru': ['хорошо', 'ладно', 'ок', 'да'],
+        'ja': ['はい', 'わかりました', 'うん'],
+        'ko': ['네', '응', '알겠어요', '좋아요'],
+        'ar': ['حسنا', 'حسناً', 'نعم', 'تمام'],
+        'hi': ['ठीक है', 'हाँ', 'हां', 'अच्छा'],
+    },
+}
+
+# 只在没有对话历史时使用的类别
+FIRST_TURN_ONLY = {'acknowledgement'}
+
+# 同一条消息包含多个类别时（如 "ok thanks"）按此顺序取回复类别
+_CATEGORY_PRIORITY = ('thanks', 'greeting', 'acknowledgement')
+
+# 各类别的英文含义（记为本轮的英文消息，后续轮次的历史翻译直接使用）
+FAST_PATH_MESSAGES_EN = {
+    'greeting': 'Hello',
+    'thanks': 'Thank you',
+    'acknowledgement': 'Okay',
+}
+
+# 类别 -> 语言 -> 回复模板（同一下标是同一句话的各语言版本）
+FAST_PATH_RESPONSES: Dict[str, Dict[str, List[str]]] = {
+    'greeting': {
+        'en': ["Hi! I'm really glad you're here. How are you feeling today?",
+               "Hello! This is a safe space to talk about anything on your mind. What's been going on lately?",
+               "Hey there! I'm here to listen. Is there something on your mind today?"],
+        'zh': ['你好！很高兴你来和我聊聊。你今天感觉怎么样？',
+               '你好！在这里你可以放心地聊任何心事。最近过得怎么样？',
+               '嗨！我在这里倾听你。今天有什么想聊的吗？'],
+        'es': ['¡Hola! Me alegra mucho que estés aquí. ¿Cómo te sientes hoy?',
+               '¡Hola! Este es un espacio seguro para hablar de lo que tengas en mente. ¿Qué tal te ha ido últimamente?',
+               '¡Hola! Estoy aquí para escucharte. ¿Hay algo que te preocupe hoy?'],
+        'fr': ['Bonjour ! Je suis vraiment content que tu sois là. Comment te sens-tu aujourd’hui ?',
+               'Bonjour ! Ici, tu peux parler en toute sécurité de tout ce qui te préoccupe. Comment ça se passe pour toi ces derniers temps ?',
+               'Salut ! Je suis là pour t’écouter. Y a-t-il quelque chose qui te préoccupe aujourd’hui ?'],
+        'de': ['Hallo! Schön, dass du da bist. Wie fühlst du dich heute?',
+               'Hallo! Hier kannst du ganz offen über alles sprechen, was dich beschäftigt. Wie ist es dir in letzter Zeit ergangen?',
+               'Hey! Ich bin hier, um dir zuzuhören. Gibt es heute etwas, das dich beschäftigt?'],
+        'it': ['Ciao! Sono davvero contento che tu sia qui. Come ti senti oggi?',
+               'Ciao! Questo è uno spazio sicuro per parlare di qualsiasi cosa ti passi per la testa. Come sono andate le cose ultimamente?',
+               'Ciao! Sono qui per ascoltarti. C’è qualcosa che ti pesa oggi?'],
+        'pt': ['Olá! Fico muito feliz que você esteja aqui. Como você está se sentindo hoje?',
+               'Olá! Este é um espaço seguro para falar sobre o que estiver na sua cabeça. Como as coisas têm andado ultimamente?',
+               'Oi! Estou aqui para ouvir você. Tem alguma coisa te incomodando hoje?'],
+        'ru': ['Привет! Я очень рад, что ты здесь. Как ты себя чувствуешь сегодня?',
+               'Здравствуйте! Здесь можно спокойно поговорить обо всём, что у вас на душе. Как у вас дела в последнее время?',
+               'Привет! Я здесь, чтобы выслушать тебя. Тебя сегодня что-то беспокоит?'],
+        'ja': ['こんにちは！来てくれて本当にうれしいです。今日の気分はどうですか？',
+               'こんにちは！ここでは心にあることを何でも安心して話せます。最近はどう過ごしていますか？',
+               'こんにちは！お話を聞くためにここにいます。今日は何か気になっていることはありますか？'],
+        'ko': ['안녕하세요! 와 주셔서 정말 반가워요. 오늘 기분은 어떠세요?',
+               '안녕하세요! 여기서는 마음속에 있는 어떤 이야기든 편하게 할 수 있어요. 요즘 어떻게 지내세요?',
+               '안녕하세요! 이야기를 들으려고 여기 있어요. 오늘 마음에 걸리는 일이 있나요?'],
+        'ar': ['مرحباً! يسعدني حقاً وجودك هنا. كيف تشعر اليوم؟',
+               'مرحباً! هذه مساحة آمنة للحديث عن أي شيء يشغل بالك. كيف كانت أحوالك مؤخراً؟',
+               'أهلاً! أنا هنا لأستمع إليك. هل هناك شيء يشغل بالك اليوم؟'],
+        'hi': ['नमस्ते! मुझे सच में खुशी है कि आप यहाँ हैं। आज आप कैसा महसूस कर रहे हैं?',
+               'नमस्ते! यहाँ आप अपने मन की कोई भी बात बेझिझक कह सकते हैं। हाल में सब कैसा चल रहा है?',
+               'हाय! मैं आपकी बात सुनने के लिए यहाँ हूँ। क्या आज आपके मन में कुछ है?'],
+    },
+    'thanks': {
+        'en': ["You're very welcome. I'm still here if there's anything else you'd like to talk about.",
+               "I'm glad I could be here for you. How are you feeling right now?",
+               "Anytime. Is there anything else on your mind?"],
+        'zh': ['不客气。如果还有什么想聊的，我一直都在。',
+               '很高兴能陪着你。你现在感觉怎么样？',
+               '随时都可以。还有什么想说的吗？'],
+        'es': ['De nada. Sigo aquí si hay algo más de lo que quieras hablar.',
+               'Me alegra haber podido acompañarte. ¿Cómo te sientes ahora?',
+               'Cuando quieras. ¿Hay algo más que tengas en mente?'],
+        'fr': ['Je t’en prie. Je suis toujours là si tu veux parler d’autre chose.',
+               'Je suis content d’avoir pu être là pour toi. Comment te sens-tu maintenant ?',
+               'Avec plaisir. Y a-t-il autre chose qui te préoccupe ?'],
+        'de': ['Gern geschehen. Ich bin weiterhin da, wenn du über etwas anderes sprechen möchtest.',
+               'Ich bin froh, dass ich für dich da sein konnte. Wie fühlst du dich gerade?',
+               'Jederzeit. Gibt es noch etwas, das dich beschäftigt?'],
+        'it': ['Figurati. Sono ancora qui se c’è qualcos’altro di cui vuoi parlare.',
+               'Sono contento di esserti stato vicino. Come ti senti adesso?',
+               'Quando vuoi. C’è qualcos’altro che ti passa per la testa?'],
+        'pt': ['De nada. Continuo aqui se você quiser conversar sobre mais alguma coisa.',
+               'Fico feliz por ter podido estar com você. Como você está se sentindo agora?',
+               'Sempre que precisar. Tem mais alguma coisa na sua cabeça?'],
+        'ru': ['Пожалуйста. Я всё ещё здесь, если хочешь поговорить о чём-то ещё.',
+               'Я рад, что смог быть рядом. Как ты себя чувствуешь сейчас?',
+               'Всегда пожалуйста. Есть ли ещё что-то, что тебя беспокоит?'],
+        'ja': ['どういたしまして。ほかに話したいことがあれば、いつでもここにいます。',
+               'お役に立ててうれしいです。今の気分はどうですか？',
+               'いつでもどうぞ。ほかに気になっていることはありますか？'],
+        'ko': ['천만에요. 더 이야기하고 싶은 게 있으면 언제든 여기 있을게요.',
+               '곁에 있어 드릴 수 있어서 다행이에요. 지금 기분은 어떠세요?',
+               '언제든지요. 또 마음에 걸리는 일이 있나요?'],
+        'ar': ['على الرحب والسعة. ما زلت هنا إذا كان هناك أي شيء آخر تود الحديث عنه.',
+               'يسعدني أنني كنت بجانبك. كيف تشعر الآن؟',
+               'في أي وقت. هل هناك شيء آخر يشغل بالك؟'],
+        'hi': ['आपका स्वागत है। अगर आप किसी और बात पर बात करना चाहें तो मैं यहीं हूँ।',
+               'मुझे खुशी है कि मैं आपके साथ रह सका। अभी आप कैसा महसूस कर रहे हैं?',
+               'कभी भी। क्या आपके मन में कुछ और है?'],
+    },
+    'acknowledgement': {
+        'en': ["I'm here and ready to listen. What would you like to talk about today?",
+               "Take your time. Is there something on your mind that you'd like to share?",
+               "Whenever you're ready, I'm listening. How have things been for you lately?"],
+        'zh': ['我在这里，随时准备倾听。今天想聊些什么呢？',
+               '慢慢来，不着急。有什么想和我分享的吗？',
+               '你准备好了随时可以说，我在听。最近过得怎么样？'],
+        'es': ['Estoy aquí y listo para escucharte. ¿De qué te gustaría hablar hoy?',
+               'Tómate tu tiempo. ¿Hay algo que te gustaría compartir?',
+               'Cuando estés listo, te escucho. ¿Cómo te han ido las cosas últimamente?'],
+        'fr': ['Je suis là et prêt à t’écouter. De quoi aimerais-tu parler aujourd’hui ?',
+               'Prends ton temps. Y a-t-il quelque chose que tu aimerais partager ?',
+               'Quand tu veux, je t’écoute. Comment ça se passe pour toi ces derniers temps ?'],
+        'de': ['Ich bin da und höre dir zu. Worüber möchtest du heute sprechen?',
+               'Lass dir Zeit. Gibt es etwas, das du gern erzählen möchtest?',
+               'Wann immer du bereit bist, ich höre zu. Wie ist es dir in letzter Zeit ergangen?'],
+        'it': ['Sono qui, pronto ad ascoltarti. Di cosa ti piacerebbe parlare oggi?',
+               'Prenditi il tuo tempo. C’è qualcosa che vorresti condividere?',
+               'Quando sei pronto, ti ascolto. Come sono andate le cose ultimamente?'],
+        'pt': ['Estou aqui, pronto para ouvir. Sobre o que você gostaria de conversar hoje?',
+               'Sem pressa. Tem algo que você gostaria de compartilhar?',
+               'Quando estiver pronto, estou ouvindo. Como as coisas têm andado ultimamente?'],
+        'ru': ['Я здесь и готов выслушать. О чём бы ты хотел поговорить сегодня?',
+               'Не торопись. Есть ли что-то, чем ты хотел бы поделиться?',
+               'Когда будешь готов, я слушаю. Как у тебя дела в последнее время?'],
+        'ja': ['ここでお話を聞く準備ができています。今日は何について話したいですか？',
+               'ゆっくりで大丈夫です。何か話したいことはありますか？',
+               '準備ができたらいつでもどうぞ。最近はどう過ごしていますか？'],
+        'ko': ['여기서 들을 준비가 되어 있어요. 오늘은 어떤 이야기를 하고 싶으세요?',
+               '천천히 하셔도 돼요. 나누고 싶은 이야기가 있나요?',
+               '준비되면 언제든 말씀하세요. 요즘 어떻게 지내셨어요?'],
+        'ar': ['أنا هنا ومستعد للاستماع. عمّ تود أن نتحدث اليوم؟',
+               'خذ وقتك. هل هناك شيء تود مشاركته؟',
+               'عندما تكون مستعداً، أنا أستمع. كيف كانت أحوالك مؤخراً؟'],
+        'hi': ['मैं यहाँ हूँ और सुनने के लिए तैयार हूँ। आज आप किस बारे में बात करना चाहेंगे?',
+               'आराम से, कोई जल्दी नहीं। क्या कुछ है जो आप साझा करना चाहेंगे?',
+               'जब आप तैयार हों, मैं सुन रहा हूँ। हाल में सब कैसा चल रहा है?'],
+    },
+}
+
+# 只处理很短的消息
+MAX_MESSAGE_CHARS = 40
+
+_REPEATED_CHARACTERS = re.compile(r'(.)\1{2,}')
+
+
+def normalize(text: str) -> str:
+    """小写，去掉标点、符号、表情和空白
+
+    拉丁字母去掉重音（"ola" 与 "olá" 相同）；其他文字保留组合符号（印地语元音符号等不能去掉）
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = ''.join(ch for ch in text if not unicodedata.category(ch).startswith(('P', 'S', 'Z', 'C')))
+    stripped = ''.join(ch for ch in unicodedata.normalize('NFD', text) if unicodedata.category(ch) != 'Mn')
+    if stripped.isascii():
+        text = stripped
+    return text
+
+
+class FastPath:
+    """问候语识别（整条消息分词匹配短语表）与回复选择，附命中统计"""
+
+    def __init__(self, phrases: Dict[str, Dict[str, List[str]]] = None,
+                 responses: Dict[str, Dict[str, List[str]]] = None):
+        phrases = phrases or FAST_PATH_PHRASES
+        self.responses = responses or FAST_PATH_RESPONSES
+        # 规范化后的短语 -> [(类别, 语言), ...]
+        self._phrases: Dict[str, List[Tuple[str, str]]] = {}
+        for category, by_language in phrases.items():
+            for language, items in by_language.items():
+                for phrase in items:
+                    self._phrases.setdefault(normalize(phrase), []).append((category, language))
+        self._longest = max((len(phrase) for phrase in self._phrases), default=0)
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.hits = 0
+        self.by_category: Dict[str, int] = {}
+        self.by_language: Dict[str, int] = {}
+
+    def _segment(self, text: str) -> Optional[List[List[Tuple[str, str]]]]:
+        """把整条消息切分成登记的短语（最少段数），切不开时返回None"""
+        n = len(text)
+        best: List[Optional[List[str]]] = [None] * (n + 1)
+        best[0] = []
+        for end in range(1, n + 1):
+            for start in range(max(0, end - self._longest), end):
+                if best[start] is None:
+                    continue
+                piece = text[start:end]
+                if piece in self._phrases and (best[end] is None or len(best[start]) + 1 < len(best[end])):
+                    best[end] = best[start] + [piece]
+        if not best[n]:
+            return None
+        return [self._phrases[piece] for piece in best[n]]
+
+    def match(self, message: str, preferred_language: Optional[str] = None,
+              has_history: bool = False) -> Optional[Dict]:
+        """识别问候、致谢和简单应答
+
+        Returns:
+            未命中返回None；命中返回 {'category', 'language', 'response', 'response_en', 'message_en'}
+        """
+        with self._lock:
+            self.turns += 1
+        if not message or len(message.strip()) > MAX_MESSAGE_CHARS:
+            return None
+        # 拉长的字母（"hiii""goood morning"）压缩为一个或两个再匹配
+        text = normalize(message)
+        segments = None
+        for candidate in dict.fromkeys((text, _REPEATED_CHARACTERS.sub(r'\1\1', text), _REPEATED_CHARACTERS.sub(r'\1', text))):
+            segments = self._segment(candidate)
+            if segments is not None:
+                break
+        if segments is None:
+            return None
+
+        categories = {category for segment in segments for category, _ in segment}
+        if has_history:
+            categories -= FIRST_TURN_ONLY
+        category = next((c for c in _CATEGORY_PRIORITY if c in categories), None)
+        if category is None:
+            return None
+
+        # 回复语言：所有片段共同的语言中优先取会话首选语言，其次按短语表中的语言顺序
+        languages = None
+        for segment in segments:
+            segment_languages = [language for _, language in segment]
+            languages = segment_languages if languages is None else [l for l in languages if l in segment_languages]
+        if not languages:
+            languages = [language for _, language in segments[0]]
+        language = preferred_language if preferred_language in languages else languages[0]
+        if language not in self.responses[category]:
+            return None
+
+        index = random.randrange(len(self.responses[category]['en']))
+        with self._lock:
+            self.hits += 1
+            self.by_category[category] = self.by_category.get(category, 0) + 1
+            self.by_language[language] = self.by_language.get(language, 0) + 1
+        return {
+            'category': category,
+            'language': language,
+            'response': self.responses[category][language][index],
+            'response_en': self.responses[category]['en'][index],
+            'message_en': message if language == 'en' else FAST_PATH_MESSAGES_EN[category],
+        }
+
+    def stats(self) -> Dict:
+        """快速通道处理的轮次占比，按类别和语言分别计数"""
+        with self._lock:
+            return {
+                'turns': self.turns,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.turns if self.turns else 0.0,
+                'by_category': dict(self.by_category),
+                'by_language': dict(self.by_language)
+            }
@@ -0,0 +1,233 @@
+"""按token预算管理生成提示词中的对话历史
+
+原来生成时直接拼接最近10条英文历史，每条消息长度不受限制，一段很长的倾诉就能让提示词多出几千个token；
+阶段检测也只是按150个字符截断。这里改为按token计数：
+- 最近的消息原样保留，总量不超过 HISTORY_TOKEN_BUDGET（单条消息最多 HISTORY_MESSAGE_MAX_TOKENS）
+- 超出预算的较早消息折叠进滚动摘要。摘要是增量更新的：每次只把新折叠的消息和旧摘要交给
+  便宜的模型合并，而且一次至少折叠 HISTORY_SUMMARY_EVERY_N_TURNS 轮，不会每轮都调用
+- 摘要按会话缓存：有会话时保存在会话里（session['history_summary']），
+  无状态请求按已折叠消息的前缀哈希缓存在进程内
+
+对话再长，生成提示词中的历史部分也保持在 预算 + 摘要上限 以内。
+
+token计数使用tiktoken的本地编码；tiktoken未安装或编码文件无法加载（离线环境可设置 TIKTOKEN_CACHE_DIR）时
+退回按字符估算（中日韩字符每个算1个token，其余每4个字符算1个token）。
+"""
+import hashlib
+import math
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from config import Settings
+from translation_cache import TranslationCache
+
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]')
+
+_TRUNCATION_MARK = " …"
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """惰性加载tiktoken编码，失败时返回None（使用估算）"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(Settings.HISTORY_TOKENIZER_ENCODING)
+        except Exception as e:
+            # tiktoken首次使用某个编码时会联网下载编码文件，离线环境下会失败
+            print(f"[WARNING] Tokenizer {Settings.HISTORY_TOKENIZER_ENCODING} unavailable ({e.__class__.__name__}: {e}), "
+                  f"estimating token counts from characters. tiktoken downloads the encoding on first use; "
+                  f"pre-download it or set TIKTOKEN_CACHE_DIR (see README)")
+            metrics.record_fallback('token_estimate')
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: str) -> int:
+    """文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens 个token（截断时末尾加省略号）"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text or ''
+    encoding = _get_encoding()
+    if encoding is None:
+        # 估算模式：按比例截取字符，再逐步缩短到预算以内
+        end = max(1, int(len(text) * max_tokens / _estimate_tokens(text)))
+        while end > 1 and _estimate_tokens(text[:end]) > max_tokens:
+            end = int(end * 0.9)
+        return text[:end].rstrip() + _TRUNCATION_MARK
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip() + _TRUNCATION_MARK
+
+
+def _message_text(message: Dict) -> str:
+    return message.get('content') or ''
+
+
+def _prefix_digests(messages: List[Dict]) -> List[str]:
+    """digests[i] 是前 i 条消息的链式哈希（无状态请求按它查找已缓存的摘要）"""
+    digest = hashlib.sha256(Settings.HISTORY_SUMMARY_MODEL.encode('utf-8'))
+    digests = [digest.hexdigest()]
+    for message in messages:
+        digest.update(f"\x00{message.get('role')}\x00{_message_text(message)}".encode('utf-8'))
+        digests.append(digest.hexdigest())
+    return digests
+
+
+SUMMARY_PROMPT = """You maintain a running summary of a mental health support conversation between a user and an AI companion.
+Update the summary with the new messages below. Keep what the user has shared about their feelings, situation,
+important people and events, any safety concerns, and what support or suggestions have already been offered.
+Write in English, in the third person, as concise notes. Never exceed {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+class HistoryManager:
+    """token预算内的最近历史 + 增量更新的滚动摘要"""
+
+    def __init__(self, client, budget_tokens: int, message_max_tokens: int, summary_every_turns: int,
+                 summary_max_tokens: int, model: str, cache: Optional[TranslationCache] = None):
+        """
+        Args:
+            client: AsyncOpenAI 客户端（摘要调用）
+            budget_tokens: 原样保留的最近消息的总token上限
+            message_max_tokens: 单条消息的token上限（超出部分截断）
+            summary_every_turns: 一次至少折叠的轮数（每轮两条消息），折叠后通常N轮内不必再调用
+            summary_max_tokens: 摘要的token上限
+            model: 摘要使用的模型
+            cache: 摘要缓存（已折叠消息的前缀哈希 -> 摘要），会话状态缺失或无状态请求时使用
+        """
+        self.client = client
+        self.budget_tokens = budget_tokens
+        self.message_max_tokens = message_max_tokens
+        self.summary_every_messages = max(1, summary_every_turns) * 2
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+        self.cache = cache
+        self.builds = 0
+        self.summary_calls = 0
+        self.summary_failures = 0
+        self.folded_messages = 0
+        self.cache_hits = 0
+
+    def _cached_state(self, history_en: List[Dict]) -> Optional[Dict]:
+        """找到覆盖最长前缀的已缓存摘要（各个前缀一次查找，只计一次命中或未命中）"""
+        if self.cache is None:
+            return None
+        digests = _prefix_digests(history_en)
+        found = self.cache.get_first(digests[:0:-1])
+        if found is None:
+            metrics.record_cache('history_summary', False)
+            return None
+        index, text = found
+        self.cache_hits += 1
+        metrics.record_cache('history_summary', True)
+        return {'text': text, 'covered': len(digests) - 1 - index}
+
+    async def _summarize(self, summary: Optional[str], messages: List[Dict]) -> str:
+        """把新折叠的消息合并进摘要（一次调用）"""
+        self.summary_calls += 1
+        transcript = "\n".join(
+            f"- {'User' if message.get('role') == 'user' else 'AI'}: {_message_text(message)}" for message in messages
+        )
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": SUMMARY_PROMPT.format(
+                max_words=int(self.summary_max_tokens * 0.7), summary=summary or "(none yet)", messages=transcript
+            )}],
+            temperature=0.2,
+            max_tokens=self.summary_max_tokens
+        )
+        metrics.record_llm_call('history_summary', time.perf_counter() - started, getattr(response, 'usage', None))
+        text = (response.choices[0].message.content or '').strip()
+        if not text:
+            raise ValueError("empty summary")
+        return truncate_tokens(text, self.summary_max_tokens)
+
+    async def build(self, history_en: List[Dict], state: Optional[Dict] = None
+                    ) -> Tuple[List[Dict], Optional[str], Optional[Dict]]:
+        """选出原样保留的最近消息，必要时更新滚动摘要
+
+        Args:
+            history_en: 英文对话历史（按时间顺序的 {'role', 'content'}，不含本轮消息）
+            state: 会话中保存的摘要状态 {'text': 摘要, 'covered': 已折叠的前若干条消息数}，无状态请求为None
+
+        Returns:
+            (最近消息, 摘要文本或None, 新的摘要状态)
+        """
+        self.builds += 1
+        if not history_en:
+            return [], None, state
+        messages = [
+            {"role": message.get('role'), "content": truncate_tokens(_message_text(message), self.message_max_tokens)}
+            for message in history_en
+        ]
+        message_tokens = [count_tokens(message['content']) for message in messages]
+        if state is None or not 0 <= state.get('covered', -1) <= len(messages):
+            # 摘要只在历史超出预算时生成；历史仍在预算内时它的任何前缀都不可能被折叠过，不必查缓存
+            over_budget = sum(message_tokens) > self.budget_tokens
+            state = self._cached_state(history_en) if over_budget else None
+        covered = state['covered'] if state else 0
+        summary = state['text'] if state else None
+
+        # 从最新的消息往前累计，找到预算内能原样保留的最早位置
+        start = len(messages)
+        used = 0
+        while start > covered:
+            tokens = message_tokens[start - 1]
+            if used + tokens > self.budget_tokens and start < len(messages):
+                break
+            used += tokens
+            start -= 1
+        if start == covered:
+            return messages[covered:], summary, state
+
+        # 超出预算：至少折叠N轮（但保留最近一轮），折叠得比预算要求的多，之后几轮不必再调用
+        fold_end = max(start, min(covered + self.summary_every_messages, len(messages) - 2))
+        try:
+            summary = await self._summarize(summary, messages[covered:fold_end])
+        except Exception as e:
+            self.summary_failures += 1
+            print(f"[WARNING] History summary failed: {e}, dropping {start - covered} older messages from the prompt")
+            metrics.record_fallback('history_truncated')
+            return messages[start:], summary, state
+        self.folded_messages += fold_end - covered
+        state = {'text': summary, 'covered': fold_end}
+        if self.cache is not None:
+            self.cache.put(_prefix_digests(history_en[:fold_end])[-1], summary)
+        return messages[fold_end:], summary, state
+
+    def stats(self) -> Dict:
+        """摘要调用次数、失败次数、折叠的消息数等"""
+        return {
+            'builds': self.builds,
+            'summary_calls': self.summary_calls,
+            'summary_failures': self.summary_failures,
+            'summary_call_rate': self.summary_calls / self.builds if self.builds else 0.0,
+            'folded_messages': self.folded_messages,
+            'cache_hits': self.cache_hits,
+            'budget_tokens': self.budget_tokens,
+            'cache': self.cache.stats() if self.cache is not None else None
+        }
@@ -7,136 +7,488 @@ sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from config import Settings
+from embedding_cache import create_embeddings, embedding_cache_stats, embedding_model_id
+from vector_index import export_collection
+from bm25_index import build_from_collection
+from kb_metadata import chunk_metadata
+from kb_manifest import Manifest, chunk_ids, file_sha256
+import asyncio
 import chromadb
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional
 
-def init_knowledge_base(documents_dir: str = None):
-    """
-    初始化知识库
-    
-    Args:
-        documents_dir: 文档目录路径，如果为None则会在当前目录查找data/knowledge_base
+SUPPORTED_EXTENSIONS = ['.txt', '.pdf']
+
+
+def _scan_documents(documents_dir: str) -> Dict[str, Path]:
+    """列出文档目录中所有支持的文件：相对路径 -> 路径"""
+    return {
+        file_path.relative_to(documents_dir).as_posix(): file_path
+        for file_path in sorted(Path(documents_dir).rglob('*'))
+        if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS
+    }
+
+
+def _parse_file(file_path: str, relative_path: str, old_sha256: Optional[str]) -> Dict:
+    """在子进程中加载、切分单个文件（PDF解析是CPU密集型的）
+
+    只返回纯数据（文档块ID、文本、元数据），不把整个文档对象传回主进程。
+    内容哈希与清单一致时不解析，直接返回 unchanged。
     """
-    # 确定文档目录
-    if documents_dir is None:
-        documents_dir = "./data/knowledge_base"
+    started = time.perf_counter()
+    sha256 = file_sha256(file_path)
+    if sha256 == old_sha256:
+        return {'relative_path': relative_path, 'sha256': sha256, 'unchanged': True,
+                'load_seconds': time.perf_counter() - started, 'split_seconds': 0.0}
     
-    if not os.path.exists(documents_dir):
-        print(f"文档目录不存在: {documents_dir}")
-        print("请创建该目录并放入文档文件（支持.txt和.pdf格式）")
-        return
-    
-    # 加载所有文档
-    documents = []
-    supported_extensions = ['.txt', '.pdf']
-    
-    print(f"正在从 {documents_dir} 加载文档...")
-    for file_path in Path(documents_dir).rglob('*'):
-        if file_path.suffix.lower() in supported_extensions:
-            try:
-                print(f"  加载: {file_path}")
-                if file_path.suffix.lower() == '.pdf':
-                    loader = PyPDFLoader(str(file_path))
-                else:
-                    loader = TextLoader(str(file_path), encoding='utf-8')
-                
-                docs = loader.load()
-                documents.extend(docs)
-            except Exception as e:
-                print(f"  错误: 无法加载 {file_path}: {e}")
-    
-    if not documents:
-        print("未找到任何文档文件！")
-        print(f"请在 {documents_dir} 目录中放置.txt或.pdf文件")
-        return
-    
-    print(f"共加载 {len(documents)} 个文档")
+    if file_path.lower().endswith('.pdf'):
+        loader = PyPDFLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding='utf-8')
+    documents = loader.load()
+    loaded = time.perf_counter()
     
-    # 分割文档
-    print("正在分割文档...")
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=Settings.CHUNK_SIZE,
         chunk_overlap=Settings.CHUNK_OVERLAP
     )
     chunks = text_splitter.split_documents(documents)
-    print(f"文档分割为 {len(chunks)} 个块")
-    
-    # 创建向量数据库
-    print("正在创建向量数据库...")
-    embeddings = OpenAIEmbeddings(
-        model=Settings.EMBEDDING_MODEL,
-        openai_api_key=Settings.OPENAI_API_KEY
-    )
+    # 写入检索时按阶段过滤用的元数据（stage_bucket、category、source_file），按相对路径推导
+    metadata = chunk_metadata(relative_path)
+    for chunk in chunks:
+        chunk.metadata.update(metadata)
+    ids = chunk_ids(embedding_model_id(), relative_path, [chunk.page_content for chunk in chunks])
     
+    return {
+        'relative_path': relative_path,
+        'sha256': sha256,
+        'unchanged': False,
+        'chunks': [(chunk_id, chunk.page_content, chunk.metadata) for chunk_id, chunk in zip(ids, chunks)],
+        'load_seconds': loaded - started,
+        'split_seconds': time.perf_counter() - loaded
+    }
+
+
+def _open_collection(rebuild: bool):
+    """打开（不存在时创建）向量集合，返回 (集合, 集合标识)
+
+    增量入库不再删除集合，服务中的引擎在入库期间始终可以检索。
+    向量由本脚本计算后直接写入，集合本身不配置Embedding函数（与LangChain创建的集合一致）。
+    """
     if Settings.USE_CHROMA_CLOUD:
-        # 使用ChromaDB Cloud
         print("连接到ChromaDB Cloud...")
         chroma_client = chromadb.CloudClient(
             api_key=Settings.CHROMA_API_KEY,
             tenant=Settings.CHROMA_TENANT,
             database=Settings.CHROMA_DATABASE
         )
-        
-        # 检查集合是否存在，如果存在则删除
-        try:
-            chroma_client.delete_collection(name=Settings.COLLECTION_NAME)
-            print(f"已删除现有集合: {Settings.COLLECTION_NAME}")
-        except:
-            print(f"集合 {Settings.COLLECTION_NAME} 不存在，将创建新集合")
-        
-        # 创建新的向量数据库
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            client=chroma_client,
-            collection_name=Settings.COLLECTION_NAME
-        )
-        
-        print(f"✅ 知识库初始化完成！")
-        print(f"   数据库类型: ChromaDB Cloud")
-        print(f"   数据库名称: {Settings.CHROMA_DATABASE}")
-        print(f"   文档块数量: {len(chunks)}")
-        print(f"   集合名称: {Settings.COLLECTION_NAME}")
+        target = f"cloud:{Settings.CHROMA_TENANT}/{Settings.CHROMA_DATABASE}/{Settings.COLLECTION_NAME}"
     else:
-        # 使用本地ChromaDB
         print("使用本地ChromaDB...")
-        # 确保目录存在
         os.makedirs(Settings.VECTOR_DB_PATH, exist_ok=True)
+        chroma_client = chromadb.PersistentClient(path=Settings.VECTOR_DB_PATH)
+        target = f"local:{os.path.abspath(Settings.VECTOR_DB_PATH)}/{Settings.COLLECTION_NAME}"
+    
+    if rebuild:
+        try:
+            chroma_client.delete_collection(name=Settings.COLLECTION_NAME)
+            print(f"已删除现有集合: {Settings.COLLECTION_NAME}（--rebuild）")
+        except Exception:
+            pass
+    
+    collection = chroma_client.get_or_create_collection(name=Settings.COLLECTION_NAME, embedding_function=None)
+    return collection, target
+
+
+def _collection_ids(collection, page_size: int = 1000) -> set:
+    """集合中现有的全部文档块ID（分页读取）"""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)['ids']
+        ids.update(page)
+        offset += len(page)
+        if len(page) < page_size:
+            return ids
+
+
+def _collection_dimension(collection) -> Optional[int]:
+    """集合中已有向量的维度（空集合返回None）"""
+    page = collection.get(include=['embeddings'], limit=1)
+    embeddings = page.get('embeddings')
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    return len(embeddings[0])
+
+
+class StageStats:
+    """流水线各阶段的吞吐统计"""
+    
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_seconds = 0.0  # 各worker在该阶段累计耗时
+    
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.busy_seconds += seconds
+    
+    def report(self, wall_seconds: float) -> str:
+        rate = self.items / wall_seconds if wall_seconds > 0 else 0.0
+        per_worker = self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+        return (f"   {self.name:<7} {self.items:>8} {self.unit:<4} 总吞吐 {rate:>9.1f} {self.unit}/s   "
+                f"单worker {per_worker:>9.1f} {self.unit}/s   累计耗时 {self.busy_seconds:.2f}s")
+
+
+class _FileProgress:
+    """一个文件的新文档块写入进度，全部写入后才更新清单（断点续传的检查点）"""
+    
+    __slots__ = ('relative_path', 'sha256', 'size', 'mtime', 'ids', 'stale_ids', 'pending')
+    
+    def __init__(self, relative_path, sha256, size, mtime, ids, stale_ids, pending):
+        self.relative_path = relative_path
+        self.sha256 = sha256
+        self.size = size
+        self.mtime = mtime
+        self.ids = ids
+        self.stale_ids = stale_ids
+        self.pending = pending
+
+
+async def _run_pipeline(work: List, collection, embeddings, manifest: Manifest, existing_ids: set) -> Dict:
+    """流式入库流水线：解析/切分（进程池）→ 分批 → 嵌入（并发批次）→ 写入
+    
+    各阶段之间是有界队列，内存占用与语料总量无关，只取决于并发度和批大小。
+    每个文件的所有新文档块写入后立即更新清单并定期保存，中途失败后重新运行会跳过已完成的文件；
+    未完成文件中已经写入集合的文档块按ID检测，不会再次嵌入。
+    """
+    loop = asyncio.get_running_loop()
+    stages = {
+        'parse': StageStats('parse', 'file'),
+        'split': StageStats('split', 'chunk'),
+        'embed': StageStats('embed', 'chunk'),
+        'upsert': StageStats('upsert', 'chunk'),
+    }
+    counts = {'processed': 0, 'failed': 0, 'upserted': 0, 'deleted': 0, 'reused': 0}
+    # 解析结果（每项是一个文件的全部文档块）和待嵌入批次都是有界队列，提供反压
+    parsed_queue: asyncio.Queue = asyncio.Queue(maxsize=Settings.KB_PARSE_WORKERS * 2)
+    batch_queue: asyncio.Queue = asyncio.Queue(maxsize=Settings.EMBEDDING_CONCURRENCY)
+    checkpoint = {'files_since_save': 0}
+    
+    def finish_file(progress: _FileProgress):
+        if progress.stale_ids:
+            stale = sorted(progress.stale_ids)
+            collection.delete(ids=stale)
+            counts['deleted'] += len(stale)
+        manifest.update(progress.relative_path, progress.sha256, progress.size, progress.mtime, progress.ids)
+        counts['processed'] += 1
+        checkpoint['files_since_save'] += 1
+        if checkpoint['files_since_save'] >= Settings.KB_CHECKPOINT_FILES:
+            manifest.save()
+            checkpoint['files_since_save'] = 0
+    
+    async def produce(pool: ProcessPoolExecutor):
+        """提交解析任务，同时在途的文件数有上限"""
+        in_flight = asyncio.Semaphore(Settings.KB_PARSE_WORKERS * 2)
         
-        # 如果数据库已存在，先删除
-        if os.path.exists(Settings.VECTOR_DB_PATH) and os.listdir(Settings.VECTOR_DB_PATH):
-            print("检测到已存在的数据库，将覆盖...")
-            import shutil
-            shutil.rmtree(Settings.VECTOR_DB_PATH)
-            os.makedirs(Settings.VECTOR_DB_PATH, exist_ok=True)
-        
-        # 创建新的向量数据库
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=Settings.VECTOR_DB_PATH,
-            collection_name=Settings.COLLECTION_NAME
-        )
+        async def parse_one(relative_path, file_path, stat):
+            try:
+                entry = manifest.entry(relative_path)
+                result = await loop.run_in_executor(
+                    pool, _parse_file, str(file_path), relative_path, entry['sha256'] if entry else None
+                )
+                await parsed_queue.put((result, stat))
+            except Exception as e:
+                # 保留旧的文档块，下次运行再重试
+                print(f"  错误: 无法加载 {file_path}: {e}")
+                counts['failed'] += 1
+            finally:
+                in_flight.release()
         
-        print(f"✅ 知识库初始化完成！")
-        print(f"   向量数据库路径: {Settings.VECTOR_DB_PATH}")
-        print(f"   文档块数量: {len(chunks)}")
-        print(f"   集合名称: {Settings.COLLECTION_NAME}")
+        tasks = []
+        for relative_path, file_path, stat in work:
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(parse_one(relative_path, file_path, stat)))
+        await asyncio.gather(*tasks)
+        await parsed_queue.put(None)
+    
+    async def batch_chunks():
+        """把解析结果中需要嵌入的文档块组装成批次"""
+        batch = []
+        while True:
+            item = await parsed_queue.get()
+            if item is None:
+                break
+            result, stat = item
+            stages['parse'].add(1, result['load_seconds'])
+            relative_path = result['relative_path']
+            entry = manifest.entry(relative_path)
+            if result['unchanged']:
+                # 只是修改时间变了，内容没变
+                manifest.update(relative_path, result['sha256'], stat.st_size, stat.st_mtime_ns, entry['chunk_ids'])
+                continue
+            
+            print(f"  处理: {relative_path}（{len(result['chunks'])} 个文档块）")
+            stages['split'].add(len(result['chunks']), result['split_seconds'])
+            ids = [chunk_id for chunk_id, _, _ in result['chunks']]
+            old_ids = set(entry['chunk_ids']) if entry else set()
+            new_chunks = [chunk for chunk in result['chunks'] if chunk[0] not in old_ids and chunk[0] not in existing_ids]
+            progress = _FileProgress(relative_path, result['sha256'], stat.st_size, stat.st_mtime_ns,
+                                     ids, old_ids - set(ids), len(new_chunks))
+            if not new_chunks:
+                finish_file(progress)
+                continue
+            for chunk in new_chunks:
+                batch.append((progress, chunk))
+                if len(batch) >= Settings.EMBEDDING_BATCH_SIZE:
+                    await batch_queue.put(batch)
+                    batch = []
+        if batch:
+            await batch_queue.put(batch)
+        for _ in range(Settings.EMBEDDING_CONCURRENCY):
+            await batch_queue.put(None)
+    
+    async def embed_and_upsert():
+        while True:
+            batch = await batch_queue.get()
+            if batch is None:
+                return
+            ids = [chunk_id for _, (chunk_id, _, _) in batch]
+            
+            # 上次中断前已经写入的文档块不再嵌入
+            already = set((await asyncio.to_thread(collection.get, ids=ids, include=[]))['ids'])
+            todo = [(progress, chunk) for progress, chunk in batch if chunk[0] not in already]
+            counts['reused'] += len(batch) - len(todo)
+            
+            if todo:
+                started = time.perf_counter()
+                vectors = await embeddings.aembed_documents([text for _, (_, text, _) in todo])
+                stages['embed'].add(len(todo), time.perf_counter() - started)
+                
+                started = time.perf_counter()
+                await asyncio.to_thread(
+                    collection.upsert,
+                    ids=[chunk_id for _, (chunk_id, _, _) in todo],
+                    embeddings=vectors,
+                    documents=[text for _, (_, text, _) in todo],
+                    metadatas=[metadata for _, (_, _, metadata) in todo]
+                )
+                stages['upsert'].add(len(todo), time.perf_counter() - started)
+                counts['upserted'] += len(todo)
+            
+            for progress, _ in batch:
+                progress.pending -= 1
+                if progress.pending == 0:
+                    finish_file(progress)
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=Settings.KB_PARSE_WORKERS) as pool:
+        tasks = [asyncio.create_task(produce(pool)), asyncio.create_task(batch_chunks())]
+        tasks += [asyncio.create_task(embed_and_upsert()) for _ in range(Settings.EMBEDDING_CONCURRENCY)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            # 失败时也保存已完成文件的检查点
+            manifest.save()
+    wall_seconds = time.perf_counter() - started
+    
+    if work:
+        print(f"   流水线耗时 {wall_seconds:.2f}s（解析进程 {Settings.KB_PARSE_WORKERS}，"
+              f"嵌入并发 {Settings.EMBEDDING_CONCURRENCY}，批大小 {Settings.EMBEDDING_BATCH_SIZE}）")
+        for stage in stages.values():
+            print(stage.report(wall_seconds))
+    return counts
+
+
+def init_knowledge_base(documents_dir: str = None, rebuild: bool = False) -> Dict:
+    """
+    增量同步知识库
+    
+    根据入库清单（kb_manifest.py）只处理新增或修改的文件：未变化的文件直接跳过，
+    变化文件中只有新增/修改的文档块需要嵌入并写入（upsert），已删除的文件和消失的文档块按ID删除。
+    处理过程是流式的（见 _run_pipeline），可以中断后继续。
+    
+    Args:
+        documents_dir: 文档目录路径，如果为None则会在当前目录查找data/knowledge_base
+        rebuild: 删除集合后全量重建
+    
+    Returns:
+        本次同步的统计信息
+    """
+    # 确定文档目录
+    if documents_dir is None:
+        documents_dir = "./data/knowledge_base"
+    
+    if not os.path.exists(documents_dir):
+        print(f"文档目录不存在: {documents_dir}")
+        print("请创建该目录并放入文档文件（支持.txt和.pdf格式）")
+        return {}
+    
+    files = _scan_documents(documents_dir)
+    if not files:
+        print("未找到任何文档文件！")
+        print(f"请在 {documents_dir} 目录中放置.txt或.pdf文件")
+        return {}
+    
+    # 带持久化缓存：即使清单丢失，未变化的文档块也不会再调用Embedding API
+    embeddings = create_embeddings()
+    collection, target = _open_collection(rebuild)
+    
+    fingerprint = {
+        'chunk_size': Settings.CHUNK_SIZE,
+        'chunk_overlap': Settings.CHUNK_OVERLAP,
+        'embedding_model': embedding_model_id()
+    }
+    manifest = Manifest(Settings.KB_MANIFEST_PATH, target, fingerprint)
+    if rebuild:
+        manifest.files = {}
+    
+    # ChromaDB 集合的向量维度是固定的，修改 EMBEDDING_DIMENSIONS 后必须重建
+    if not rebuild:
+        stored_dimension = _collection_dimension(collection)
+        if stored_dimension and Settings.EMBEDDING_DIMENSIONS and stored_dimension != Settings.EMBEDDING_DIMENSIONS:
+            raise ValueError(
+                f"Collection has {stored_dimension}-d embeddings but EMBEDDING_DIMENSIONS={Settings.EMBEDDING_DIMENSIONS}, "
+                "please run python init_kb.py --rebuild"
+            )
+    
+    # 没有对应的清单（首次增量入库、清单丢失或集合来自旧版全量重建）：以集合中的实际内容为准
+    existing_ids = _collection_ids(collection) if not manifest.loaded else set()
+    
+    print(f"正在扫描 {documents_dir}（{len(files)} 个文件）...")
+    work = []
+    for relative_path, file_path in files.items():
+        stat = file_path.stat()
+        if not manifest.unchanged(relative_path, stat.st_size, stat.st_mtime_ns):
+            work.append((relative_path, file_path, stat))
+    stats = {'files': len(files), 'skipped': len(files) - len(work), 'removed_files': 0}
+    
+    counts = asyncio.run(_run_pipeline(work, collection, embeddings, manifest, existing_ids))
+    stats.update(counts)
+    stats['skipped'] += len(work) - counts['processed'] - counts['failed']
+    
+    # 已删除的文件，以及集合中不属于任何当前文件的文档块（旧版全量重建留下的随机ID等）
+    to_delete = set()
+    for relative_path in [path for path in manifest.files if path not in files]:
+        print(f"  移除: {relative_path}")
+        to_delete.update(manifest.remove(relative_path))
+        stats['removed_files'] += 1
+    if existing_ids:
+        to_delete.update(existing_ids - manifest.all_chunk_ids())
+    if to_delete:
+        to_delete = sorted(to_delete)
+        print(f"正在删除 {len(to_delete)} 个过期文档块...")
+        for i in range(0, len(to_delete), Settings.EMBEDDING_BATCH_SIZE):
+            collection.delete(ids=to_delete[i:i + Settings.EMBEDDING_BATCH_SIZE])
+        stats['deleted'] += len(to_delete)
+    manifest.save()
+    
+    changed = bool(stats['upserted'] or stats['deleted'])
+    print(f"✅ 知识库同步完成！")
+    print(f"   数据库: {target}")
+    print(f"   文件: {stats['files']} 个（跳过未变化 {stats['skipped']}，处理 {stats['processed']}，"
+          f"失败 {stats['failed']}，移除 {stats['removed_files']}）")
+    print(f"   文档块: 写入 {stats['upserted']}（断点续传复用 {stats['reused']}），删除 {stats['deleted']}，"
+          f"总计 {len(manifest.all_chunk_ids())}")
+    print(f"   集合名称: {Settings.COLLECTION_NAME}")
+    
+    # 导出进程内检索索引（只在 RETRIEVAL_BACKEND=numpy 时导出，需要读取集合中的全部向量）
+    if Settings.RETRIEVAL_BACKEND == 'numpy':
+        if changed or not os.path.exists(Settings.VECTOR_INDEX_PATH):
+            index = export_collection(collection, dtype=Settings.VECTOR_INDEX_DTYPE)
+            index.save(Settings.VECTOR_INDEX_PATH)
+            print(f"   NumPy检索索引: {Settings.VECTOR_INDEX_PATH}（{len(index)} 个向量，{index.dimension}维 {index.dtype}，"
+                  f"每个文档块 {index.bytes_per_vector} 字节）")
+    elif changed:
+        _remove_stale_index(Settings.VECTOR_INDEX_PATH, "NumPy检索索引")
+    # BM25索引（只在 RETRIEVAL_MODE=hybrid 时构建，需要读取集合中的全部文档块）
+    if Settings.RETRIEVAL_MODE == 'hybrid':
+        if changed or not os.path.exists(Settings.BM25_INDEX_PATH):
+            bm25_index = build_from_collection(collection)
+            bm25_index.save(Settings.BM25_INDEX_PATH)
+            print(f"   BM25索引: {Settings.BM25_INDEX_PATH}（{len(bm25_index)} 个文档块，{len(bm25_index.vocabulary)} 个词项）")
+    elif changed:
+        _remove_stale_index(Settings.BM25_INDEX_PATH, "BM25索引")
+    
+    cache_stats = embedding_cache_stats(embeddings)
+    if cache_stats and cache_stats['hits'] + cache_stats['misses']:
+        print(f"   Embedding缓存命中率: {cache_stats['hit_rate']:.1%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})")
+    
+    return stats
+
+
+def _remove_stale_index(path: str, name: str):
+    """集合已变化但当前配置不使用该索引：删除旧索引，之后启用时按缺失重新生成，不会用到过期的索引"""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+        print(f"   已删除过期的{name}: {path}（启用后重新运行 init_kb.py 生成）")
+
+
+def _snapshot(documents_dir: str) -> tuple:
+    """文档目录的状态（文件、大小、修改时间），用于轮询检测变化"""
+    snapshot = []
+    for relative_path, file_path in _scan_documents(documents_dir).items():
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            continue
+        snapshot.append((relative_path, stat.st_size, stat.st_mtime_ns))
+    return tuple(snapshot)
+
+
+def watch_knowledge_base(documents_dir: str = None, interval: float = None):
+    """持续监视文档目录，有文件新增、修改或删除时自动增量同步（Ctrl+C 退出）"""
+    documents_dir = documents_dir or "./data/knowledge_base"
+    interval = interval or Settings.KB_WATCH_INTERVAL_SECONDS
+    
+    init_knowledge_base(documents_dir)
+    last_snapshot = _snapshot(documents_dir)
+    print(f"👀 正在监视 {documents_dir}（每 {interval:g} 秒检查一次，Ctrl+C 退出）")
+    
+    while True:
+        time.sleep(interval)
+        snapshot = _snapshot(documents_dir)
+        if snapshot == last_snapshot:
+            continue
+        print(f"\n检测到文档变化（{time.strftime('%H:%M:%S')}），开始增量同步...")
+        try:
+            init_knowledge_base(documents_dir)
+        except Exception as e:
+            # 监视模式下单次同步失败不退出，下次变化时重试
+            print(f"❌ 同步失败: {e}")
+        last_snapshot = snapshot
+
 
 if __name__ == "__main__":
-    import sys
+    import argparse
     
+    parser = argparse.ArgumentParser(description="增量同步知识库到向量数据库")
     # 可以从命令行参数指定文档目录
-    docs_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    parser.add_argument('documents_dir', nargs='?', default=None, help='文档目录（默认 ./data/knowledge_base）')
+    parser.add_argument('--rebuild', action='store_true', help='删除集合后全量重建')
+    parser.add_argument('--watch', action='store_true', help='持续监视文档目录并自动同步')
+    parser.add_argument('--interval', type=float, default=None, help='监视模式的轮询间隔（秒）')
+    args = parser.parse_args()
     
     try:
-        init_knowledge_base(docs_dir)
+        if args.watch:
+            watch_knowledge_base(args.documents_dir, args.interval)
+        else:
+            init_knowledge_base(args.documents_dir, rebuild=args.rebuild)
+    except KeyboardInterrupt:
+        print("\n已停止")
     except Exception as e:
         print(f"❌ 初始化失败: {e}")
         import traceback
         traceback.print_exc()
-
@@ -0,0 +1,104 @@
+"""知识库增量入库的清单（manifest）
+
+记录每个已入库文件的内容哈希、大小、修改时间以及它的文档块ID。文档块ID由内容哈希得到，
+同样的文本总是得到同样的ID，因此：
+- 大小和修改时间都没变的文件直接跳过（不读取、不切分）
+- 内容变化的文件只嵌入新增/修改的文档块，其余文档块保持不动
+- 文件删除或文档块消失时按ID从集合中删除
+
+清单还记录切分参数和Embedding模型（fingerprint），两者变化时所有文件都重新切分。
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(model: str, relative_path: str, texts: Iterable[str]) -> List[str]:
+    """按内容生成文档块ID（同一文件中重复的文本块加序号区分）
+
+    ID包含Embedding模型，换模型后所有文档块都会重新嵌入
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for text in texts:
+        digest = hashlib.sha256(f"{model}\x00{relative_path}\x00{text}".encode('utf-8')).hexdigest()[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(digest if occurrence == 0 else f"{digest}-{occurrence}")
+    return ids
+
+
+class Manifest:
+    """入库清单：相对路径 -> {'sha256', 'size', 'mtime', 'chunk_ids'}"""
+
+    def __init__(self, path: str, target: str, fingerprint: Dict):
+        """
+        Args:
+            path: 清单文件路径
+            target: 清单对应的集合（换了数据库或集合时旧清单作废）
+            fingerprint: 影响切分和嵌入结果的参数（切分大小、重叠、Embedding模型）
+        """
+        self.path = path
+        self.target = target
+        self.fingerprint = fingerprint
+        self.files: Dict[str, Dict] = {}
+        self.loaded = False  # 是否读到了与当前集合对应的清单
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Failed to read manifest {path}: {e}, treating all files as new")
+                return
+            if data.get('version') == MANIFEST_VERSION and data.get('target') == target:
+                self.files = data.get('files', {})
+                self.loaded = True
+                if data.get('fingerprint') != fingerprint:
+                    # 切分参数或模型变化：保留文档块ID（用于删除旧文档块），但所有文件都要重新处理
+                    print("[WARNING] Chunking parameters or embedding model changed, re-processing all files")
+                    for entry in self.files.values():
+                        entry.update(sha256=None, size=-1, mtime=None)
+
+    def unchanged(self, relative_path: str, size: int, mtime: float) -> bool:
+        """大小和修改时间与清单一致（不需要读取文件）"""
+        entry = self.files.get(relative_path)
+        return entry is not None and entry['size'] == size and entry['mtime'] == mtime
+
+    def entry(self, relative_path: str) -> Optional[Dict]:
+        return self.files.get(relative_path)
+
+    def update(self, relative_path: str, sha256: str, size: int, mtime: float, ids: List[str]):
+        self.files[relative_path] = {'sha256': sha256, 'size': size, 'mtime': mtime, 'chunk_ids': ids}
+
+    def remove(self, relative_path: str) -> List[str]:
+        """从清单中移除文件，返回它的文档块ID"""
+        entry = self.files.pop(relative_path, None)
+        return entry['chunk_ids'] if entry else []
+
+    def all_chunk_ids(self) -> set:
+        return {chunk_id for entry in self.files.values() for chunk_id in entry['chunk_ids']}
+
+    def save(self):
+        """先写临时文件再替换，中途退出不会留下损坏的清单"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'target': self.target,
+                'fingerprint': self.fingerprint,
+                'files': self.files
+            }, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,91 @@
+"""知识库文档块的索引元数据
+
+init_kb.py 入库时为每个文档块写入：
+- stage_bucket: 'assessment' / 'support' / 'general' / 'other'，检索时按对话阶段过滤（where 条件）
+- category: 内容类别（返回给前端的来源信息）
+- source_file: 文件名
+
+三个字段都从文件相对于知识库目录的路径（入库清单中的 relative_path）推导，知识库目录之上的路径
+（如部署在 /srv/support-bot/ 下）不会影响分组。
+检索时不再对每个来源路径做字符串解析；旧集合中没有这些字段的文档块仍然可以从 source 路径推导。
+"""
+from typing import Dict, List, Optional
+
+# 各对话阶段可以使用的 stage_bucket（general 目录不特定于任何阶段）
+STAGE_BUCKETS: Dict[str, List[str]] = {
+    'reflection': ['assessment', 'general'],  # 理解阶段：评判类内容
+    'support': ['support', 'general'],  # 引导阶段：建议类内容
+}
+
+
+def relative_source(source_path: str) -> str:
+    """旧集合的 source 是入库时的完整路径，取知识库目录（knowledge_base）之后的部分"""
+    path = (source_path or '').replace('\\', '/')
+    return path.rsplit('/knowledge_base/', 1)[-1]
+
+
+def stage_bucket(relative_path: str) -> str:
+    """根据文件在知识库目录中的相对路径确定文档块所属的阶段分组"""
+    source_lower = (relative_path or '').lower()
+    if 'assessment' in source_lower:
+        return 'assessment'
+    if 'support' in source_lower:
+        return 'support'
+    if 'general' in source_lower:
+        return 'general'
+    return 'other'
+
+
+def category(source_path: str) -> str:
+    """从文件路径提取内容类别"""
+    if not source_path:
+        return "unknown"
+
+    source_lower = source_path.lower()
+
+    if 'depression' in source_lower:
+        if 'assessment' in source_lower:
+            return "depression_symptoms"
+        elif 'support' in source_lower:
+            return "depression_treatment"
+        return "depression"
+    elif 'loneliness' in source_lower or 'friendship' in source_lower:
+        return "loneliness_friendship"
+    elif 'exercise' in source_lower or 'motivation' in source_lower:
+        return "exercise_motivation"
+    elif 'anxiety' in source_lower:
+        return "anxiety"
+    elif 'stress' in source_lower:
+        return "stress"
+    elif 'general' in source_lower:
+        return "general_mental_health"
+    else:
+        return "mental_health"
+
+
+def source_file(source_path: str) -> str:
+    """来源路径中的文件名（兼容Windows路径）"""
+    return (source_path or 'Unknown').replace('\\', '/').split('/')[-1]
+
+
+def chunk_metadata(relative_path: str) -> Dict[str, str]:
+    """入库时为文档块生成的索引元数据（relative_path 是入库清单中的相对路径）"""
+    return {
+        'stage_bucket': stage_bucket(relative_path),
+        'category': category(relative_path),
+        'source_file': source_file(relative_path),
+    }
+
+
+def stage_filter(stage: str) -> Optional[Dict]:
+    """对话阶段对应的 where 过滤条件，不需要过滤时返回None"""
+    buckets = STAGE_BUCKETS.get(stage)
+    if not buckets:
+        return None
+    return {'stage_bucket': {'$in': buckets}}
+
+
+def in_stage(metadata: Dict, stage: str) -> bool:
+    """文档块是否属于该阶段（旧集合没有 stage_bucket 字段时从 source 推导）"""
+    bucket = metadata.get('stage_bucket') or stage_bucket(relative_source(metadata.get('source', '')))
+    return bucket in STAGE_BUCKETS.get(stage, [bucket])
@@ -0,0 +1,174 @@
+"""本地语言检测（不调用API，微秒级）
+
+两层判断：
+1. Unicode 字符区段：中文、日文、韩文、阿拉伯文、俄文、印地语这类有独特文字的语言直接识别
+2. 拉丁字母语言（en/fr/es/de/it/pt）：字符三元组（trigram）朴素贝叶斯模型
+
+模型在导入时由下面的小语料构建（几毫秒），不需要任何模型文件。
+返回 (语言代码, 置信度)，调用方根据置信度决定是否还需要LLM确认。
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Tuple
+
+# 各语言的种子语料：日常对话和情绪表达，贴近本应用的真实输入
+_SEED_CORPORA = {
+    'en': """
+        I have been feeling really down lately and I don't know what to do. I can't sleep at night
+        and I feel tired all the time. My friends don't understand me and I feel so alone. Work is
+        stressful and I am worried about my family. Sometimes I think nobody would care if I was gone.
+        How can I stop feeling this way? What should I do when I feel anxious? I just want someone to
+        talk to. Thank you for listening, it helps to share what is on my mind. It's been a hard week,
+        everything feels heavy and I have no energy to get out of bed in the morning. I would like to
+        feel better and find some motivation again, but it is difficult when you are always sad.
+        Hello there, please help me. Hey, good morning, how are you doing today?
+    """,
+    'fr': """
+        Je me sens vraiment triste ces derniers temps et je ne sais pas quoi faire. Je n'arrive pas à
+        dormir la nuit et je suis fatigué tout le temps. Mes amis ne me comprennent pas et je me sens
+        tellement seul. Le travail est stressant et je m'inquiète pour ma famille. Parfois je pense que
+        personne ne s'en soucierait si je n'étais plus là. Comment est-ce que je peux arrêter de me sentir
+        comme ça ? Qu'est-ce que je dois faire quand je suis anxieux ? J'ai juste besoin de parler à
+        quelqu'un. Merci de m'écouter, ça aide de partager ce que j'ai sur le cœur. C'était une semaine
+        difficile, tout me paraît lourd et je n'ai pas l'énergie de sortir du lit le matin.
+        Bonjour, salut, aidez-moi s'il vous plaît. Bonsoir, comment allez-vous aujourd'hui ?
+    """,
+    'es': """
+        Me he sentido muy triste últimamente y no sé qué hacer. No puedo dormir por la noche y estoy
+        cansado todo el tiempo. Mis amigos no me entienden y me siento muy solo. El trabajo es estresante
+        y estoy preocupado por mi familia. A veces pienso que a nadie le importaría si yo no estuviera.
+        ¿Cómo puedo dejar de sentirme así? ¿Qué debo hacer cuando tengo ansiedad? Solo quiero hablar con
+        alguien. Gracias por escucharme, me ayuda compartir lo que tengo en la cabeza. Ha sido una semana
+        difícil, todo se siente pesado y no tengo energía para levantarme de la cama por la mañana. Hola,
+        quiero sentirme mejor y encontrar otra vez la motivación, pero es difícil cuando siempre estás mal.
+    """,
+    'de': """
+        Ich fühle mich in letzter Zeit wirklich niedergeschlagen und weiß nicht, was ich tun soll. Ich
+        kann nachts nicht schlafen und bin die ganze Zeit müde. Meine Freunde verstehen mich nicht und
+        ich fühle mich so allein. Die Arbeit ist stressig und ich mache mir Sorgen um meine Familie.
+        Manchmal denke ich, dass es niemanden interessieren würde, wenn ich nicht mehr da wäre. Wie kann
+        ich aufhören, mich so zu fühlen? Was soll ich tun, wenn ich Angst habe? Ich möchte einfach mit
+        jemandem reden. Danke, dass du zuhörst, es hilft, darüber zu sprechen. Es war eine schwere Woche,
+        alles fühlt sich schwer an und ich habe morgens keine Energie, um aufzustehen. Hallo, guten Tag.
+    """,
+    'it': """
+        Mi sento davvero giù ultimamente e non so cosa fare. Non riesco a dormire la notte e sono stanco
+        tutto il tempo. I miei amici non mi capiscono e mi sento così solo. Il lavoro è stressante e sono
+        preoccupato per la mia famiglia. A volte penso che a nessuno importerebbe se non ci fossi più.
+        Come posso smettere di sentirmi così? Cosa dovrei fare quando sono ansioso? Voglio solo parlare
+        con qualcuno. Grazie per avermi ascoltato, mi aiuta condividere quello che ho nella testa. È stata
+        una settimana difficile, tutto sembra pesante e la mattina non ho l'energia per alzarmi dal letto.
+        Ciao, vorrei stare meglio e ritrovare la motivazione, ma è difficile quando sei sempre triste.
+    """,
+    'pt': """
+        Tenho me sentido muito triste ultimamente e não sei o que fazer. Não consigo dormir à noite e fico
+        cansado o tempo todo. Meus amigos não me entendem e me sinto tão sozinho. O trabalho é estressante
+        e estou preocupado com a minha família. Às vezes penso que ninguém se importaria se eu não estivesse
+        aqui. Como posso parar de me sentir assim? O que devo fazer quando fico ansioso? Só quero conversar
+        com alguém. Obrigado por me ouvir, ajuda compartilhar o que está na minha cabeça. Foi uma semana
+        difícil, tudo parece pesado e não tenho energia para sair da cama de manhã. Olá, eu quero me sentir
+        melhor e encontrar motivação de novo, mas é difícil quando você está sempre para baixo.
+    """,
+}
+
+# 有独特文字的语言：(语言代码, 字符区段正则)。日文的假名要先于汉字判断
+_SCRIPT_PATTERNS = [
+    ('ja', re.compile(r'[぀-ゟ゠-ヿ]')),
+    ('ko', re.compile(r'[가-힯]')),
+    ('ar', re.compile(r'[؀-ۿ]')),
+    ('ru', re.compile(r'[Ѐ-ӿ]')),
+    ('hi', re.compile(r'[ऀ-ॿ]')),
+]
+_CHINESE_CHARS = re.compile(r'[一-鿿]')
+_LATIN_LETTERS = re.compile(r"[a-zà-öø-ÿ]+")
+_ANY_LETTER = re.compile(r'[^\W\d_]')
+
+# 概率归一化时的缩放系数（三元组对数似然差的“温度”），越小越保守
+_SCORE_SCALE = 0.6
+
+
+def _trigrams(text: str) -> Counter:
+    """提取带词边界填充的字符三元组"""
+    grams = Counter()
+    for word in _LATIN_LETTERS.findall(text.lower()):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams[padded[i:i + 3]] += 1
+    return grams
+
+
+def _build_profiles() -> Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+    """由种子语料构建每种语言的三元组对数概率表（加一平滑）"""
+    counts = {lang: _trigrams(corpus) for lang, corpus in _SEED_CORPORA.items()}
+    vocabulary_size = len(set().union(*counts.values())) + 1
+
+    profiles = {}
+    unseen = {}
+    for lang, grams in counts.items():
+        total = sum(grams.values()) + vocabulary_size
+        profiles[lang] = {gram: math.log((count + 1) / total) for gram, count in grams.items()}
+        unseen[lang] = math.log(1 / total)
+    return profiles, unseen
+
+
+_PROFILES, _UNSEEN_LOGPROB = _build_profiles()
+
+
+def _detect_latin(text: str) -> Tuple[str, float]:
+    """拉丁字母语言的三元组模型判断"""
+    grams = _trigrams(text)
+    if not grams:
+        return 'other', 0.0
+
+    scores = {}
+    for lang, profile in _PROFILES.items():
+        unseen = _UNSEEN_LOGPROB[lang]
+        scores[lang] = sum(profile.get(gram, unseen) * count for gram, count in grams.items())
+
+    best_lang = max(scores, key=scores.get)
+    best_score = scores[best_lang]
+    normalizer = sum(math.exp((score - best_score) * _SCORE_SCALE) for score in scores.values())
+    confidence = 1.0 / normalizer
+
+    # 文本的三元组大多不在语料中（例如荷兰语、越南语），说明不属于这六种语言，降低置信度
+    total = sum(grams.values())
+    covered = sum(count for gram, count in grams.items() if gram in _PROFILES[best_lang])
+    confidence *= min(1.0, 0.25 + covered / total)
+
+    return best_lang, confidence
+
+
+def detect_language(text: str) -> Tuple[str, float]:
+    """本地检测文本语言
+
+    Args:
+        text: 要检测的文本
+
+    Returns:
+        (语言代码, 置信度0-1)。语言代码为 'zh'/'ja'/'ko'/'ar'/'ru'/'hi'/'en'/'fr'/'es'/'de'/'it'/'pt'，
+        无法判断时返回 ('other', 0.0)
+    """
+    if not text or not text.strip():
+        return 'other', 0.0
+
+    # === 有独特文字的语言 ===
+    for language, pattern in _SCRIPT_PATTERNS:
+        if pattern.search(text):
+            return language, 0.99
+
+    chinese_chars = len(_CHINESE_CHARS.findall(text))
+    if chinese_chars > 0:
+        total_readable_chars = chinese_chars + sum(len(word) for word in _LATIN_LETTERS.findall(text.lower()))
+        chinese_ratio = chinese_chars / total_readable_chars
+        if chinese_ratio > 0.3:
+            return 'zh', min(0.99, 0.5 + chinese_ratio / 2)
+
+    # 其他未覆盖的文字（希腊文、泰文等）交给LLM判断
+    letters = _ANY_LETTER.findall(text)
+    latin_letters = sum(len(word) for word in _LATIN_LETTERS.findall(text.lower()))
+    if not letters or latin_letters < len(letters) / 2:
+        return 'other', 0.0
+
+    # === 拉丁字母语言 ===
+    return _detect_latin(text)
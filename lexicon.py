@@ -0,0 +1,106 @@
+"""关键词词库与单遍匹配
+
+情绪识别、后备阶段检测、检索主题检测和倾听阶段回应原来各自用 `for kw in 列表: if kw in message`
+扫描消息，每条消息要做几百次子串查找。这里把所有关键词登记在一个词库里（按"类别"分组），
+导入时编译成一个正则，一遍扫描得到全部命中，各分析函数只读取自己关心的类别。
+
+匹配语义与原来的子串查找完全一致（不区分词边界，重叠的关键词都算命中）：
+正则在每个位置用前瞻取最长的关键词，再通过"子串闭包"补上作为其子串的较短关键词
+（例如命中 'depressed' 时同时命中 'depress'）。
+
+新增语言或关键词时只需修改 KEYWORD_REGISTRY。
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+# 类别 -> 关键词（有序：first() 按这里的顺序返回第一个命中的关键词）
+KEYWORD_REGISTRY: Dict[str, List[str]] = {
+    # === 情绪识别（_analyze_emotion_intensity）===
+    'emotion.sadness': ['难过', '伤心', '悲伤', '沮丧', '失落', '失望', 'sad', 'sorrow', 'grief', 'upset'],
+    'emotion.anxiety': ['焦虑', '担心', '害怕', '紧张', '不安', '恐慌', 'anxious', 'worried', 'afraid', 'nervous'],
+    'emotion.depression': ['抑郁', '低落', '疲惫', '累', '没兴趣', '没动力', 'depressed', 'low', 'tired', 'exhausted'],
+    'emotion.hopelessness': ['绝望', '没希望', '无望', '不值得', 'hopeless', 'no hope', 'worthless'],
+    'intensity_high.sadness': ['非常', '极其', '极度', 'really', 'extremely', 'very'],
+    'intensity_medium.sadness': ['很', '比较', '有点', 'quite', 'rather'],
+    'intensity_high.anxiety': ['非常', '极度', 'really', 'extremely'],
+    'intensity_medium.anxiety': ['很', '比较', 'quite'],
+    'intensity_high.depression': ['严重', '非常', '极度', 'seriously', 'severely'],
+    'intensity_medium.depression': ['有点', '比较', 'quite'],
+    'intensity_high.hopelessness': ['非常', '完全', 'totally', 'completely'],
+    'intensity_medium.hopelessness': ['有点', '有时', 'sometimes'],
+    'duration': ['一直', '总是', '持续', '很久', '很长时间', 'always', 'constantly', 'for a long time'],
+
+    # === 后备阶段检测（_fallback_stage_detection）===
+    'stage.support': ['怎么办', '如何', '建议', '方法', '帮助', '治疗', '资源', 'how to', 'what should', 'suggest', 'advice'],
+    'stage.reflection': ['感觉', '感到', '觉得', '难过', '焦虑', '抑郁', 'feel', 'sad', 'anxious', 'depressed'],
+
+    # === 检索主题检测（_build_semantic_search_query）===
+    'topic.loneliness': ['lonely', 'loneliness', 'friend', 'friends', 'friendship',
+                         'social', 'isolated', 'isolation', 'connection', 'connect',
+                         'alone', 'companionship', 'relationship', 'relationships'],
+    'topic.depression': ['depress', 'depressed', 'depression', 'hopeless', 'hopelessness',
+                         'worthless', 'suicide', 'suicidal', 'kill myself', 'want to die'],
+    'topic.anxiety': ['anxiety', 'anxious', 'worry', 'worried', 'panic', 'stress', 'stressed'],
+
+    # === 倾听阶段的情绪确认（_generate_empathy_response）===
+    'empathy.en': ['sad', 'anxious', 'pain', 'afraid', 'lonely', 'hopeless', 'confused', 'tired', 'depressed'],
+    'empathy.zh': ['难过', '焦虑', '痛苦', '害怕', '孤独', '绝望', '困惑', '累', '抑郁'],
+}
+
+
+class KeywordHits:
+    """一条消息的全部命中结果"""
+
+    __slots__ = ('keywords', '_lexicon')
+
+    def __init__(self, keywords: FrozenSet[str], lexicon: 'Lexicon'):
+        self.keywords = keywords
+        self._lexicon = lexicon
+
+    def matched(self, category: str) -> List[str]:
+        """该类别中命中的关键词（按词库顺序）"""
+        return [keyword for keyword in self._lexicon.categories.get(category, ()) if keyword in self.keywords]
+
+    def any(self, category: str) -> bool:
+        return any(keyword in self.keywords for keyword in self._lexicon.categories.get(category, ()))
+
+    def count(self, category: str) -> int:
+        """该类别中命中的不同关键词数"""
+        return len(self.matched(category))
+
+    def first(self, category: str) -> Optional[str]:
+        """该类别中按词库顺序第一个命中的关键词"""
+        for keyword in self._lexicon.categories.get(category, ()):
+            if keyword in self.keywords:
+                return keyword
+        return None
+
+
+class Lexicon:
+    """编译后的词库：一个前瞻正则 + 子串闭包"""
+
+    def __init__(self, registry: Dict[str, Iterable[str]]):
+        # 同一类别内去重并保持顺序
+        self.categories = {category: list(dict.fromkeys(k.lower() for k in keywords))
+                           for category, keywords in registry.items()}
+        vocabulary = sorted({k for keywords in self.categories.values() for k in keywords}, key=len, reverse=True)
+
+        # 较长的关键词排在前面，前瞻在每个位置取到该位置开始的最长关键词
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(k) for k in vocabulary) + '))')
+        # 每个关键词 -> 词库中所有是它子串的关键词（含自身）
+        self._closure = {k: frozenset(other for other in vocabulary if other in k) for k in vocabulary}
+
+    def scan(self, text: str) -> KeywordHits:
+        """一遍扫描（不区分大小写），返回所有命中的关键词"""
+        found = set()
+        for longest in set(self._pattern.findall(text.lower())):
+            found |= self._closure[longest]
+        return KeywordHits(frozenset(found), self)
+
+
+LEXICON = Lexicon(KEYWORD_REGISTRY)
+
+
+def scan_keywords(text: str) -> KeywordHits:
+    """用全局词库扫描文本"""
+    return LEXICON.scan(text or '')
@@ -0,0 +1,467 @@
+"""预渲染的多语言静态消息目录
+
+危机响应和"知识库中没有相关内容"提示都是固定文本，只随 语言 × 省份 × 是否有明确计划 变化。
+build_catalog.py 离线把它们翻译成所有支持的语言并写入带版本的目录文件，
+运行时直接从目录取用：危机响应零LLM调用，也不会出现翻译时漏掉电话号码的情况。
+
+目录文件中记录源文本的哈希，源文本（模板、各省资源）修改后旧目录自动失效，回退到在线翻译。
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+# 目录文件格式版本（格式不兼容地变更时递增）
+CATALOG_VERSION = 1
+
+# 需要预渲染的语言（中文和英文有原生模板，不需要翻译）
+CATALOG_LANGUAGES = ('es', 'fr', 'de', 'it', 'pt', 'ru', 'ja', 'ko', 'ar', 'hi')
+
+# 未指定省份时的键（列出所有省份）
+ALL_PROVINCES = 'ALL'
+
+# 知识库中没有相关内容时的提示（reflection/support阶段）
+NO_KB_RESPONSE_EN = "I understand your question. However, I don't currently have content in my knowledge base that directly relates to your question. To ensure I can provide you with accurate and helpful assistance, I suggest:\n\n1. Rephrase your question using more specific keywords\n2. Break the question down into smaller parts\n3. If you need urgent mental health support, please seek help from a mental health professional\n\nIf you have other mental health-related questions, I'm happy to help by finding relevant information from my knowledge base."
+
+# 静态消息（名称 -> 英文原文），目录为每种语言保存一份译文
+STATIC_MESSAGES_EN = {
+    'no_kb': NO_KB_RESPONSE_EN,
+}
+
+# 加拿大各省资源
+PROVINCIAL_RESOURCES = {
+    'BC': {
+        'name_zh': '不列颠哥伦比亚省',
+        'name_en': 'British Columbia',
+        'resources_zh': [
+            'HealthLink BC: 811',
+            'BC Mental Health Support Line: 310-6789（无需区号）',
+            'Bounce Back BC',
+            'www.here2talk.ca（大专学生）'
+        ],
+        'resources_en': [
+            'HealthLink BC: 811',
+            'BC Mental Health Support Line: 310-6789 (no area code needed)',
+            'Bounce Back BC',
+            'www.here2talk.ca (for post-secondary students)'
+        ]
+    },
+    'AB': {
+        'name_zh': '阿尔伯塔省',
+        'name_en': 'Alberta',
+        'resources_zh': [
+            'Health Link: 811',
+            'Mental Health Help Line: 1-877-303-2642',
+            'Addiction Helpline: 1-866-332-2322'
+        ],
+        'resources_en': [
+            'Health Link: 811',
+            'Mental Health Help Line: 1-877-303-2642',
+            'Addiction Helpline: 1-866-332-2322'
+        ]
+    },
+    'SK': {
+        'name_zh': '萨斯喀彻温省',
+        'name_en': 'Saskatchewan',
+        'resources_zh': [
+            'HealthLine: 811',
+            'Saskatchewan Crisis Line: 306-525-5333'
+        ],
+        'resources_en': [
+            'HealthLine: 811',
+            'Saskatchewan Crisis Line: 306-525-5333'
+        ]
+    },
+    'MB': {
+        'name_zh': '曼尼托巴省',
+        'name_en': 'Manitoba',
+        'resources_zh': [
+            'Health Links: 204-788-8200 或 1-888-315-9257',
+            'Klinic Crisis Line: 204-786-8686 或 1-888-322-3019'
+        ],
+        'resources_en': [
+            'Health Links: 204-788-8200 or 1-888-315-9257',
+            'Klinic Crisis Line: 204-786-8686 or 1-888-322-3019'
+        ]
+    },
+    'ON': {
+        'name_zh': '安大略省',
+        'name_en': 'Ontario',
+        'resources_zh': [
+            'Telehealth Ontario: 1-866-797-0000',
+            'ConnexOntario: 1-866-531-2600'
+        ],
+        'resources_en': [
+            'Telehealth Ontario: 1-866-797-0000',
+            'ConnexOntario: 1-866-531-2600'
+        ]
+    },
+    'QC': {
+        'name_zh': '魁北克省',
+        'name_en': 'Quebec',
+        'resources_zh': [
+            'Info-Santé: 811',
+            'Suicide Prevention: 1-866-APPELLE (277-3553)'
+        ],
+        'resources_en': [
+            'Info-Santé: 811',
+            'Suicide Prevention: 1-866-APPELLE (277-3553)'
+        ]
+    },
+    'NB': {
+        'name_zh': '新不伦瑞克省',
+        'name_en': 'New Brunswick',
+        'resources_zh': [
+            'Tele-Care: 811',
+            'Chimo Helpline: 1-800-667-5005'
+        ],
+        'resources_en': [
+            'Tele-Care: 811',
+            'Chimo Helpline: 1-800-667-5005'
+        ]
+    },
+    'NS': {
+        'name_zh': '新斯科舍省',
+        'name_en': 'Nova Scotia',
+        'resources_zh': [
+            '811（24小时护理热线）',
+            'Mental Health Crisis Line: 1-888-429-8167'
+        ],
+        'resources_en': [
+            '811 (24/7 nursing line)',
+            'Mental Health Crisis Line: 1-888-429-8167'
+        ]
+    },
+    'PE': {
+        'name_zh': '爱德华王子岛省',
+        'name_en': 'Prince Edward Island',
+        'resources_zh': [
+            'Health PEI: 811',
+            'Island Help Line: 1-800-218-2885'
+        ],
+        'resources_en': [
+            'Health PEI: 811',
+            'Island Help Line: 1-800-218-2885'
+        ]
+    },
+    'NL': {
+        'name_zh': '纽芬兰和拉布拉多省',
+        'name_en': 'Newfoundland and Labrador',
+        'resources_zh': [
+            'HealthLine: 811',
+            'Mental Health Crisis Line: 1-888-737-4668'
+        ],
+        'resources_en': [
+            'HealthLine: 811',
+            'Mental Health Crisis Line: 1-888-737-4668'
+        ]
+    },
+    'YT': {
+        'name_zh': '育空地区',
+        'name_en': 'Yukon',
+        'resources_zh': [
+            '联系当地健康中心',
+            'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
+        ],
+        'resources_en': [
+            'Contact local health centers',
+            'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
+        ]
+    },
+    'NT': {
+        'name_zh': '西北地区',
+        'name_en': 'Northwest Territories',
+        'resources_zh': [
+            '联系当地健康中心',
+            'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
+        ],
+        'resources_en': [
+            'Contact local health centers',
+            'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
+        ]
+    },
+    'NU': {
+        'name_zh': '努纳武特地区',
+        'name_en': 'Nunavut',
+        'resources_zh': [
+            '联系当地健康中心',
+            'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
+        ],
+        'resources_en': [
+            'Contact local health centers',
+            'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
+        ]
+    }
+}
+
+
+def render_crisis_response(has_explicit_plan: bool, language: str, province: str = None) -> str:
+    """渲染危机响应
+    
+    Args:
+        has_explicit_plan: 是否有明确的自杀计划
+        language: 'zh' 返回中文模板，'en' 返回英文模板；其他语言返回需要翻译的英文原文
+        province: 省份代码，None时列出所有省份
+    """
+
+
+    # 通用全国资源
+    national_zh = [
+        '**988** - 自杀危机热线（拨打或发短信，24/7，免费，双语）',
+        '**1-833-456-4566** - Crisis Services Canada（拨打）或发短信至 **45645**',
+        '**911** - 如果情况紧急，请立即拨打'
+    ]
+
+    national_en = [
+        '**988** - Suicide Crisis Helpline (call or text, 24/7, free, bilingual)',
+        '**1-833-456-4566** - Crisis Services Canada (call) or text **45645**',
+        '**911** - If emergency, call immediately'
+    ]
+
+    # 构建省级资源
+    provincial_section_zh = ""
+    provincial_section_en = ""
+
+    if province and province.upper() in PROVINCIAL_RESOURCES:
+        prov_info = PROVINCIAL_RESOURCES[province.upper()]
+        provincial_section_zh = f"\n\n**{prov_info['name_zh']}资源：**\n" + "\n".join([f"- {r}" for r in prov_info['resources_zh']])
+        provincial_section_en = f"\n\n**{prov_info['name_en']} Resources:**\n" + "\n".join([f"- {r}" for r in prov_info['resources_en']])
+    else:
+        # 如果没有指定省份，列出所有省份
+        provincial_section_zh = "\n\n**各省资源：**\n"
+        provincial_section_en = "\n\n**Provincial Resources:**\n"
+        for prov_code, prov_info in PROVINCIAL_RESOURCES.items():
+            provincial_section_zh += f"\n**{prov_info['name_zh']}：**\n" + "\n".join([f"- {r}" for r in prov_info['resources_zh']]) + "\n"
+            provincial_section_en += f"\n**{prov_info['name_en']}:**\n" + "\n".join([f"- {r}" for r in prov_info['resources_en']]) + "\n"
+
+    # 对于除中文和英文外的所有语言，生成英文回复，然后翻译成用户语言
+    if language not in ['zh', 'en']:
+        # 生成英文危机响应
+        if has_explicit_plan:
+            crisis_response_en = f"""I am deeply concerned about your safety. What you just mentioned worries me very much. Please take immediate action:
+
+🚨 **Seek Help Immediately:**
+
+**National Resources (24/7, Bilingual):**
+{chr(10).join(['- ' + r for r in national_en])}
+- Go to your nearest emergency department
+{provincial_section_en}
+
+**Important:**
+- Your life has value and you deserve help
+- These thoughts are treatable
+- Professionals can help you through this difficult time
+- The pain will pass
+
+Please call **988** now or go to your nearest emergency department. I'm here with you, but you need immediate professional help."""
+        else:
+            crisis_response_en = f"""I am deeply concerned about your safety and mental health. The thoughts you just mentioned worry me very much. Please take immediate action:
+
+🚨 **Seek Professional Help Immediately:**
+
+**National Resources (24/7, Bilingual):**
+{chr(10).join(['- ' + r for r in national_en])}
+- Go to your nearest emergency department
+{provincial_section_en}
+
+**Contact someone you trust**: Tell family or friends what you're going through so they can support you.
+
+**Remember:**
+- You are not alone; many people want to help you
+- These feelings are treatable
+- Your life has value and is worth protecting
+- Professional help can change everything
+
+**Emergency:**
+If these thoughts become stronger or you begin making specific plans, please immediately:
+- Call **988** (Suicide Crisis Helpline)
+- Go to your nearest emergency department
+- Call **911**
+
+Please take action now and contact a mental health professional. Seeking help now is the best thing you can do for yourself. Your life is very important."""
+
+        # 其他语言返回英文原文，由调用方使用预渲染目录或翻译
+        return crisis_response_en
+
+    elif language == 'zh':
+        if has_explicit_plan:
+            return f"""我深深地关心您的安全。您刚才提到的内容让我非常担心。请立即采取以下行动：
+
+🚨 **立即寻求帮助：**
+
+**全国资源（24小时，双语）：**
+{chr(10).join(['- ' + r for r in national_zh])}
+- 前往最近的医院急诊科
+{provincial_section_zh}
+
+**请记住：**
+- 您值得获得帮助，您的生命有价值
+- 这些想法是可以治疗的，您不需要独自承受
+- 专业人员可以帮您度过这个艰难的时刻
+- 即使现在感觉很难，痛苦是会过去的
+
+请现在就拨打 **988** 或前往最近的急诊科。我会陪伴您，但您需要立即获得专业人员的帮助。
+
+您的生命非常重要，请给自己一个获得帮助的机会。"""
+        else:
+            return f"""我深深地关心您的安全和心理健康。您刚才提到的想法让我非常担心。请立即采取以下行动：
+
+🚨 **立即寻求专业帮助：**
+
+**全国资源（24小时，双语）：**
+{chr(10).join(['- ' + r for r in national_zh])}
+- 前往最近的医院急诊科
+{provincial_section_zh}
+
+**联系可信任的人**：告诉家人或朋友您正在经历什么，让他们支持您。
+
+**请记住：**
+- 您并不孤单，有很多人愿意帮助您
+- 这些感受是可以治疗的
+- 您的生命有价值，值得被保护
+- 专业帮助可以改变一切
+
+**紧急情况：**
+如果这些想法变得更强烈，或您开始制订具体计划，请立即：
+- 拨打 **988**（自杀危机热线）
+- 前往最近的医院急诊科
+- 拨打 **911**
+
+请现在就采取行动，联系专业心理医生。现在寻求帮助是您为自己做的最好的事情。您的生命非常重要。"""
+
+    else:  # English
+        if has_explicit_plan:
+            return f"""I am deeply concerned about your safety. What you just mentioned worries me very much. Please take immediate action:
+
+🚨 **Seek Help Immediately:**
+
+**National Resources (24/7, Bilingual):**
+{chr(10).join(['- ' + r for r in national_en])}
+- Go to your nearest emergency department
+{provincial_section_en}
+
+**Remember:**
+- You deserve help, and your life has value
+- These thoughts are treatable, and you don't have to go through this alone
+- Professionals can help you through this difficult time
+- Even though it feels hard now, the pain will pass
+
+Please call **988** now or go to your nearest emergency department. I'm here with you, but you need immediate professional help.
+
+Your life is very important. Please give yourself a chance to get help."""
+        else:
+            return f"""I am deeply concerned about your safety and mental health. The thoughts you just mentioned worry me very much. Please take immediate action:
+
+🚨 **Seek Professional Help Immediately:**
+
+**National Resources (24/7, Bilingual):**
+{chr(10).join(['- ' + r for r in national_en])}
+- Go to your nearest emergency department
+{provincial_section_en}
+
+**Contact someone you trust**: Tell family or friends what you're going through so they can support you.
+
+**Remember:**
+- You are not alone; many people want to help you
+- These feelings are treatable
+- Your life has value and is worth protecting
+- Professional help can change everything
+
+**Emergency:**
+If these thoughts become stronger or you begin making specific plans, please immediately:
+- Call **988** (Suicide Crisis Helpline)
+- Go to your nearest emergency department
+- Call **911**
+
+Please take action now and contact a mental health professional. Seeking help now is the best thing you can do for yourself. Your life is very important."""
+
+
+def crisis_key(language: str, province: Optional[str], has_explicit_plan: bool) -> str:
+    """危机响应在目录中的键"""
+    province = province.upper() if province and province.upper() in PROVINCIAL_RESOURCES else ALL_PROVINCES
+    return f"{language}:{province}:{'plan' if has_explicit_plan else 'ideation'}"
+
+
+def catalog_variants():
+    """目录需要覆盖的所有危机响应组合：(省份, 是否有明确计划)"""
+    for province in [None] + list(PROVINCIAL_RESOURCES):
+        for has_explicit_plan in (True, False):
+            yield province, has_explicit_plan
+
+
+def source_hash() -> str:
+    """所有源文本的哈希，用于判断目录是否过期"""
+    digest = hashlib.sha256()
+    for province, has_explicit_plan in catalog_variants():
+        digest.update(render_crisis_response(has_explicit_plan, 'source', province).encode('utf-8'))
+    for name in sorted(STATIC_MESSAGES_EN):
+        digest.update(f"{name}\x00{STATIC_MESSAGES_EN[name]}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# 电话号码、短信号码（至少3位数字，可带连字符）和网址
+_CONTACT_TOKEN = re.compile(r'\d[\d-]*\d{2,}|www\.[\w.-]*\w|https?://[^\s)]*[^\s).,]')
+_DASHES = dict.fromkeys(map(ord, '‐‑‒–—−－'), '-')
+
+
+def _normalize_digits(text: str) -> str:
+    """把全角、阿拉伯-印度等各种数字统一为ASCII数字，各种连字符统一为'-'"""
+    return ''.join(
+        str(unicodedata.digit(ch)) if ch.isdigit() and not ch.isascii() else ch
+        for ch in text.translate(_DASHES)
+    )
+
+
+def contact_tokens(text: str) -> List[str]:
+    """提取文本中的联系方式（去重，保持出现顺序）"""
+    return list(dict.fromkeys(_CONTACT_TOKEN.findall(_normalize_digits(text))))
+
+
+def missing_contacts(source: str, translated: str) -> List[str]:
+    """返回原文中有、译文中缺失的联系方式"""
+    normalized = _normalize_digits(translated).lower()
+    return [token for token in contact_tokens(source) if token.lower() not in normalized]
+
+
+class MessageCatalog:
+    """运行时的消息目录（只读）"""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.crisis: Dict[str, str] = data.get('crisis', {})
+        self.messages: Dict[str, Dict[str, str]] = data.get('messages', {})
+        self.built_at = data.get('built_at')
+
+    def __len__(self) -> int:
+        return len(self.crisis) + sum(len(translations) for translations in self.messages.values())
+
+    def crisis_response(self, has_explicit_plan: bool, language: str, province: str = None) -> Optional[str]:
+        """预渲染的危机响应，目录中没有时返回None"""
+        return self.crisis.get(crisis_key(language, province, has_explicit_plan))
+
+    def message(self, name: str, language: str) -> Optional[str]:
+        """预渲染的静态消息，目录中没有时返回None"""
+        return self.messages.get(name, {}).get(language)
+
+
+def load_catalog(path: str) -> MessageCatalog:
+    """加载目录文件；文件不存在、格式版本不符或源文本已修改时返回空目录（回退到在线翻译）"""
+    if not os.path.exists(path):
+        print(f"[WARNING] Message catalog not found at {path}, static messages will be translated online. "
+              "Run build_catalog.py to pre-render them")
+        return MessageCatalog()
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Failed to load message catalog {path}: {e}")
+        return MessageCatalog()
+    if data.get('version') != CATALOG_VERSION:
+        print(f"[WARNING] Message catalog version {data.get('version')} != {CATALOG_VERSION}, ignoring it")
+        return MessageCatalog()
+    if data.get('source_hash') != source_hash():
+        print("[WARNING] Message catalog is stale (source texts changed), ignoring it. Re-run build_catalog.py")
+        return MessageCatalog()
+    return MessageCatalog(data)
@@ -0,0 +1,261 @@
+"""对话流水线的延迟与调用指标（Prometheus文本格式，由 /api/metrics 提供）
+
+- rag_step_duration_seconds：各步骤耗时（语言检测、输入翻译、历史翻译、风险筛查、阶段检测、Embedding、向量检索、生成、回译等）
+- rag_turn_duration_seconds / rag_llm_calls_per_turn：每轮总耗时和LLM调用次数
+- rag_llm_calls_total / rag_llm_call_duration_seconds / rag_llm_tokens_total：按调用位置统计的LLM调用、耗时和输入/输出token
+- rag_cache_events_total：各缓存的命中/未命中
+- rag_fallbacks_total：各种降级处理（LLM调用失败改用本地规则等）的触发次数
+
+所有指标都带 stage 和 language 标签。阶段和语言要到一轮对话中途才知道，所以一轮之内的记录先暂存在
+TurnMetrics 中（通过 contextvars 传给本轮创建的所有任务），本轮结束时再统一打上标签写入；
+不在对话轮次中的记录（如启动时）标签为 none。
+
+实现只依赖标准库：每次记录是一次加锁的字典更新，开销在微秒级。
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 延迟直方图的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 每轮LLM调用次数直方图的桶
+CALLS_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+# 语言标签的取值（其余语言归为 other，避免标签基数失控）
+LANGUAGE_LABELS = frozenset(('en', 'zh', 'es', 'fr', 'de', 'it', 'pt', 'ja', 'ko', 'ar', 'ru', 'hi'))
+
+_NONE = 'none'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                     for labels, value in items)
+        return lines
+
+
+class Histogram:
+    """带标签的直方图（累计桶 + sum + count）"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # 标签 -> 各桶计数 + [+Inf计数, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[len(self.buckets)]
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+STEP_SECONDS = Histogram('rag_step_duration_seconds', 'Duration of each chat pipeline step',
+                         ('step', 'stage', 'language'), LATENCY_BUCKETS)
+TURN_SECONDS = Histogram('rag_turn_duration_seconds', 'Duration of a whole chat turn',
+                         ('stage', 'language'), LATENCY_BUCKETS)
+TURN_LLM_CALLS = Histogram('rag_llm_calls_per_turn', 'Number of LLM calls made in one chat turn',
+                           ('stage', 'language'), CALLS_BUCKETS)
+LLM_CALLS = Counter('rag_llm_calls_total', 'LLM calls by call site',
+                    ('call_site', 'stage', 'language'))
+LLM_CALL_SECONDS = Histogram('rag_llm_call_duration_seconds', 'Duration of LLM calls by call site',
+                             ('call_site', 'stage', 'language'), LATENCY_BUCKETS)
+LLM_TOKENS = Counter('rag_llm_tokens_total', 'LLM tokens by call site and direction (input, cached_input, output)',
+                     ('call_site', 'direction', 'stage', 'language'))
+CACHE_EVENTS = Counter('rag_cache_events_total', 'Cache lookups by cache and result',
+                       ('cache', 'result', 'stage', 'language'))
+FALLBACKS = Counter('rag_fallbacks_total', 'Fallback activations by reason',
+                    ('reason', 'stage', 'language'))
+
+_METRICS = (STEP_SECONDS, TURN_SECONDS, TURN_LLM_CALLS, LLM_CALLS, LLM_CALL_SECONDS, LLM_TOKENS, CACHE_EVENTS, FALLBACKS)
+
+
+def _usage_tokens(usage) -> Tuple[int, int, int]:
+    """OpenAI usage -> (输入token, 其中命中缓存的token, 输出token)"""
+    if usage is None:
+        return 0, 0, 0
+    cached = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', 0) or 0
+    return getattr(usage, 'prompt_tokens', 0) or 0, cached, getattr(usage, 'completion_tokens', 0) or 0
+
+
+class TurnMetrics:
+    """一轮对话中的记录，结束时统一打上阶段和语言标签"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stage = _NONE
+        self.language = _NONE
+        self.llm_calls = 0
+        self._records: List[Tuple] = []
+
+    def label(self, stage: Optional[str] = None, language: Optional[str] = None):
+        """设置本轮的阶段和语言（知道时即可调用，后设置的覆盖先设置的）"""
+        if stage:
+            self.stage = stage
+        if language:
+            self.language = language if language in LANGUAGE_LABELS else 'other'
+
+    def add(self, record: Tuple):
+        if record[0] == 'llm_call':
+            self.llm_calls += 1
+        self._records.append(record)
+
+    def finish(self):
+        labels = (self.stage, self.language)
+        for record in self._records:
+            _apply(record, labels)
+        TURN_SECONDS.observe(labels, time.perf_counter() - self.started)
+        TURN_LLM_CALLS.observe(labels, self.llm_calls)
+
+
+_current_turn: contextvars.ContextVar[Optional[TurnMetrics]] = contextvars.ContextVar('turn_metrics', default=None)
+
+
+def _apply(record: Tuple, labels: Tuple[str, str]):
+    kind = record[0]
+    if kind == 'step':
+        STEP_SECONDS.observe((record[1], *labels), record[2])
+    elif kind == 'llm_call':
+        _, call_site, seconds, usage = record
+        LLM_CALLS.inc((call_site, *labels))
+        LLM_CALL_SECONDS.observe((call_site, *labels), seconds)
+        _apply(('llm_tokens', call_site, usage), labels)
+    elif kind == 'llm_tokens':
+        _, call_site, usage = record
+        for direction, count in zip(('input', 'cached_input', 'output'), _usage_tokens(usage)):
+            if count:
+                LLM_TOKENS.inc((call_site, direction, *labels), count)
+    elif kind == 'cache':
+        CACHE_EVENTS.inc((record[1], record[2], *labels))
+    elif kind == 'fallback':
+        FALLBACKS.inc((record[1], *labels))
+
+
+def _record(record: Tuple):
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add(record)
+    else:
+        _apply(record, (_NONE, _NONE))
+
+
+def begin_turn() -> TurnMetrics:
+    """开始记录一轮对话（本轮之后创建的任务共享同一个 TurnMetrics）"""
+    turn = TurnMetrics()
+    _current_turn.set(turn)
+    return turn
+
+
+def end_turn(turn: TurnMetrics):
+    """结束本轮并写入指标"""
+    if _current_turn.get() is turn:
+        _current_turn.set(None)
+    turn.finish()
+
+
+def label_turn(stage: Optional[str] = None, language: Optional[str] = None):
+    """给当前这一轮设置阶段和语言标签"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.label(stage, language)
+
+
+def observe_step(step: str, seconds: float):
+    _record(('step', step, seconds))
+
+
+def record_llm_call(call_site: str, seconds: float, usage=None):
+    """记录一次LLM调用（usage 为响应中的用量，流式调用的用量另外用 record_llm_usage 记录）"""
+    _record(('llm_call', call_site, seconds, usage))
+
+
+def record_llm_usage(call_site: str, usage):
+    _record(('llm_tokens', call_site, usage))
+
+
+def record_cache(cache: str, hit: bool):
+    _record(('cache', cache, 'hit' if hit else 'miss'))
+
+
+def record_fallback(reason: str):
+    _record(('fallback', reason))
+
+
+class timer:
+    """记录一段代码（可以包含await）的耗时：with metrics.timer('embedding'): ..."""
+
+    __slots__ = ('step', 'started')
+
+    def __init__(self, step: str):
+        self.step = step
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_step(self.step, time.perf_counter() - self.started)
+        return False
+
+
+def render() -> str:
+    """Prometheus文本格式（text/plain; version=0.0.4）"""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,215 +1,497 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 try:
     from langchain_chroma import Chroma
 except ImportError:
     # 兼容旧版本
     from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from config import Settings
+from language_detector import detect_language as detect_language_locally
+from session_store import create_session_store, new_session, new_session_id
+from translation_cache import TranslationCache, make_translation_key
+from embedding_cache import create_embeddings, embedding_cache_stats
+from risk_screening import RiskScreener, crisis_language
+from lexicon import KeywordHits, scan_keywords
+from vector_index import NumpyVectorIndex, distances
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from response_cache import ResponseCache
+from fast_path import FastPath
+from history_manager import HistoryManager, truncate_tokens
+import metrics
+from kb_metadata import category as kb_category, in_stage, relative_source, source_file, stage_filter
+from message_catalog import NO_KB_RESPONSE_EN, PROVINCIAL_RESOURCES, load_catalog, render_crisis_response
 import chromadb
 import os
 import warnings
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Callable, Awaitable, Any, Optional, AsyncIterator
+from dataclasses import dataclass
+from langchain_core.documents import Document
+import asyncio
+import json
+import time
 import re
 
 # 忽略LangChain deprecation警告（如果使用旧版本）
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="langchain")
 
-class RAGEngine:
+# _prepare_turn 返回结果中只供内部使用、不对外返回的字段
+_INTERNAL_TURN_KEYS = ('messages', 'max_tokens', 'target_language', 'language', 'message_en', 'response_en',
+                       'history_summary')
+
+# 步骤图中的步骤名 -> 指标中的步骤名（rag_step_duration_seconds 的 step 标签）
+_STEP_METRIC_NAMES = {
+    'analysis': 'turn_analysis',
+    'language': 'language_detection',
+    'message_en': 'input_translation',
+    'history_en': 'history_translation',
+    'history_context': 'history_budget',
+    'risk': 'risk_screening',
+    'keywords': 'keyword_scan',
+    'emotion': 'emotion_analysis',
+    'stage': 'stage_detection',
+    'docs_reflection': 'retrieval',
+    'docs_support': 'retrieval',
+}
+
+# 轮次分析的结构化输出格式（语言 + 英文翻译 + 对话阶段）
+TURN_ANALYSIS_SCHEMA = {
+    "name": "turn_analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "language": {"type": "string", "description": "ISO 639-1 code of the user's message language"},
+            "message_en": {"type": "string", "description": "The user's message translated to English"},
+            "stage": {"type": "string", "enum": ["empathy", "reflection", "support"]}
+        },
+        "required": ["language", "message_en", "stage"],
+        "additionalProperties": False
+    }
+}
+
+# 预计是英文的消息不需要翻译，分析时不请求 message_en，省去重复输出整条消息的token
+TURN_ANALYSIS_SCHEMA_EN = {
+    "name": "turn_analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "language": TURN_ANALYSIS_SCHEMA["schema"]["properties"]["language"],
+            "stage": TURN_ANALYSIS_SCHEMA["schema"]["properties"]["stage"]
+        },
+        "required": ["language", "stage"],
+        "additionalProperties": False
+    }
+}
+
+# 需要检索知识库的阶段（倾听阶段不使用知识库）
+RETRIEVAL_STAGES = ('reflection', 'support')
+
+# 生成时各阶段的回复指引（放在系统提示词之后，与之一起构成每次请求都相同的静态前缀）
+STAGE_INSTRUCTIONS = {
+    # empathy阶段：专注于倾听，不分享知识库内容
+    # 这个阶段的目标是让用户把心里的不开心讲出来，不要急于分享统计或知识
+    'empathy': """⚠️ **Important: First, analyze the user's message to understand their intent**
+
+**Analyze the message type:**
+- **Simple greeting** (hi, hello, hey, etc.) → Respond naturally: "Hi! How can I help you today?"
+- **Casual conversation starter** → Respond warmly and invite them to share: "How are you doing?"
+- **Actually expressing emotions or distress** → Use empathy and acknowledge their feelings
+
+**Response Guidelines:**
+1. **For simple greetings or casual messages:**
+   - Respond naturally and warmly
+   - Invite them to share: "Is there something on your mind?" or "What brings you here today?"
+   - Keep it simple, friendly, and welcoming
+
+2. **For emotional expressions:**
+   - Acknowledge the emotion you hear (simple 1 sentence, avoid clichés)
+   - Example: "That sounds really hard." or "That must be heavy."
+   - **Don't** say "It sounds like you're really feeling sad right now" (too formal)
+   - **Don't** say "I can feel that you're going through some difficult times" (too long, too official)
+   - Encourage the user to continue expressing (Focus, 1-2 sentences)
+   - Example: "I'm here, tell me more."
+   - Example: "You can say anything."
+   - Example: "Keep going, I'm listening."
+
+3. **Simple response** (Optional, 1 sentence)
+   - "Yeah, I hear you."
+   - Don't say "I understand" or "This is really hard" (too cliché)
+
+4. **Ask a question to continue the conversation** (**Must**, last sentence)
+   - Ask naturally, make them want to keep talking
+   - Examples: "What happened?" "What else would you like to say?" "Want to talk?"
+   - Even if you've already invited sharing, end with a question
+   - Don't ask formal questions like "Would you like to continue sharing?"
+
+⚠️ **Strictly forbidden** (only when user is expressing distress):
+- ❌ Do NOT provide crisis resources or hotlines (988, Talk Suicide Canada, etc.) unless the user explicitly expresses suicidal thoughts or severe crisis
+- ❌ Do NOT share statistics ("many people have", "research shows")
+- ❌ Do NOT quote or reference knowledge base content (completely ignore any knowledge base content if provided)
+- ❌ Do NOT explain reasons (why this happens)
+- ❌ Do NOT give advice or provide resources
+- ❌ Do NOT use professional jargon
+
+✅ **Response should match intent:**
+- Simple greeting → Simple, warm greeting response
+- Emotional expression → Empathetic acknowledgment of their feelings
+- Encourage the user to continue expressing, let them share what's bothering them
+- Let the user know you're here listening
+
+**Important: You MUST end every response with a question** to keep the conversation going:
+- Natural, easy way to ask
+- Open-ended, easy for them to answer
+- Make them want to keep talking
+
+Goal: Understand what the user actually needs - is this a greeting or genuine emotional expression? Respond accordingly. Always end with a question.""",
+    'reflection': """⚠️ Important: You are now an **Understanding Guide**, follow the example style
+
+Your tasks (be natural, like chatting with a friend):
+1. **Acknowledge understanding** (simple 1 sentence)
+   - "I understand." or "Yeah, I know."
+   - Don't say "I understand this feeling", too formal
+
+2. **Naturally share similar experiences** (Key, but be natural)
+   - **Don't** say "the knowledge base mentions" or "an article says" (too stiff)
+   - **Do** like you suddenly remembered something: "Actually, many people have this feeling..."
+   - Or: "I remember reading that many people after a breakup..." (naturally integrate)
+   - **Can** quote specific warm statements, but with natural transition
+   - Example (good): "Actually, many people feel this way after a breakup. I've seen some articles mention, 'Losing someone important is like losing a world.' That's true."
+   - Example (bad): "The knowledge base mentions that post-breakup pain is normal. According to research..."
+
+3. **Give encouragement** (1 sentence, be real)
+   - "You don't have to carry this alone."
+   - "You're already brave." (Don't say "taking that first step", too official)
+   - Short, direct, warm
+
+4. **Ask a question to continue the conversation** (**Must**, last sentence)
+   - Ask naturally, make them want to keep talking
+   - Examples: "What else would you like to say?" "How are you feeling now?" "Want to talk more?"
+   - Don't ask formal: "Would you like to continue sharing?"
+   - Questions should be open-ended, easy to answer
+
+⚠️ Forbidden:
+- ❌ Don't say "the knowledge base mentions" (too stiff)
+- ❌ Don't write "according to research shows" (too academic)
+- ❌ Don't use "according to data", "research shows" (lacks warmth)
+- ❌ Don't act like "I looked up information"
+
+✅ Requirements:
+- ✅ Tone should be like chatting with a friend, not reading materials
+- ✅ Knowledge base content should naturally integrate into conversation, not stiff quotes
+- ✅ Goal is to make them feel understood and "not the only one"
+- ✅ **MUST end every response with a question** to keep the conversation going. Examples: 'What else would you like to say?' 'How are you feeling now?' 'Want to talk more?'""",
+    'support': """⚠️ Important: You are now a **Resource Guide**, follow the example style
+
+Your tasks (be natural, with companionship feeling):
+1. **Respond to their needs first** (Must respond first, don't jump to resources)
+   - If user asks "Can you counsel me?":
+     - Don't say: "I'm not a psychologist, but I can help you find appropriate resources" (too stiff)
+     - Do say: "I wish I could help you more. Although I'm not a professional psychologist, I can chat with you and listen. If you need more professional help, there are some good resources..."
+   - Express willingness to accompany first, then naturally introduce resources
+
+2. **MUST extensively use knowledge base content** (CRITICAL - This is the most important part)
+   - **You MUST reference and cite specific information from the knowledge base content provided with the user's question**
+   - **Use multiple knowledge fragments** - Don't just use one piece of information, combine insights from different fragments
+   - **Cite specific strategies, techniques, examples** from the knowledge base
+   - **Quote or paraphrase key concepts** from the knowledge base content
+   - Examples of good usage:
+     * "Based on what I know, there's a technique called 'empathetic curiosity' that can help..."
+     * "One approach that might work is the 'walk and talk' method - where you..."
+     * "Research shows that movement can release dopamine and serotonin, which..."
+     * "There's a concept called 'keystone habits' - small actions that..."
+   - **Don't** just give generic advice - use the specific content from knowledge base
+   - **Don't** say "the knowledge base mentions" (too stiff), but DO use the actual content naturally
+   - **Integrate multiple points** from different knowledge fragments into your response
+
+3. **Continue companionship** (**Must** have this sentence)
+   - "I'll still be here to chat with you, you can say anything."
+   - "I'll continue listening, anything you want to tell me."
+   - Let user know you're **here to accompany and support them**
+
+4. **Ask a question to continue the conversation** (**Must**, last sentence)
+   - Ask naturally, make them want to keep talking
+   - Examples: "What else would you like to talk about?" "How are you feeling now?" "Is there anything else you'd like to say?"
+   - Don't ask formal: "Would you like to continue our conversation?"
+
+⚠️ Key requirements:
+- ✅ **MOST IMPORTANT: Extensively use knowledge base content** - Reference multiple fragments, cite specific strategies, techniques, and concepts
+- ✅ **Most important is companionship feeling** - make user feel you're still here to support them
+- ✅ **DO NOT provide emergency resources** (988, 1-833-456-4566, 911) unless the user explicitly mentions serious crisis or danger
+- ✅ Focus on providing helpful advice and strategies from the knowledge base
+- ✅ Tone should be real, natural, like a friend sharing helpful information
+- ✅ **MUST end every response with a question** to keep the conversation going. Examples: 'What else would you like to talk about?' 'How are you feeling now?' 'Is there anything else you'd like to say?'""",
+}
+
+# 各阶段知识库内容的标注
+KB_CONTENT_LABELS = {
+    'reflection': 'assessment - evaluation and statistics',
+    'support': 'support - advice and resources',
+}
+
+# 用户语言的友好名称（用于要求模型直接用用户语言回复）
+LANGUAGE_NAMES = {
+    'zh': 'Chinese (Simplified Chinese)',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+    'hi': 'Hindi',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'ru': 'Russian',
+    'ar': 'Arabic',
+}
+
+
+def language_instruction(language: str) -> str:
+    """要求模型完全使用用户语言回复的指示（英文不需要）"""
+    if language == 'en':
+        return ""
+    target_lang_name = LANGUAGE_NAMES.get(language, language)
+    return f"""
+
+**CRITICAL LANGUAGE REQUIREMENT**: 
+The user's input language is {target_lang_name} (language code: {language}). 
+You MUST respond ENTIRELY in {target_lang_name}, NOT in English. 
+- Translate ALL your responses into {target_lang_name}
+- Translate ALL knowledge base content into {target_lang_name}
+- Translate ALL examples and suggestions into {target_lang_name}
+- Do NOT mix languages - use ONLY {target_lang_name}
+- If you use any quotes or examples, translate them to {target_lang_name} as well
+
+This is extremely important - the user expects responses in {target_lang_name}, not English."""
+
+# 句子结束符（中英文标点）及其后的空白，或换行
+_SENTENCE_END = re.compile(r'[.!?。！？]+["\'”’)]*\s+|[。！？]+|\n+')
+
+def _split_complete_sentences(text: str) -> Tuple[List[str], str]:
+    """把流式缓冲区切分为完整句子和剩余的未完结部分"""
+    sentences = []
+    last_end = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[last_end:match.end()])
+        last_end = match.end()
+    return sentences, text[last_end:]
+
+@dataclass
+class TurnContext:
+    """单轮对话的请求级状态
+    
+    RAGEngine 是进程级单例，被并发的请求共享；所有随请求变化的状态都放在这里，
+    沿流水线传递，引擎实例本身保持不可变。
+    """
+    preferred_language: Optional[str] = None  # 用户的首选语言（来自会话或本轮检测），用于无法判断时的回退
+    history_summary: Optional[Dict] = None  # 较早历史的滚动摘要状态（来自会话，本轮折叠新消息时更新）
+
+class PromptUsageStats:
+    """生成调用的提示词token统计（OpenAI usage 中的 cached_tokens 即命中提示词缓存的部分）"""
+    
     def __init__(self):
-        self.client = OpenAI(api_key=Settings.OPENAI_API_KEY)
-        self.embeddings = OpenAIEmbeddings(
-            model=Settings.EMBEDDING_MODEL,
-            openai_api_key=Settings.OPENAI_API_KEY
-        )
-        self.vectorstore = self._load_vectorstore()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cached_requests = 0  # 至少命中一部分缓存的请求数
+    
+    def record(self, prompt_tokens: int, cached_tokens: int):
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        if cached_tokens:
+            self.cached_requests += 1
+    
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cached_ratio': self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            'cached_requests': self.cached_requests
+        }
+
+class StepGraph:
+    """单轮对话的步骤依赖图执行器
+    
+    每个步骤声明自己依赖的步骤，依赖全部完成后立即启动，互不依赖的步骤并发执行
+    （例如：输入翻译与历史翻译、阶段检测与候选阶段的检索）。
+    推测执行的步骤在确定不需要后可以用 cancel() 取消，不再等待它完成。
+    执行结束后可以给出本轮的关键路径，用来定位延迟主要花在哪几步。
+    """
+    
+    def __init__(self):
+        self._steps: Dict[str, Tuple[Callable[[Dict[str, Any]], Awaitable[Any]], Tuple[str, ...]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}  # name -> (开始, 结束)，相对于run()开始的秒数
+        self.stopped_by: Optional[str] = None
+        self.cancelled: set = set()
+    
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]], deps: Tuple[str, ...] = ()):
+        """注册步骤。fn 接收已完成步骤的结果字典，返回本步骤的结果"""
+        for dep in deps:
+            if dep not in self._steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+        self._steps[name] = (fn, tuple(deps))
+    
+    def cancel(self, name: str):
+        """取消尚未完成的步骤（依赖它的步骤随之取消），被取消的步骤不在结果中"""
+        self.cancelled.add(name)
+        task = self._tasks.get(name)
+        if task is not None and not task.done():
+            task.cancel()
+    
+    async def run(self, stop_when: Callable[[str, Any], bool] = None) -> Dict[str, Any]:
+        """执行整个图
+        
+        Args:
+            stop_when: 可选的短路条件 (步骤名, 结果) -> bool，返回True时取消其余未完成的步骤
+                       （例如检测到高风险时不再等待阶段检测和检索）
+        
+        Returns:
+            步骤名 -> 结果 的字典（被取消的步骤不在其中）
+        """
+        started = time.perf_counter()
+        tasks = self._tasks
+        
+        async def run_step(name: str):
+            fn, deps = self._steps[name]
+            for dep in deps:
+                await tasks[dep]
+            if name in self.cancelled:
+                raise asyncio.CancelledError()
+            step_start = time.perf_counter() - started
+            result = await fn(self.results)
+            self.results[name] = result
+            self.timings[name] = (step_start, time.perf_counter() - started)
+            return result
+        
+        for name in self._steps:
+            tasks[name] = asyncio.create_task(run_step(name), name=name)
+        
+        pending = set(tasks.values())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    result = task.result()  # 步骤异常直接向上抛出
+                    if stop_when and stop_when(task.get_name(), result):
+                        self.stopped_by = task.get_name()
+                        return self.results
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        return self.results
+    
+    def critical_path(self) -> List[Tuple[str, float]]:
+        """从最晚完成的步骤沿最晚完成的依赖回溯，返回 [(步骤名, 耗时毫秒), ...]（按执行顺序）"""
+        if not self.timings:
+            return []
+        
+        path = []
+        current = max(self.timings, key=lambda name: self.timings[name][1])
+        while current:
+            start, end = self.timings[current]
+            path.append((current, (end - start) * 1000))
+            finished_deps = [dep for dep in self._steps[current][1] if dep in self.timings]
+            current = max(finished_deps, key=lambda dep: self.timings[dep][1]) if finished_deps else None
+        
+        return list(reversed(path))
+
+class RAGEngine:
+    def __init__(self, client=None, embeddings=None, vectorstore=None):
+        """
+        Args:
+            client: 可选，替代默认 AsyncOpenAI 客户端（基准测试注入模拟客户端时使用）
+            embeddings: 可选，替代默认的Embeddings
+            vectorstore: 可选，替代默认向量数据库（需提供同步的 similarity_search_with_score）
+        """
+        self.client = client or AsyncOpenAI(api_key=Settings.OPENAI_API_KEY)
+        self.embeddings = embeddings or create_embeddings()  # 带持久化缓存，重复的检索查询无需再调用API
+        
+        # 检索后端：numpy 时检索在进程内完成，不再加载/访问ChromaDB
+        self.vector_index = None
+        if vectorstore is None and Settings.RETRIEVAL_BACKEND == 'numpy':
+            self.vector_index = NumpyVectorIndex.load(Settings.VECTOR_INDEX_PATH, mmap=Settings.VECTOR_INDEX_MMAP)
+            print(f"[DEBUG] Loaded in-process vector index: {len(self.vector_index)} chunks")
+            self.vectorstore = None
+        else:
+            self.vectorstore = vectorstore if vectorstore is not None else self._load_vectorstore()
+        
+        # 混合检索的BM25索引（索引缺失时退回纯向量检索）
+        self.bm25_index = None
+        if Settings.RETRIEVAL_MODE == 'hybrid':
+            try:
+                self.bm25_index = BM25Index.load(Settings.BM25_INDEX_PATH)
+                print(f"[DEBUG] Loaded BM25 index: {len(self.bm25_index)} chunks, {len(self.bm25_index.vocabulary)} terms")
+            except (FileNotFoundError, ValueError) as e:
+                print(f"[WARNING] {e}, falling back to vector-only retrieval")
+        
+        # ChromaDB Cloud的异步集合句柄（首次检索时在事件循环内惰性创建）
+        self._async_collection = None
+        self._async_collection_lock = asyncio.Lock()
+        
+        # 自杀风险筛查器（英文正则 + 多语言短语库，启动时编译）
+        self.risk_screener = RiskScreener()
+        
+        # 服务端会话存储（保存英文历史、语言和阶段，客户端每轮只需发送新消息）
+        self.session_store = create_session_store()
         
         # 翻译缓存（提升性能，不影响功能）
-        self._translation_cache = {}
+        self._translation_cache = TranslationCache(
+            max_bytes=Settings.TRANSLATION_CACHE_MAX_BYTES,
+            ttl_seconds=Settings.TRANSLATION_CACHE_TTL_SECONDS
+        )
+        
+        # 对话历史管理（token预算内的最近消息 + 较早消息的滚动摘要）
+        self.history_manager = HistoryManager(
+            self.client,
+            budget_tokens=Settings.HISTORY_TOKEN_BUDGET,
+            message_max_tokens=Settings.HISTORY_MESSAGE_MAX_TOKENS,
+            summary_every_turns=Settings.HISTORY_SUMMARY_EVERY_N_TURNS,
+            summary_max_tokens=Settings.HISTORY_SUMMARY_MAX_TOKENS,
+            model=Settings.HISTORY_SUMMARY_MODEL,
+            cache=TranslationCache(max_bytes=Settings.TRANSLATION_CACHE_MAX_BYTES // 4)
+        )
+        
+        # 问候语快速通道（问候、致谢、简单应答直接使用本地化模板回复）
+        self.fast_path = FastPath() if Settings.FAST_PATH_ENABLED else None
         
-        # 保存用户的首选语言（用于后续输出保持一致）
-        self.user_preferred_language = None
+        # 语义回复缓存（可选，只用于近似重复的开场消息）
+        self.response_cache = ResponseCache(
+            threshold=Settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+            variants=Settings.RESPONSE_CACHE_VARIANTS,
+            max_entries=Settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=Settings.RESPONSE_CACHE_TTL_SECONDS
+        ) if Settings.RESPONSE_CACHE_ENABLED else None
         
         # 加拿大各省资源
-        self.provincial_resources = {
-            'BC': {
-                'name_zh': '不列颠哥伦比亚省',
-                'name_en': 'British Columbia',
-                'resources_zh': [
-                    'HealthLink BC: 811',
-                    'BC Mental Health Support Line: 310-6789（无需区号）',
-                    'Bounce Back BC',
-                    'www.here2talk.ca（大专学生）'
-                ],
-                'resources_en': [
-                    'HealthLink BC: 811',
-                    'BC Mental Health Support Line: 310-6789 (no area code needed)',
-                    'Bounce Back BC',
-                    'www.here2talk.ca (for post-secondary students)'
-                ]
-            },
-            'AB': {
-                'name_zh': '阿尔伯塔省',
-                'name_en': 'Alberta',
-                'resources_zh': [
-                    'Health Link: 811',
-                    'Mental Health Help Line: 1-877-303-2642',
-                    'Addiction Helpline: 1-866-332-2322'
-                ],
-                'resources_en': [
-                    'Health Link: 811',
-                    'Mental Health Help Line: 1-877-303-2642',
-                    'Addiction Helpline: 1-866-332-2322'
-                ]
-            },
-            'SK': {
-                'name_zh': '萨斯喀彻温省',
-                'name_en': 'Saskatchewan',
-                'resources_zh': [
-                    'HealthLine: 811',
-                    'Saskatchewan Crisis Line: 306-525-5333'
-                ],
-                'resources_en': [
-                    'HealthLine: 811',
-                    'Saskatchewan Crisis Line: 306-525-5333'
-                ]
-            },
-            'MB': {
-                'name_zh': '曼尼托巴省',
-                'name_en': 'Manitoba',
-                'resources_zh': [
-                    'Health Links: 204-788-8200 或 1-888-315-9257',
-                    'Klinic Crisis Line: 204-786-8686 或 1-888-322-3019'
-                ],
-                'resources_en': [
-                    'Health Links: 204-788-8200 or 1-888-315-9257',
-                    'Klinic Crisis Line: 204-786-8686 or 1-888-322-3019'
-                ]
-            },
-            'ON': {
-                'name_zh': '安大略省',
-                'name_en': 'Ontario',
-                'resources_zh': [
-                    'Telehealth Ontario: 1-866-797-0000',
-                    'ConnexOntario: 1-866-531-2600'
-                ],
-                'resources_en': [
-                    'Telehealth Ontario: 1-866-797-0000',
-                    'ConnexOntario: 1-866-531-2600'
-                ]
-            },
-            'QC': {
-                'name_zh': '魁北克省',
-                'name_en': 'Quebec',
-                'resources_zh': [
-                    'Info-Santé: 811',
-                    'Suicide Prevention: 1-866-APPELLE (277-3553)'
-                ],
-                'resources_en': [
-                    'Info-Santé: 811',
-                    'Suicide Prevention: 1-866-APPELLE (277-3553)'
-                ]
-            },
-            'NB': {
-                'name_zh': '新不伦瑞克省',
-                'name_en': 'New Brunswick',
-                'resources_zh': [
-                    'Tele-Care: 811',
-                    'Chimo Helpline: 1-800-667-5005'
-                ],
-                'resources_en': [
-                    'Tele-Care: 811',
-                    'Chimo Helpline: 1-800-667-5005'
-                ]
-            },
-            'NS': {
-                'name_zh': '新斯科舍省',
-                'name_en': 'Nova Scotia',
-                'resources_zh': [
-                    '811（24小时护理热线）',
-                    'Mental Health Crisis Line: 1-888-429-8167'
-                ],
-                'resources_en': [
-                    '811 (24/7 nursing line)',
-                    'Mental Health Crisis Line: 1-888-429-8167'
-                ]
-            },
-            'PE': {
-                'name_zh': '爱德华王子岛省',
-                'name_en': 'Prince Edward Island',
-                'resources_zh': [
-                    'Health PEI: 811',
-                    'Island Help Line: 1-800-218-2885'
-                ],
-                'resources_en': [
-                    'Health PEI: 811',
-                    'Island Help Line: 1-800-218-2885'
-                ]
-            },
-            'NL': {
-                'name_zh': '纽芬兰和拉布拉多省',
-                'name_en': 'Newfoundland and Labrador',
-                'resources_zh': [
-                    'HealthLine: 811',
-                    'Mental Health Crisis Line: 1-888-737-4668'
-                ],
-                'resources_en': [
-                    'HealthLine: 811',
-                    'Mental Health Crisis Line: 1-888-737-4668'
-                ]
-            },
-            'YT': {
-                'name_zh': '育空地区',
-                'name_en': 'Yukon',
-                'resources_zh': [
-                    '联系当地健康中心',
-                    'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
-                ],
-                'resources_en': [
-                    'Contact local health centers',
-                    'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
-                ]
-            },
-            'NT': {
-                'name_zh': '西北地区',
-                'name_en': 'Northwest Territories',
-                'resources_zh': [
-                    '联系当地健康中心',
-                    'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
-                ],
-                'resources_en': [
-                    'Contact local health centers',
-                    'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
-                ]
-            },
-            'NU': {
-                'name_zh': '努纳武特地区',
-                'name_en': 'Nunavut',
-                'resources_zh': [
-                    '联系当地健康中心',
-                    'Hope for Wellness Helpline（原住民）: 1-855-242-3310'
-                ],
-                'resources_en': [
-                    'Contact local health centers',
-                    'Hope for Wellness Helpline (for Indigenous peoples): 1-855-242-3310'
-                ]
-            }
+        self.provincial_resources = PROVINCIAL_RESOURCES
+        
+        # 预渲染的多语言静态消息（危机响应、无知识库内容提示），由 build_catalog.py 生成
+        self.message_catalog = load_catalog(Settings.MESSAGE_CATALOG_PATH)
+        
+        # 生成用的静态提示词（阶段 × 语言）启动时组装一次；同一阶段和语言的请求共享完全相同的前缀，
+        # OpenAI的自动提示词缓存可以复用（见 _record_prompt_usage 的缓存命中统计）
+        self._stage_prompts: Dict[Tuple[str, str], str] = {
+            (stage, language): self._compile_stage_prompt(stage, language)
+            for stage in STAGE_INSTRUCTIONS for language in ('en', *LANGUAGE_NAMES)
         }
+        self.prompt_usage = PromptUsageStats()
     
     def _load_vectorstore(self):
-        """加载向量数据库"""
+        """加载向量数据库
+        
+        ChromaDB Cloud 走异步HTTP客户端（见 _get_async_collection），这里返回None；
+        本地ChromaDB没有异步客户端，返回同步的LangChain封装，由 _search_vectorstore 放到线程池执行。
+        """
         if Settings.USE_CHROMA_CLOUD:
-            # 使用ChromaDB Cloud
-            chroma_client = chromadb.CloudClient(
-                api_key=Settings.CHROMA_API_KEY,
-                tenant=Settings.CHROMA_TENANT,
-                database=Settings.CHROMA_DATABASE
-            )
-            return Chroma(
-                client=chroma_client,
-                collection_name=Settings.COLLECTION_NAME,
-                embedding_function=self.embeddings
-            )
+            # 使用ChromaDB Cloud（异步客户端需要在事件循环内创建）
+            return None
         else:
             # 使用本地ChromaDB
             if os.path.exists(Settings.VECTOR_DB_PATH):
@@ -224,7 +506,143 @@ class RAGEngine:
                     "Please initialize the knowledge base first by running init_kb.py"
                 )
     
-    def _detect_conversation_stage(self, user_message: str, conversation_history: List[Dict] = None) -> str:
+    async def _get_async_collection(self):
+        """获取ChromaDB Cloud集合的异步句柄（惰性创建，进程内复用）"""
+        if self._async_collection is None:
+            async with self._async_collection_lock:
+                if self._async_collection is None:
+                    chroma_client = await chromadb.AsyncHttpClient(
+                        host=Settings.CHROMA_HOST,
+                        port=443,
+                        ssl=True,
+                        tenant=Settings.CHROMA_TENANT,
+                        database=Settings.CHROMA_DATABASE,
+                        headers={"x-chroma-token": Settings.CHROMA_API_KEY}
+                    )
+                    self._async_collection = await chroma_client.get_collection(name=Settings.COLLECTION_NAME)
+        return self._async_collection
+    
+    async def _search_vectorstore(self, query: str, k: int, where: Dict = None) -> List[Tuple[Document, float]]:
+        """异步向量检索，返回与 similarity_search_with_score 相同的 (Document, 距离) 列表
+        
+        Args:
+            query: 检索查询文本
+            k: 返回的文档数量
+            where: 可选的元数据过滤条件（ChromaDB where 语法），由向量库在检索时过滤
+        """
+        if self.vectorstore is not None:
+            # 本地ChromaDB只有同步接口，放到线程池避免阻塞事件循环（Embedding在向量库内完成，一并计入检索耗时）
+            with metrics.timer('vector_search'):
+                return await asyncio.to_thread(self.vectorstore.similarity_search_with_score, query, k=k, filter=where)
+        
+        with metrics.timer('embedding'):
+            query_embedding = await self.embeddings.aembed_query(query)
+        
+        if self.vector_index is not None:
+            # 进程内NumPy索引：一次矩阵乘法，亚毫秒级，直接在事件循环内执行
+            with metrics.timer('vector_search'):
+                return self.vector_index.search(query_embedding, k, where=where)
+        
+        with metrics.timer('vector_search'):
+            collection = await self._get_async_collection()
+            results = await collection.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas", "distances"]
+            )
+        
+        return [
+            (Document(page_content=text or "", metadata=metadata or {}, id=chunk_id), distance)
+            for chunk_id, text, metadata, distance in zip(
+                results["ids"][0],
+                results["documents"][0],
+                results["metadatas"][0],
+                results["distances"][0]
+            )
+        ]
+    
+    async def _distances_for_ids(self, query: str, ids: List[str]) -> Dict[str, float]:
+        """查询到指定文档块的向量距离（混合检索中只被BM25召回的文档块需要补上距离）"""
+        query_embedding = await self.embeddings.aembed_query(query)  # 与向量检索的查询相同，命中Embedding缓存
+        if self.vector_index is not None:
+            return self.vector_index.distances_for_ids(query_embedding, ids)
+        
+        if self.vectorstore is not None:
+            collection = getattr(self.vectorstore, '_collection', None)
+            if collection is None:
+                return {}
+            results = await asyncio.to_thread(collection.get, ids=ids, include=["embeddings"])
+        else:
+            collection = await self._get_async_collection()
+            results = await collection.get(ids=ids, include=["embeddings"])
+        if not len(results["ids"]):
+            return {}
+        space = (collection.metadata or {}).get('hnsw:space', 'l2')
+        return dict(zip(results["ids"], distances(query_embedding, results["embeddings"], space).tolist()))
+    
+    async def _hybrid_search(self, query: str, k: int, where: Dict = None) -> List[Tuple[Document, float]]:
+        """BM25 + 向量检索，倒数排名融合后取前 k 个
+        
+        两边同时检索（BM25在进程内，微秒级），融合只决定哪些文档块进入候选；
+        返回的分数仍是向量距离，chat() 中的阈值逻辑不变。只被BM25召回的文档块另外查询向量距离。
+        """
+        vector_docs, lexical_docs = await asyncio.gather(
+            self._search_vectorstore(query, k=Settings.HYBRID_VECTOR_K, where=where),
+            self._search_lexical(query, k=max(k, Settings.HYBRID_LEXICAL_K), where=where)
+        )
+        
+        # 本地ChromaDB返回的Document不带ID，按 (来源, 文本) 合并两边的结果
+        def doc_key(doc: Document) -> Tuple[str, str]:
+            return doc.metadata.get('source', ''), doc.page_content
+        
+        candidates = {doc_key(doc): (doc, distance) for doc, distance in vector_docs}
+        for doc, _ in lexical_docs:
+            candidates.setdefault(doc_key(doc), (doc, None))
+        fused = reciprocal_rank_fusion(
+            [[doc_key(doc) for doc, _ in vector_docs], [doc_key(doc) for doc, _ in lexical_docs]],
+            k=Settings.RRF_K
+        )[:k]
+        
+        missing = [candidates[key][0].id for key, _ in fused if candidates[key][1] is None]
+        missing_distances = await self._distances_for_ids(query, missing) if missing else {}
+        
+        docs = []
+        for key, _ in fused:
+            doc, distance = candidates[key]
+            if distance is None:
+                distance = missing_distances.get(doc.id)
+                if distance is None:
+                    continue
+            docs.append((doc, distance))
+        return docs
+    
+    async def _search_lexical(self, query: str, k: int, where: Dict = None) -> List[Tuple[Document, float]]:
+        """BM25检索（进程内，足够快，直接在事件循环内执行），返回 (Document, BM25分数)"""
+        with metrics.timer('lexical_search'):
+            return self.bm25_index.search(query, k, where=where)
+    
+    async def _retrieve_for_stage(self, query: str, stage: str) -> List[Tuple[Document, float]]:
+        """按对话阶段检索知识库
+        
+        - reflection阶段：assessment目录（评判类）+ general目录
+        - support阶段：support目录（建议类）+ general目录
+        过滤条件基于入库时写入的 stage_bucket 元数据，由向量库直接返回阈值筛选所需的 TOP_K 个候选。
+        向量库中没有该阶段的文档块时（包括入库时还没有 stage_bucket 字段的旧集合），
+        回退到不过滤的检索，再按来源路径过滤；仍然没有时使用所有文档。
+        """
+        search = self._hybrid_search if self.bm25_index is not None else self._search_vectorstore
+        where = stage_filter(stage)
+        if where is not None:
+            docs = await search(query, k=Settings.TOP_K_RETRIEVAL, where=where)
+            if docs:
+                return docs
+        
+        # support阶段检索更多文档，以便引用更多相关知识
+        docs = await search(query, k=30 if stage == 'support' else 20)
+        return [(doc, score) for doc, score in docs if in_stage(doc.metadata, stage)] or docs
+    
+    async def _detect_conversation_stage(self, user_message: str, conversation_history: List[Dict] = None) -> str:
         """使用LLM检测对话阶段
         
         让LLM基于对话历史和当前消息来判断对话阶段，而不是使用硬编码规则：
@@ -238,7 +656,7 @@ class RAGEngine:
             'support': 引导阶段 - 用户需要支持和建议，使用support知识库
         """
         # 检测用户语言
-        user_language = self._detect_language(user_message)
+        user_language = await self._detect_language(user_message)
         
         # 构建对话历史摘要
         history_summary = ""
@@ -246,7 +664,7 @@ class RAGEngine:
             history_summary = "\n对话历史（最近3轮）：\n" if user_language == 'zh' else "\nConversation history (last 3 turns):\n"
             for msg in conversation_history[-3:]:
                 role = "用户" if msg.get('role') == 'user' else "AI" if user_language == 'zh' else ("User" if msg.get('role') == 'user' else "AI")
-                content = msg.get('content', '')[:150]  # 截取前150字符
+                content = truncate_tokens(msg.get('content', ''), Settings.HISTORY_SNIPPET_TOKENS)
                 history_summary += f"- {role}: {content}\n"
         else:
             history_summary = "\n这是首次对话。" if user_language == 'zh' else "\nThis is the first conversation."
@@ -309,7 +727,8 @@ Do not return anything else, only the stage name."""
         
         try:
             # 调用LLM判断阶段
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                'stage_detection',
                 model=Settings.FINETUNED_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a conversation stage analyzer. Return only the stage name: empathy, reflection, or support."},
@@ -331,11 +750,13 @@ Do not return anything else, only the stage name."""
             else:
                 # 如果返回格式不对，使用后备逻辑
                 print(f"[WARNING] Unexpected stage response: {stage}, using fallback")
+                metrics.record_fallback('stage_detection_rules')
                 return self._fallback_stage_detection(user_message, conversation_history)
                     
         except Exception as e:
             # 如果LLM调用失败，使用后备逻辑
             print(f"[WARNING] LLM stage detection failed: {e}, using fallback logic")
+            metrics.record_fallback('stage_detection_rules')
             return self._fallback_stage_detection(user_message, conversation_history)
     
     def _fallback_stage_detection(self, user_message: str, conversation_history: List[Dict] = None) -> str:
@@ -346,14 +767,14 @@ Do not return anything else, only the stage name."""
         if not conversation_history or len(message_lower) <= 10:
             return 'empathy'
         
+        keyword_hits = scan_keywords(message_lower)
+        
         # 有明显寻求建议的关键词 → support
-        support_keywords = ['怎么办', '如何', '建议', '方法', '帮助', '治疗', '资源', 'how to', 'what should', 'suggest', 'advice']
-        if any(keyword in message_lower for keyword in support_keywords):
+        if keyword_hits.any('stage.support'):
             return 'support'
         
         # 有情绪表达 → reflection
-        emotion_keywords = ['感觉', '感到', '觉得', '难过', '焦虑', '抑郁', 'feel', 'sad', 'anxious', 'depressed']
-        if any(keyword in message_lower for keyword in emotion_keywords):
+        if keyword_hits.any('stage.reflection'):
             return 'reflection'
         
         # 默认 → empathy
@@ -657,7 +1078,58 @@ Response Style (following example style, gentle guidance):
 - ✅ **Continue expressing willingness to accompany** the user
 - ✅ **MUST end every response with a question** to keep the conversation going"""
     
-    def _translate_to_english(self, text: str, source_language: str = None) -> str:
+    def _compile_stage_prompt(self, stage: str, language: str) -> str:
+        """组装生成用的静态系统提示词：英文阶段提示词 + 阶段回复指引 + 语言要求"""
+        return (self._get_system_prompt(stage=stage, language='en') + "\n\n" + STAGE_INSTRUCTIONS[stage]
+                + language_instruction(language))
+    
+    def _stage_prompt(self, stage: str, language: str) -> str:
+        """预先组装的静态系统提示词（不在预置列表中的语言首次使用时组装并保存）"""
+        prompt = self._stage_prompts.get((stage, language))
+        if prompt is None:
+            prompt = self._stage_prompts[(stage, language)] = self._compile_stage_prompt(stage, language)
+        return prompt
+    
+    async def _complete(self, call_site: str, **kwargs):
+        """调用 chat.completions.create 并按调用位置记录耗时和token用量（流式调用由调用方在结束时记录）"""
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs)
+        if not kwargs.get('stream'):
+            metrics.record_llm_call(call_site, time.perf_counter() - started, getattr(response, 'usage', None))
+        return response
+    
+    async def _create_completion(self, messages: List[Dict], max_tokens: int, stream: bool = False):
+        """调用生成模型；非流式时直接记录用量，流式时请求在最后一个片段中返回用量"""
+        if stream:
+            return await self._complete(
+                'generation',
+                model=Settings.FINETUNED_MODEL,
+                messages=messages,
+                temperature=Settings.TEMPERATURE,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        response = await self._complete(
+            'generation',
+            model=Settings.FINETUNED_MODEL,
+            messages=messages,
+            temperature=Settings.TEMPERATURE,
+            max_tokens=max_tokens
+        )
+        self._record_prompt_usage(getattr(response, 'usage', None))
+        return response
+    
+    def _record_prompt_usage(self, usage):
+        """记录一次生成调用的提示词token数和其中命中提示词缓存的token数"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', 0) or 0
+        self.prompt_usage.record(prompt_tokens, cached_tokens)
+        print(f"[DEBUG] Prompt tokens: {prompt_tokens} (cached {cached_tokens})")
+    
+    async def _translate_to_english(self, text: str, source_language: str = None) -> str:
         """将用户输入翻译成英文（带缓存优化）
         
         Args:
@@ -668,7 +1140,7 @@ Response Style (following example style, gentle guidance):
             英文文本
         """
         # 如果已经是英文，直接返回
-        if source_language == 'en' or (source_language is None and self._detect_language(text) == 'en'):
+        if source_language == 'en' or (source_language is None and await self._detect_language(text) == 'en'):
             return text
         
         # 如果文本为空或太短，直接返回（避免不必要的API调用）
@@ -676,13 +1148,16 @@ Response Style (following example style, gentle guidance):
             return text
         
         # 检查缓存
-        cache_key = f"en_{hash(text)}"
-        if cache_key in self._translation_cache:
-            return self._translation_cache[cache_key]
+        cache_key = make_translation_key('to_en', 'en', Settings.FINETUNED_MODEL, text)
+        cached = self._translation_cache.get(cache_key)
+        metrics.record_cache('translation', cached is not None)
+        if cached is not None:
+            return cached
         
         try:
             # 使用原来的模型进行翻译（保持功能不变）
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                'translation_to_en',
                 model=Settings.FINETUNED_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a professional translator. Translate the user's message to English accurately while preserving the original meaning, tone, and emotional nuance."},
@@ -693,17 +1168,17 @@ Response Style (following example style, gentle guidance):
             )
             translated_text = response.choices[0].message.content.strip()
             
-            # 缓存结果（限制缓存大小，避免内存溢出）
-            if len(self._translation_cache) < 1000:
-                self._translation_cache[cache_key] = translated_text
+            # 缓存结果（LRU按字节数上限淘汰）
+            self._translation_cache.put(cache_key, translated_text)
             
             return translated_text
         except Exception as e:
             print(f"[WARNING] Translation to English failed: {e}, using original text")
+            metrics.record_fallback('untranslated_input')
             # 如果翻译失败，返回原文（如果是英文就直接返回）
-            return text if self._detect_language(text) == 'en' else text
+            return text if await self._detect_language(text) == 'en' else text
     
-    def _translate_to_user_language(self, text: str, target_language: str) -> str:
+    async def _translate_to_user_language(self, text: str, target_language: str) -> str:
         """将英文回复翻译回用户的原语言（带缓存优化）
         
         Args:
@@ -722,9 +1197,11 @@ Response Style (following example style, gentle guidance):
             return text
         
         # 检查缓存
-        cache_key = f"{target_language}_{hash(text)}"
-        if cache_key in self._translation_cache:
-            return self._translation_cache[cache_key]
+        cache_key = make_translation_key('from_en', target_language, Settings.FINETUNED_MODEL, text)
+        cached = self._translation_cache.get(cache_key)
+        metrics.record_cache('translation', cached is not None)
+        if cached is not None:
+            return cached
         
         try:
             # 确定目标语言名称
@@ -747,7 +1224,7 @@ Response Style (following example style, gentle guidance):
                 # 如果target_language是'other'，尝试从文本中检测实际语言
                 if target_language == 'other':
                     # 尝试检测文本的实际语言
-                    detected = self._detect_language(text[:100] if len(text) > 100 else text)
+                    detected = await self._detect_language(text[:100] if len(text) > 100 else text)
                     if detected in language_names:
                         target_lang_name = language_names[detected]
                     else:
@@ -764,7 +1241,8 @@ Response Style (following example style, gentle guidance):
             
             # 使用原来的模型进行翻译（保持功能不变）
             # 增加 max_tokens 以确保完整翻译包含所有紧急联系方式的长文本
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                'translation_to_user',
                 model=Settings.FINETUNED_MODEL,
                 messages=[
                     {"role": "system", "content": f"You are a professional translator. Translate the English text to {target_lang_name} accurately while preserving the original meaning, tone, emotional nuance, and natural conversation style. IMPORTANT: You MUST translate ALL phone numbers, emergency contacts, and resource information completely. Do NOT omit any emergency contact details."},
@@ -775,25 +1253,29 @@ Response Style (following example style, gentle guidance):
             )
             translated_text = response.choices[0].message.content.strip()
             
-            # 缓存结果（限制缓存大小）
-            if len(self._translation_cache) < 1000:
-                self._translation_cache[cache_key] = translated_text
+            # 缓存结果（LRU按字节数上限淘汰）
+            self._translation_cache.put(cache_key, translated_text)
             
             return translated_text
         except Exception as e:
             print(f"[WARNING] Translation to user language ({target_language}) failed: {e}, using English text")
+            metrics.record_fallback('untranslated_output')
             # 如果翻译失败，返回英文原文
             return text
     
-    def _detect_language(self, text: str, update_preferred: bool = True) -> str:
-        """检测文本语言（第一步使用LLM自动检测，更可靠）
+    async def _detect_language(self, text: str, context: TurnContext = None, update_preferred: bool = True,
+                               llm_hint: str = None) -> str:
+        """检测文本语言（优先本地检测，置信度不足时才调用LLM）
         
-        优先使用LLM自动检测语言，支持中文、英文、西班牙语、法语等多种语言
-        只有在LLM检测失败时才使用回退逻辑
+        先用本地检测器（language_detector，字符区段 + 三元组模型）判断，
+        置信度低于 Settings.LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD 时才调用LLM，
+        LLM调用失败时回退到本地检测的最佳猜测
         
         Args:
             text: 要检测的文本
-            update_preferred: 是否更新保存的首选语言（默认True，检测用户输入时使用；检测响应时设为False）
+            context: 本轮对话的请求级状态，提供首选语言作为无法判断时的回退
+            update_preferred: 是否更新context中的首选语言（默认True，检测用户输入时使用；检测响应、历史AI消息时设为False）
+            llm_hint: 已经由其他LLM调用得到的语言代码（如 _analyze_turn），本地置信度不足时直接采用，不再单独调用LLM
         
         Returns:
             'zh': 中文
@@ -804,9 +1286,11 @@ Response Style (following example style, gentle guidance):
             'hi': 印地语
             'other': 其他语言
         """
+        preferred = context.preferred_language if context else None
+        
         if not text or len(text.strip()) == 0:
             # 如果已有保存的用户语言，使用它；否则默认英文
-            return self.user_preferred_language or 'en'
+            return preferred or 'en'
         
         # === 特殊处理：常见英文短词和问候语 ===
         # 避免LLM将"hi"误判为印地语（hi是印地语的ISO代码）
@@ -817,8 +1301,8 @@ Response Style (following example style, gentle guidance):
         
         # 如果文本是常见的英文问候语或短词，直接识别为英文
         if text_lower in common_english_greetings:
-            if update_preferred:
-                self.user_preferred_language = 'en'
+            if update_preferred and context:
+                context.preferred_language = 'en'
             return 'en'
         
         # 如果文本非常短（1-3个单词）且只包含ASCII字母，优先检查是否为英文
@@ -833,13 +1317,26 @@ Response Style (following example style, gentle guidance):
             english_word_count = sum(1 for word in words if word.lower() in common_english_words)
             if english_word_count > 0:
                 # 如果包含常见英文单词，直接识别为英文
-                if update_preferred:
-                    self.user_preferred_language = 'en'
+                if update_preferred and context:
+                    context.preferred_language = 'en'
                 return 'en'
         
-        # === 第一步：使用LLM自动检测语言 ===
+        # === 第一步：本地检测（字符区段 + 三元组模型，无需API）===
+        local_language, confidence = detect_language_locally(text)
+        if local_language != 'other' and confidence >= Settings.LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD:
+            if update_preferred and context:
+                context.preferred_language = local_language
+            return local_language
+        
+        if llm_hint:
+            if update_preferred and context:
+                context.preferred_language = llm_hint
+            return llm_hint
+        
+        # === 第二步：本地置信度不足时，使用LLM检测语言 ===
         try:
-            response = self.client.chat.completions.create(
+            response = await self._complete(
+                'language_detection',
                 model=Settings.FINETUNED_MODEL,
                 messages=[
                     {
@@ -861,294 +1358,104 @@ Response Style (following example style, gentle guidance):
             valid_codes = ['en', 'zh', 'es', 'fr', 'de', 'it', 'pt', 'ru', 'ja', 'ko', 'ar', 'hi']
             if detected_code in valid_codes:
                 # 只在更新标志为True时保存检测到的语言
-                if update_preferred:
-                    self.user_preferred_language = detected_code
+                if update_preferred and context:
+                    context.preferred_language = detected_code
                 return detected_code
             elif detected_code.startswith('en') or 'english' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'en'
+                if update_preferred and context:
+                    context.preferred_language = 'en'
                 return 'en'
             elif detected_code.startswith('zh') or 'chinese' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'zh'
+                if update_preferred and context:
+                    context.preferred_language = 'zh'
                 return 'zh'
             elif detected_code.startswith('es') or 'spanish' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'es'
+                if update_preferred and context:
+                    context.preferred_language = 'es'
                 return 'es'
             elif detected_code.startswith('fr') or 'french' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'fr'
+                if update_preferred and context:
+                    context.preferred_language = 'fr'
                 return 'fr'
             elif detected_code.startswith('de') or 'german' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'de'
+                if update_preferred and context:
+                    context.preferred_language = 'de'
                 return 'de'
             elif detected_code.startswith('it') or 'italian' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'it'
+                if update_preferred and context:
+                    context.preferred_language = 'it'
                 return 'it'
             elif detected_code.startswith('pt') or 'portuguese' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'pt'
+                if update_preferred and context:
+                    context.preferred_language = 'pt'
                 return 'pt'
             elif detected_code.startswith('ja') or 'japanese' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'ja'
+                if update_preferred and context:
+                    context.preferred_language = 'ja'
                 return 'ja'
             elif detected_code.startswith('ko') or 'korean' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'ko'
+                if update_preferred and context:
+                    context.preferred_language = 'ko'
                 return 'ko'
             elif detected_code.startswith('ar') or 'arabic' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'ar'
+                if update_preferred and context:
+                    context.preferred_language = 'ar'
                 return 'ar'
             elif detected_code.startswith('ru') or 'russian' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'ru'
+                if update_preferred and context:
+                    context.preferred_language = 'ru'
                 return 'ru'
             elif detected_code.startswith('hi') or 'hindi' in detected_code.lower():
-                if update_preferred:
-                    self.user_preferred_language = 'hi'
+                if update_preferred and context:
+                    context.preferred_language = 'hi'
                 return 'hi'
             else:
                 # 如果LLM返回了未知代码，尝试提取前两个字母
                 match = re.match(r'([a-z]{2})', detected_code)
                 if match:
                     code = match.group(1)
-                    if update_preferred:
-                        self.user_preferred_language = code
+                    if update_preferred and context:
+                        context.preferred_language = code
                     return code
                 # 如果无法识别，使用保存的语言或默认英文
-                return self.user_preferred_language or 'en'
+                return preferred or 'en'
                 
         except Exception as e:
-            print(f"[WARNING] LLM language detection failed: {e}, using fallback")
-            # === 回退逻辑：如果LLM检测失败，使用字符特征检测 ===
-            
-            # 检测有明显字符特征的语言
-            chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-            if chinese_chars > 0:
-                total_readable_chars = len(re.findall(r'[a-zA-Z\u4e00-\u9fff]', text))
-                if total_readable_chars > 0:
-                    chinese_ratio = chinese_chars / total_readable_chars
-                    if chinese_ratio > 0.3:
-                        if update_preferred:
-                            self.user_preferred_language = 'zh'
-                        return 'zh'
-            
-            # 其他有明显字符特征的语言
-            if re.search(r'[\u3040-\u309F\u30A0-\u30FF]', text):  # 日文
-                if update_preferred:
-                    self.user_preferred_language = 'ja'
-                return 'ja'
-            if re.search(r'[\uAC00-\uD7AF]', text):  # 韩文
-                if update_preferred:
-                    self.user_preferred_language = 'ko'
-                return 'ko'
-            if re.search(r'[\u0600-\u06FF]', text):  # 阿拉伯文
-                if update_preferred:
-                    self.user_preferred_language = 'ar'
-                return 'ar'
-            if re.search(r'[\u0400-\u04FF]', text):  # 俄文
-                if update_preferred:
-                    self.user_preferred_language = 'ru'
-                return 'ru'
-            if re.search(r'[\u0900-\u097F]', text):  # 印地语
-                if update_preferred:
-                    self.user_preferred_language = 'hi'
-                return 'hi'
-            
-            # 检查是否是明显的英文（常用英文单词）
-            text_lower = text.lower()
-            common_english_words = ['the', 'is', 'are', 'was', 'were', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'can', 'could', 'should', 'may', 'might']
-            english_word_count = sum(1 for word in common_english_words if re.search(r'\b' + word + r'\b', text_lower))
+            print(f"[WARNING] LLM language detection failed: {e}, using local detection result")
+            metrics.record_fallback('local_language_detection')
+            # === 回退逻辑：如果LLM检测失败，使用本地检测的最佳猜测 ===
+            if local_language != 'other':
+                if update_preferred and context:
+                    context.preferred_language = local_language
+                return local_language
             
-            if english_word_count >= 2:
-                if update_preferred:
-                    self.user_preferred_language = 'en'
-                return 'en'
-            else:
-                # 如果无法确定，使用保存的语言或返回other
-                return self.user_preferred_language or 'other'
+            # 如果无法确定，使用保存的语言或返回other
+            return preferred or 'other'
     
-    def _generate_crisis_response(self, has_explicit_plan: bool, language: str, province: str = None) -> str:
-        """生成危机响应，根据语言和省份"""
-        
-        # 通用全国资源
-        national_zh = [
-            '**988** - 自杀危机热线（拨打或发短信，24/7，免费，双语）',
-            '**1-833-456-4566** - Crisis Services Canada（拨打）或发短信至 **45645**',
-            '**911** - 如果情况紧急，请立即拨打'
-        ]
+    async def _generate_crisis_response(self, has_explicit_plan: bool, language: str, province: str = None) -> str:
+        """生成危机响应，根据语言和省份
         
-        national_en = [
-            '**988** - Suicide Crisis Helpline (call or text, 24/7, free, bilingual)',
-            '**1-833-456-4566** - Crisis Services Canada (call) or text **45645**',
-            '**911** - If emergency, call immediately'
-        ]
+        中文和英文直接使用模板；其他语言优先使用 build_catalog.py 预渲染的译文（零LLM调用），
+        目录中没有时才在线翻译英文原文。
+        """
+        if language in ['zh', 'en']:
+            return render_crisis_response(has_explicit_plan, language, province)
         
-        # 构建省级资源
-        provincial_section_zh = ""
-        provincial_section_en = ""
+        cached = self.message_catalog.crisis_response(has_explicit_plan, language, province)
+        if cached is not None:
+            return cached
         
-        if province and province.upper() in self.provincial_resources:
-            prov_info = self.provincial_resources[province.upper()]
-            provincial_section_zh = f"\n\n**{prov_info['name_zh']}资源：**\n" + "\n".join([f"- {r}" for r in prov_info['resources_zh']])
-            provincial_section_en = f"\n\n**{prov_info['name_en']} Resources:**\n" + "\n".join([f"- {r}" for r in prov_info['resources_en']])
-        else:
-            # 如果没有指定省份，列出所有省份
-            provincial_section_zh = "\n\n**各省资源：**\n"
-            provincial_section_en = "\n\n**Provincial Resources:**\n"
-            for prov_code, prov_info in self.provincial_resources.items():
-                provincial_section_zh += f"\n**{prov_info['name_zh']}：**\n" + "\n".join([f"- {r}" for r in prov_info['resources_zh']]) + "\n"
-                provincial_section_en += f"\n**{prov_info['name_en']}:**\n" + "\n".join([f"- {r}" for r in prov_info['resources_en']]) + "\n"
-        
-        # 对于除中文和英文外的所有语言，生成英文回复，然后翻译成用户语言
-        if language not in ['zh', 'en']:
-            # 生成英文危机响应
-            if has_explicit_plan:
-                crisis_response_en = f"""I am deeply concerned about your safety. What you just mentioned worries me very much. Please take immediate action:
-
-🚨 **Seek Help Immediately:**
-
-**National Resources (24/7, Bilingual):**
-{chr(10).join(['- ' + r for r in national_en])}
-- Go to your nearest emergency department
-{provincial_section_en}
-
-**Important:**
-- Your life has value and you deserve help
-- These thoughts are treatable
-- Professionals can help you through this difficult time
-- The pain will pass
-
-Please call **988** now or go to your nearest emergency department. I'm here with you, but you need immediate professional help."""
-            else:
-                crisis_response_en = f"""I am deeply concerned about your safety and mental health. The thoughts you just mentioned worry me very much. Please take immediate action:
-
-🚨 **Seek Professional Help Immediately:**
-
-**National Resources (24/7, Bilingual):**
-{chr(10).join(['- ' + r for r in national_en])}
-- Go to your nearest emergency department
-{provincial_section_en}
-
-**Contact someone you trust**: Tell family or friends what you're going through so they can support you.
-
-**Remember:**
-- You are not alone; many people want to help you
-- These feelings are treatable
-- Your life has value and is worth protecting
-- Professional help can change everything
-
-**Emergency:**
-If these thoughts become stronger or you begin making specific plans, please immediately:
-- Call **988** (Suicide Crisis Helpline)
-- Go to your nearest emergency department
-- Call **911**
-
-Please take action now and contact a mental health professional. Seeking help now is the best thing you can do for yourself. Your life is very important."""
-
-            # 翻译成用户的语言
-            return self._translate_to_user_language(crisis_response_en, language)
-        
-        elif language == 'zh':
-            if has_explicit_plan:
-                return f"""我深深地关心您的安全。您刚才提到的内容让我非常担心。请立即采取以下行动：
-
-🚨 **立即寻求帮助：**
-
-**全国资源（24小时，双语）：**
-{chr(10).join(['- ' + r for r in national_zh])}
-- 前往最近的医院急诊科
-{provincial_section_zh}
-
-**请记住：**
-- 您值得获得帮助，您的生命有价值
-- 这些想法是可以治疗的，您不需要独自承受
-- 专业人员可以帮您度过这个艰难的时刻
-- 即使现在感觉很难，痛苦是会过去的
-
-请现在就拨打 **988** 或前往最近的急诊科。我会陪伴您，但您需要立即获得专业人员的帮助。
-
-您的生命非常重要，请给自己一个获得帮助的机会。"""
-            else:
-                return f"""我深深地关心您的安全和心理健康。您刚才提到的想法让我非常担心。请立即采取以下行动：
-
-🚨 **立即寻求专业帮助：**
-
-**全国资源（24小时，双语）：**
-{chr(10).join(['- ' + r for r in national_zh])}
-- 前往最近的医院急诊科
-{provincial_section_zh}
-
-**联系可信任的人**：告诉家人或朋友您正在经历什么，让他们支持您。
-
-**请记住：**
-- 您并不孤单，有很多人愿意帮助您
-- 这些感受是可以治疗的
-- 您的生命有价值，值得被保护
-- 专业帮助可以改变一切
-
-**紧急情况：**
-如果这些想法变得更强烈，或您开始制订具体计划，请立即：
-- 拨打 **988**（自杀危机热线）
-- 前往最近的医院急诊科
-- 拨打 **911**
-
-请现在就采取行动，联系专业心理医生。现在寻求帮助是您为自己做的最好的事情。您的生命非常重要。"""
-        
-        else:  # English
-            if has_explicit_plan:
-                return f"""I am deeply concerned about your safety. What you just mentioned worries me very much. Please take immediate action:
-
-🚨 **Seek Help Immediately:**
-
-**National Resources (24/7, Bilingual):**
-{chr(10).join(['- ' + r for r in national_en])}
-- Go to your nearest emergency department
-{provincial_section_en}
-
-**Remember:**
-- You deserve help, and your life has value
-- These thoughts are treatable, and you don't have to go through this alone
-- Professionals can help you through this difficult time
-- Even though it feels hard now, the pain will pass
-
-Please call **988** now or go to your nearest emergency department. I'm here with you, but you need immediate professional help.
-
-Your life is very important. Please give yourself a chance to get help."""
-            else:
-                return f"""I am deeply concerned about your safety and mental health. The thoughts you just mentioned worry me very much. Please take immediate action:
-
-🚨 **Seek Professional Help Immediately:**
-
-**National Resources (24/7, Bilingual):**
-{chr(10).join(['- ' + r for r in national_en])}
-- Go to your nearest emergency department
-{provincial_section_en}
-
-**Contact someone you trust**: Tell family or friends what you're going through so they can support you.
-
-**Remember:**
-- You are not alone; many people want to help you
-- These feelings are treatable
-- Your life has value and is worth protecting
-- Professional help can change everything
-
-**Emergency:**
-If these thoughts become stronger or you begin making specific plans, please immediately:
-- Call **988** (Suicide Crisis Helpline)
-- Go to your nearest emergency department
-- Call **911**
-
-Please take action now and contact a mental health professional. Seeking help now is the best thing you can do for yourself. Your life is very important."""
+        # 目录未覆盖的语言（或目录不可用）：生成英文回复，然后翻译成用户语言
+        crisis_response_en = render_crisis_response(has_explicit_plan, language, province)
+        return await self._translate_to_user_language(crisis_response_en, language)
     
-    def _analyze_emotion_intensity(self, user_message: str) -> Dict:
+    def _analyze_emotion_intensity(self, user_message: str, keyword_hits: KeywordHits = None) -> Dict:
         """情绪识别模块 - 分析用户消息的情绪强度和语气
         
+        Args:
+            user_message: 用户消息
+            keyword_hits: 已有的词库扫描结果（同一条消息在各分析步骤间共享），None时自行扫描
+        
         Returns:
             Dict with keys:
                 'intensity': 'high' | 'medium' | 'low'
@@ -1156,50 +1463,24 @@ Please take action now and contact a mental health professional. Seeking help no
                 'risk_level': 'high' | 'medium' | 'low' | 'none'
                 'needs_immediate_attention': bool
         """
-        message_lower = user_message.lower()
-        
-        # 情绪关键词库
-        emotion_patterns = {
-            'sadness': {
-                'keywords': ['难过', '伤心', '悲伤', '沮丧', '失落', '失望', 'sad', 'sorrow', 'grief', 'upset'],
-                'intensity_high': ['非常', '极其', '极度', '非常', 'really', 'extremely', 'very'],
-                'intensity_medium': ['很', '比较', '有点', 'quite', 'rather']
-            },
-            'anxiety': {
-                'keywords': ['焦虑', '担心', '害怕', '紧张', '不安', '恐慌', 'anxious', 'worried', 'afraid', 'nervous'],
-                'intensity_high': ['非常', '极度', 'really', 'extremely'],
-                'intensity_medium': ['很', '比较', 'quite']
-            },
-            'depression': {
-                'keywords': ['抑郁', '低落', '疲惫', '累', '没兴趣', '没动力', 'depressed', 'low', 'tired', 'exhausted'],
-                'intensity_high': ['严重', '非常', '极度', 'seriously', 'severely'],
-                'intensity_medium': ['有点', '比较', 'quite']
-            },
-            'hopelessness': {
-                'keywords': ['绝望', '没希望', '无望', '不值得', 'hopeless', 'no hope', 'worthless'],
-                'intensity_high': ['非常', '完全', 'totally', 'completely'],
-                'intensity_medium': ['有点', '有时', 'sometimes']
-            }
-        }
+        if keyword_hits is None:
+            keyword_hits = scan_keywords(user_message)
         
-        # 计算情绪强度和类型
+        # 计算情绪强度和类型（情绪关键词库见 lexicon.KEYWORD_REGISTRY 的 emotion.* / intensity_*.* 类别）
         detected_emotions = []
         max_intensity_score = 0
         primary_emotion = None
         
-        for emotion_type, patterns in emotion_patterns.items():
-            emotion_score = 0
+        for emotion_type in ('sadness', 'anxiety', 'depression', 'hopelessness'):
             intensity_modifier = 1.0
             
             # 检查关键词
-            for keyword in patterns['keywords']:
-                if keyword in message_lower:
-                    emotion_score += 1
+            emotion_score = keyword_hits.count(f'emotion.{emotion_type}')
             
             # 检查强度修饰词
-            if any(modifier in message_lower for modifier in patterns['intensity_high']):
+            if keyword_hits.any(f'intensity_high.{emotion_type}'):
                 intensity_modifier = 2.0  # 高强度
-            elif any(modifier in message_lower for modifier in patterns['intensity_medium']):
+            elif keyword_hits.any(f'intensity_medium.{emotion_type}'):
                 intensity_modifier = 1.5  # 中等强度
             
             if emotion_score > 0:
@@ -1214,8 +1495,7 @@ Please take action now and contact a mental health professional. Seeking help no
                     primary_emotion = emotion_type
             
             # 检查持续性问题（更严重）
-            duration_keywords = ['一直', '总是', '持续', '很久', '很长时间', 'always', 'constantly', 'for a long time']
-            if any(keyword in message_lower for keyword in duration_keywords):
+            if keyword_hits.any('duration'):
                 intensity_modifier *= 1.3
         
         # 确定强度级别
@@ -1252,12 +1532,12 @@ Please take action now and contact a mental health professional. Seeking help no
             'detected_emotions': detected_emotions
         }
     
-    def _detect_suicide_risk(self, user_message_en: str, user_language: str) -> Dict:
+    async def _detect_suicide_risk(self, user_message_en: str, user_language: str) -> Dict:
         """检测用户消息中的自杀意图和风险级别
         
         严格策略：任何自杀倾向或不想活的意图都视为高风险
         
-        注意：此函数接收的是已经翻译成英文的消息，所有风险检测都在英文消息上进行
+        注意：此函数接收的是已经翻译成英文的消息，是翻译前多语言筛查（RiskScreener.screen）之后的第二道防线
         
         Args:
             user_message_en: 用户消息（已经翻译成英文）
@@ -1268,101 +1548,27 @@ Please take action now and contact a mental health professional. Seeking help no
                           'response' (if risk detected),
                           'has_explicit_plan' (bool) - 是否有明确计划
         """
-        message_lower = user_message_en.lower().strip()
-        
-        # 高风险：明确的计划和行动（更紧急）
-        # 关键：模式必须包含真正的风险词，且风险词必须紧跟在动词后
-        explicit_plan_patterns = [
-            # 明确的计划 - 必须包含风险动作词
-            r'\bi\s+(want|plan|going|will|am)\s+to\s+(kill|end|suicide)\b',
-            r'\bi\s+(want|plan|going|will|am)\s+to\s+(jump|hang|cut|overdose)\b',
-            r'\bkill\s+myself\b',
-            r'\bend\s+(my\s+life|it\s+all)\b',  # 移除"everything"，太宽泛
-            r'\bcommit\s+suicide\b',
-            r'\bsuicide\s+(plan|method|way)\b',
-            r'\btonight.*?(kill|end|suicide)\b',
-            r'\blast\s+(time|goodbye|message)\b',
-            r'\bcut\s+(wrist|artery|vein)\b',
-            r'\boverdose\s+(on\s+)?(pills|medication)\b',
-            r'\bjump\s+(off|from|bridge|building)\b',
-            r'\bhang\s+myself\b',
-        ]
-        
-        # 高风险：任何自杀倾向、不想活的意图（严格的匹配，每个模式都必须包含明确的风险词）
-        suicide_intent_patterns = [
-            # Want to die / Die - 必须明确包含"die"或"dead"
-            r'\bi\s+want\s+(to\s+)?die\b',
-            r'\bwanna\s+die\b',
-            r'\bwant\s+to\s+die\b',
-            r'\bi\s+want.*?\bdie\b',  # "i want" 后面必须有"die"
-            r'\bwish.*?\bdead\b',  # 必须包含"dead"
-            r'\bwish\s+i\s+.*?\bdie\b',
-            r'\bwish.*?(i|to).*?\bdie\b',
-            
-            # Suicide - 必须明确包含"suicide"或"kill myself"
-            r'\bi\s+want.*?\bsuicide\b',  # "i want" 后面必须有"suicide"
-            r'\bcommit\s+suicide\b',
-            r'\bkilling\s+myself\b',
-            r'\bkill\s+myself\b',
-            r'\bsuicide\b',  # 单独的词，必须有边界
-            
-            # Don't want to live - 必须明确包含"live"和否定词
-            r'\bdon\'?t\s+want\s+to\s+live\b',
-            r'\bnot\s+want\s+to\s+live\b',
-            r'\blife.*?\bnot.*?\bworth\b',
-            r'\bnot\s+worth\s+living\b',
-            r'\bdon\'?t\s+want\s+to\s+be\s+alive\b',
-            
-            # End life - 必须明确包含"end"和"life"
-            r'\bend\s+(my\s+)?life\b',
-            r'\bend\s+it\s+all\b',
-            # 移除 "end.*?everything" - 太宽泛，会误匹配
-            
-            # Leave / Gone - 必须明确包含上下文相关的词
-            r'\bwant\s+to\s+leave\s+(this\s+)?world\b',  # 必须包含"world"
-            r'\bbe\s+gone\b',  # 移除 "i.*?gone" - 太宽泛
-            r'\bwant\s+to\s+leave\b',  # 但只在特定语境中，需要更严格
-            
-            # Other expressions - 必须明确
-            r'\bbetter\s+off\s+dead\b',
-            r'\bnot\s+want\s+to\s+be\s+here\b',  # 更严格："not want to be here"
-            r'\bworld.*?\bbetter.*?\bwithout.*?\bme\b',
-            r'\bnobody\s+(would\s+)?care\b',
-            r'\bno\s+one\s+(would\s+)?care\b',
-            r'\bno\s+point\s+in\s+living\b',
-            r'\bhopeless\b',
-            r'\bno\s+hope\b',
-        ]
-        
         # 尝试检测省份（简单检测，可以从对话历史或用户消息中提取）
         province = None  # 可以从request中获取
         
-        # 先检查明确的计划和行动（更紧急的情况）
-        for pattern in explicit_plan_patterns:
-            if re.search(pattern, message_lower):
-                return {
-                    'risk_level': 'high',
-                    'has_explicit_plan': True,
-                    'response': self._generate_crisis_response(has_explicit_plan=True, language=user_language, province=province)
-                }
-        
-        # 检查任何自杀倾向或不想活的意图（均视为高风险）
-        # 现在模式已经足够严格，每个模式都必须包含明确的风险词
-        for pattern in suicide_intent_patterns:
-            if re.search(pattern, message_lower):
-                return {
-                    'risk_level': 'high',
-                    'has_explicit_plan': False,
-                    'response': self._generate_crisis_response(has_explicit_plan=False, language=user_language, province=province)
-                }
+        # 英文正则已在 risk_screening 中预编译（明确计划优先于自杀意图）
+        hit = self.risk_screener.screen_english(user_message_en)
+        if hit:
+            return {
+                'risk_level': 'high',
+                'has_explicit_plan': hit['has_explicit_plan'],
+                'response': await self._generate_crisis_response(
+                    has_explicit_plan=hit['has_explicit_plan'], language=user_language, province=province
+                )
+            }
         
         return {'risk_level': 'none', 'has_explicit_plan': False, 'response': None}
     
-    def _generate_empathy_response(self, user_message: str) -> str:
+    async def _generate_empathy_response(self, user_message: str) -> str:
         """生成倾听阶段的回应，根据用户语言
         专注于鼓励用户继续表达，不分享统计数据或知识库内容
         """
-        language = self._detect_language(user_message)
+        language = await self._detect_language(user_message)
         
         if language == 'other':
             # 其他语言：使用英文模板，ChatGPT会自动识别用户语言
@@ -1372,9 +1578,11 @@ I can feel that you're going through a difficult time right now. I'm here with y
 
 Please acknowledge their emotions, encourage them to express more, and let them know you're listening. Keep it simple, warm, and empathetic. Do not share statistics or advice at this stage."""
         
-        elif language == 'en':
-            # 英文情绪关键词 - 简洁确认
-            emotion_keywords = {
+        keyword_hits = scan_keywords(user_message)
+        
+        if language == 'en':
+            # 英文情绪关键词 - 简洁确认（关键词见 lexicon 的 empathy.en 类别，按其顺序取第一个命中）
+            emotion_confirmations = {
                 'sad': "you're feeling sad",
                 'anxious': "you're feeling anxious",
                 'pain': "you're going through pain",
@@ -1386,12 +1594,7 @@ Please acknowledge their emotions, encourage them to express more, and let them
                 'depressed': "you're feeling depressed",
             }
             
-            message_lower = user_message.lower()
-            emotion_confirmation = None
-            for keyword, response in emotion_keywords.items():
-                if keyword in message_lower:
-                    emotion_confirmation = response
-                    break
+            emotion_confirmation = emotion_confirmations.get(keyword_hits.first('empathy.en'))
             
             if emotion_confirmation:
                 empathy_text = f"I can feel that {emotion_confirmation}, and I understand this is really hard for you."
@@ -1404,8 +1607,8 @@ Please acknowledge their emotions, encourage them to express more, and let them
 I'm here with you, and I want to listen. Would you like to tell me more about how you're feeling? You can share whatever is on your mind."""
         
         else:  # 中文
-            # 检测用户表达的情绪关键词 - 简洁确认
-            emotion_keywords = {
+            # 检测用户表达的情绪关键词 - 简洁确认（关键词见 lexicon 的 empathy.zh 类别）
+            emotion_confirmations = {
                 '难过': '听起来你现在真的很难过',
                 '焦虑': '我能感受到你现在的焦虑',
                 '痛苦': '你在经历痛苦',
@@ -1418,12 +1621,7 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
             }
             
             # 查找匹配的情绪
-            message_lower = user_message.lower()
-            emotion_confirmation = None
-            for keyword, response in emotion_keywords.items():
-                if keyword in message_lower:
-                    emotion_confirmation = response
-                    break
+            emotion_confirmation = emotion_confirmations.get(keyword_hits.first('empathy.zh'))
             
             if emotion_confirmation:
                 empathy_text = f"我能感受到{emotion_confirmation}，这确实不容易。"
@@ -1437,33 +1635,8 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
         
         return empathy_response
 
-    def _extract_category(self, source_path: str) -> str:
-        """从文件路径提取内容类别"""
-        if not source_path:
-            return "unknown"
-
-        source_lower = source_path.lower()
-
-        if 'depression' in source_lower:
-            if 'assessment' in source_lower:
-                return "depression_symptoms"
-            elif 'support' in source_lower:
-                return "depression_treatment"
-            return "depression"
-        elif 'loneliness' in source_lower or 'friendship' in source_lower:
-            return "loneliness_friendship"
-        elif 'exercise' in source_lower or 'motivation' in source_lower:
-            return "exercise_motivation"
-        elif 'anxiety' in source_lower:
-            return "anxiety"
-        elif 'stress' in source_lower:
-            return "stress"
-        elif 'general' in source_lower:
-            return "general_mental_health"
-        else:
-            return "mental_health"
-
-    def _build_semantic_search_query(self, user_message: str, conversation_stage: str, emotion_analysis: Dict = None) -> str:
+    def _build_semantic_search_query(self, user_message: str, conversation_stage: str, emotion_analysis: Dict = None,
+                                     keyword_hits: KeywordHits = None) -> str:
         """根据语义内容构建优化的检索查询
 
         改进检索模块：根据对话阶段、用户消息语义和情绪分析，构建更精准的查询
@@ -1471,23 +1644,13 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
         """
         # 基础查询是用户消息
         query = user_message
-        message_lower = user_message.lower()
-
-        # === 主题检测（基于关键词）===
-        # 检测孤独/社交主题
-        loneliness_keywords = ['lonely', 'loneliness', 'friend', 'friends', 'friendship',
-                              'social', 'isolated', 'isolation', 'connection', 'connect',
-                              'alone', 'companionship', 'relationship', 'relationships']
-        is_loneliness = any(kw in message_lower for kw in loneliness_keywords)
-
-        # 检测抑郁主题
-        depression_keywords = ['depress', 'depressed', 'depression', 'hopeless', 'hopelessness',
-                              'worthless', 'suicide', 'suicidal', 'kill myself', 'want to die']
-        is_depression = any(kw in message_lower for kw in depression_keywords)
+        if keyword_hits is None:
+            keyword_hits = scan_keywords(user_message)
 
-        # 检测焦虑主题
-        anxiety_keywords = ['anxiety', 'anxious', 'worry', 'worried', 'panic', 'stress', 'stressed']
-        is_anxiety = any(kw in message_lower for kw in anxiety_keywords)
+        # === 主题检测（基于关键词，见 lexicon 的 topic.* 类别）===
+        is_loneliness = keyword_hits.any('topic.loneliness')  # 孤独/社交主题
+        is_depression = keyword_hits.any('topic.depression')  # 抑郁主题
+        is_anxiety = keyword_hits.any('topic.anxiety')  # 焦虑主题
 
         # === 根据主题和阶段构建查询增强 ===
         # 优先级：如果同时匹配多个主题，按照特异性排序
@@ -1543,133 +1706,367 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
 
         return query
     
-    def chat(self, user_message: str, conversation_history: List[Dict] = None) -> Dict:
-        """RAG聊天 - 整合语义理解和上下文推理
+    async def _analyze_turn(self, user_message: str, conversation_history: List[Dict] = None,
+                            preferred_language: Optional[str] = None) -> Optional[Dict]:
+        """一次结构化输出调用同时得到语言、英文翻译和对话阶段
         
-        统一处理流程：
-        1. 检测用户语言
-        2. 将用户输入翻译成英文（如果已经是英文则跳过）
-        3. 系统内部统一使用英文处理
-        4. 将英文回复翻译回用户原语言返回
+        替代 _detect_language → _translate_to_english → _detect_conversation_stage 三次串行调用。
+        本地检测有把握是英文（或本地不确定、会话语言是英文）时不请求英文翻译。
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史
+            preferred_language: 会话的首选语言，本地检测置信度不足时用来判断是否需要翻译
+        
+        Returns:
+            {'language': ISO 639-1代码, 'message_en': 英文翻译, 'stage': 'empathy'|'reflection'|'support'}，
+            未请求翻译时 message_en 在 language 为 'en' 时是原文，否则为None（调用方单独翻译）；
+            调用失败或输出不合法时返回None（调用方回退到逐步处理）
         """
+        local_language, confidence = detect_language_locally(user_message)
+        if local_language != 'other' and confidence >= Settings.LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD:
+            likely_language = local_language
+        else:
+            likely_language = preferred_language
+        needs_translation = likely_language != 'en'
+        
+        # 构建对话历史摘要（优先使用已翻译的英文版本）
+        if conversation_history:
+            history_summary = "Conversation history (last 3 turns):\n" + "".join(
+                f"- {'User' if msg.get('role') == 'user' else 'AI'}: {truncate_tokens(msg.get('content_en') or msg.get('content', ''), Settings.HISTORY_SNIPPET_TOKENS)}\n"
+                for msg in conversation_history[-3:]
+            )
+        else:
+            history_summary = "This is the first conversation."
+        
+        if needs_translation:
+            translation_item = ("2. message_en: the message translated to English accurately, preserving meaning, "
+                                "tone and emotional nuance (copy it unchanged if it is already English)\n")
+            stage_number = 3
+        else:
+            translation_item, stage_number = "", 2
+        
+        prompt = f"""Analyze the user's latest message in a mental health support conversation.
+
+1. language: the ISO 639-1 code of the language the user wrote in (e.g. en, zh, es, fr, de, it, pt, ja, ko, ar, ru, hi)
+{translation_item}{stage_number}. stage: the current conversation stage
+   - empathy: greetings, initial or short/uncertain expressions, the user needs encouragement to keep talking
+   - reflection: the user clearly expressed feelings or described a specific problem and needs understanding ("I'm not alone")
+   - support: the user explicitly asks what to do / how to / for advice, resources or treatment
+
+{history_summary}
+User message: {user_message}"""
+        
+        try:
+            response = await self._complete(
+                'turn_analysis',
+                model=Settings.FINETUNED_MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a conversation analyzer. Reply with the requested JSON only."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_schema",
+                                 "json_schema": TURN_ANALYSIS_SCHEMA if needs_translation else TURN_ANALYSIS_SCHEMA_EN},
+                temperature=0.1,
+                max_tokens=600
+            )
+            analysis = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            print(f"[WARNING] Turn analysis failed: {e}, using per-step detection")
+            metrics.record_fallback('per_step_detection')
+            return None
+        
+        # 验证输出
+        language = str(analysis.get('language', '')).strip().lower()
+        message_en = analysis.get('message_en')
+        stage = analysis.get('stage')
+        if not re.fullmatch(r'[a-z]{2}', language) or stage not in ('empathy', 'reflection', 'support') \
+                or (needs_translation and (not isinstance(message_en, str) or not message_en.strip())):
+            print(f"[WARNING] Invalid turn analysis: {analysis}, using per-step detection")
+            metrics.record_fallback('per_step_detection')
+            return None
+        
+        if not needs_translation:
+            # 没有请求翻译：确实是英文时直接用原文，否则留给 _translate_to_english
+            message_en = user_message if language == 'en' else None
+            return {'language': language, 'message_en': message_en, 'stage': stage}
+        
+        # 把翻译结果写入翻译缓存，这条消息之后出现在对话历史里时无需再翻译
+        self._translation_cache.put(
+            make_translation_key('to_en', 'en', Settings.FINETUNED_MODEL, user_message),
+            message_en.strip()
+        )
         
-        # === 第一步：检测并保存用户语言（使用LLM自动检测） ===
-        user_language = self._detect_language(user_message)
+        return {'language': language, 'message_en': message_en.strip(), 'stage': stage}
+    
+    async def _translate_history_message(self, msg: Dict, user_language: str, context: TurnContext) -> Dict:
+        """将一条历史消息转换为英文版本（复用消息上缓存的 content_en）"""
+        role = msg.get('role', 'user')
+        content = msg.get('content', '')
+        
+        # 检查是否已经有英文版本（避免重复翻译）
+        if msg.get('content_en'):
+            # 如果已经缓存了英文版本，直接使用
+            content_en = msg['content_en']
+        elif role == 'user':
+            # 用户消息：翻译成英文
+            content_en = await self._translate_to_english(content, user_language)
+            # 缓存英文版本（如果可能）
+            if 'content_en' not in msg:
+                msg['content_en'] = content_en
+        else:
+            # AI消息：检测语言，只在非英文时翻译
+            msg_lang = await self._detect_language(content, context, update_preferred=False)
+            if msg_lang != 'en':
+                content_en = await self._translate_to_english(content, msg_lang)
+                msg['content_en'] = content_en
+            else:
+                content_en = content
+                msg['content_en'] = content  # 缓存英文版本
         
-        # 如果检测到新语言，确保保存它（_detect_language已经自动保存，这里确保一致性）
-        if user_language and user_language != 'other':
-            self.user_preferred_language = user_language
+        return {"role": role, "content": content_en}
+    
+    async def _prescreen_crisis_result(self, user_message: str, hit: Dict, context: TurnContext,
+                                       started: float) -> Dict:
+        """翻译前筛查命中时直接构建危机响应结果
+        
+        危机响应的语言见 crisis_language()：多种语言共有的短语（如 suicide）不会被当作其中某一种语言
+        """
+        local_language, confidence = detect_language_locally(user_message)
+        user_language = crisis_language(hit, local_language, confidence, context.preferred_language,
+                                        Settings.LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD)
+        context.preferred_language = user_language
+        
+        print(f"[WARNING] Pre-translation risk screen hit ({'/'.join(hit['languages'])}): '{hit['matched']}'")
+        response = await self._generate_crisis_response(
+            has_explicit_plan=hit['has_explicit_plan'], language=user_language
+        )
+        
+        return {
+            'response': response,
+            'sources': [],
+            'risk_level': 'high',
+            'has_explicit_plan': hit['has_explicit_plan'],
+            'stage': None,  # 高风险时不需要阶段
+            'critical_path': [('risk_prescreen', (time.perf_counter() - started) * 1000)],
+            'language': user_language,
+            'message_en': user_message if user_language == 'en' else None,
+            'response_en': response if user_language == 'en' else None
+        }
+    
+    def _fast_path_result(self, greeting: Dict, context: TurnContext, started: float) -> Dict:
+        """快速通道命中时直接构建结果（倾听阶段、无风险、无来源）"""
+        context.preferred_language = greeting['language']
+        print(f"[DEBUG] Fast path hit: category={greeting['category']}, language={greeting['language']}")
+        return {
+            'response': greeting['response'],
+            'sources': [],
+            'risk_level': 'none',
+            'has_explicit_plan': False,
+            'stage': 'empathy',
+            'critical_path': [('fast_path', (time.perf_counter() - started) * 1000)],
+            'language': greeting['language'],
+            'message_en': greeting['message_en'],
+            'response_en': greeting['response_en']
+        }
+    
+    async def _prepare_turn(self, user_message: str, conversation_history: List[Dict],
+                            context: TurnContext) -> Dict:
+        """生成前的所有步骤：语言检测、翻译、风险检测、阶段检测、检索、组装消息
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史（会话历史或请求携带的历史）
+            context: 本轮对话的请求级状态（首选语言等），步骤之间通过它共享状态，引擎本身不保存任何请求状态
+        
+        Returns:
+            'response' 不为None时（危机响应、无相关知识库内容）即为最终结果；
+            否则包含用于生成的 'messages'、'max_tokens'、'target_language' 以及阶段、来源等元数据
+        """
+        
+        # === 翻译前的风险筛查（多语言短语库，在原文上匹配，无需任何LLM调用）===
+        # 命中即立即返回危机响应；翻译后的英文正则检测（risk步骤）仍作为第二道防线
+        if Settings.RISK_PRESCREEN_ENABLED:
+            prescreen_started = time.perf_counter()
+            hit = self.risk_screener.screen(user_message)
+            metrics.observe_step('risk_prescreen', time.perf_counter() - prescreen_started)
+            if hit:
+                return await self._prescreen_crisis_result(user_message, hit, context, prescreen_started)
+        
+        # === 问候语快速通道（风险筛查之后；不调用OpenAI，也不访问向量库）===
+        if self.fast_path is not None:
+            fast_path_started = time.perf_counter()
+            greeting = self.fast_path.match(user_message, context.preferred_language,
+                                            has_history=bool(conversation_history))
+            metrics.observe_step('fast_path', time.perf_counter() - fast_path_started)
+            metrics.record_cache('fast_path', greeting is not None)
+            # 翻译前筛查关闭时也要先在原文上筛查一次，快速通道不能绕过风险检测
+            if greeting and (Settings.RISK_PRESCREEN_ENABLED or not self.risk_screener.screen(user_message)):
+                return self._fast_path_result(greeting, context, fast_path_started)
+        
+        # 预生成步骤按依赖关系并发执行：
+        # analysis → language → message_en / history_en（并发）→ risk / emotion / stage / 候选阶段的检索（并发）
+        # 轮次分析成功时 message_en 和 stage 直接取自分析结果，不再单独调用LLM，也只检索该阶段需要的知识库
+        graph = StepGraph()
+        
+        # === 轮次分析：一次结构化调用同时得到语言、英文翻译和阶段（失败时为None，回退到逐步处理） ===
+        async def analysis_step(results):
+            if not Settings.USE_TURN_ANALYSIS:
+                return None
+            return await self._analyze_turn(user_message, conversation_history, context.preferred_language)
+        
+        # === 第一步：检测并保存用户语言（本地检测不确定时采用轮次分析的结果，或单独调用LLM） ===
+        async def detect_language_step(results):
+            analysis = results['analysis']
+            user_language = await self._detect_language(
+                user_message,
+                context,
+                llm_hint=analysis['language'] if analysis else None
+            )
+            # 如果检测到新语言，确保保存它（_detect_language已经自动保存，这里确保一致性）
+            if user_language and user_language != 'other':
+                context.preferred_language = user_language
+            return user_language
         
         # === 第二步：翻译用户输入到英文（统一内部处理语言）===
-        user_message_en = self._translate_to_english(user_message, user_language)
+        async def translate_input_step(results):
+            analysis = results['analysis']
+            if analysis and analysis['message_en'] and results['language'] != 'en':
+                return analysis['message_en']
+            return await self._translate_to_english(user_message, results['language'])
+        
+        # === 优化对话历史翻译（避免重复翻译，各条消息并发翻译）===
+        async def translate_history_step(results):
+            if not conversation_history:
+                return None
+            return await asyncio.gather(*[
+                self._translate_history_message(msg, results['language'], context)
+                for msg in conversation_history
+            ])
         
-        # === 优化对话历史翻译（避免重复翻译）===
-        conversation_history_en = None
-        if conversation_history:
-            conversation_history_en = []
-            for msg in conversation_history:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                
-                # 检查是否已经有英文版本（避免重复翻译）
-                if msg.get('content_en'):
-                    # 如果已经缓存了英文版本，直接使用
-                    content_en = msg['content_en']
-                elif role == 'user':
-                    # 用户消息：翻译成英文
-                    content_en = self._translate_to_english(content, user_language)
-                    # 缓存英文版本（如果可能）
-                    if 'content_en' not in msg:
-                        msg['content_en'] = content_en
-                else:
-                    # AI消息：检测语言，只在非英文时翻译
-                    msg_lang = self._detect_language(content)
-                    if msg_lang != 'en':
-                        content_en = self._translate_to_english(content, msg_lang)
-                        msg['content_en'] = content_en
-                    else:
-                        content_en = content
-                        msg['content_en'] = content  # 缓存英文版本
-                
-                conversation_history_en.append({"role": role, "content": content_en})
+        # === 生成用的历史：token预算内的最近消息，较早的消息折叠进滚动摘要（每N轮最多一次摘要调用）===
+        async def history_context_step(results):
+            recent, summary, state = await self.history_manager.build(results['history_en'], context.history_summary)
+            context.history_summary = state
+            return recent, summary
         
         # === 安全引导模块（使用英文版本） ===
         # 0. 首先检测自杀风险（严格策略：任何自杀倾向都是高风险）
         # 使用翻译后的英文消息检测风险，传递原始用户语言用于生成响应
-        risk_assessment = self._detect_suicide_risk(user_message_en, user_language=user_language)
+        async def risk_step(results):
+            return await self._detect_suicide_risk(results['message_en'], user_language=results['language'])
         
-        # 如果检测到任何自杀倾向（均视为高风险），立即返回紧急响应
-        # _generate_crisis_response 已经根据用户语言返回了正确语言的响应
-        if risk_assessment['risk_level'] == 'high':
-            response = risk_assessment['response']  # 已经是用户的语言了
-            return {
-                'response': response,
-                'sources': [],
-                'risk_level': 'high',
-                'has_explicit_plan': risk_assessment.get('has_explicit_plan', False),
-                'stage': None  # 高风险时不需要阶段
-            }
+        # === 词库扫描：一遍匹配所有关键词类别，情绪识别和检索主题检测共享结果 ===
+        async def keywords_step(results):
+            return scan_keywords(results['message_en'])
         
         # === 情绪识别模块（使用英文版本） ===
         # 1. 分析用户消息的情绪强度和语气
-        emotion_analysis = self._analyze_emotion_intensity(user_message_en)
+        async def emotion_step(results):
+            return self._analyze_emotion_intensity(results['message_en'], results['keywords'])
         
         # === 阶段检测模块（基于语义理解，使用英文） ===
         # 2. 检测对话阶段（使用改进的语义理解方法）
-        conversation_stage = self._detect_conversation_stage(user_message_en, conversation_history_en)
+        async def stage_step(results):
+            if results['analysis']:
+                return results['analysis']['stage']
+            stage = await self._detect_conversation_stage(results['message_en'], results['history_en'])
+            # 阶段确定后取消不需要的推测检索（倾听阶段两个都不需要）
+            for candidate in RETRIEVAL_STAGES:
+                if candidate != stage:
+                    graph.cancel(f'docs_{candidate}')
+            return stage
         
         # === 检索模块（基于语义理解，使用英文） ===
-        # 3. 构建优化的语义查询
-        semantic_query = self._build_semantic_search_query(
-            user_message_en, 
-            conversation_stage, 
-            emotion_analysis
-        )
-        
-        # 4. 从向量数据库检索相关知识
-        # 根据阶段决定检索策略：
+        # 3. 轮次分析已给出阶段时只检索该阶段（倾听阶段不检索）；
+        #    否则在阶段检测期间为两个需要知识库的候选阶段推测检索，阶段确定后取消另一个
+        # 根据阶段决定检索策略（见 _retrieve_for_stage，阶段过滤在向量库内完成）：
         # - reflection阶段：优先检索assessment目录（评判类）
         # - support阶段：优先检索support目录（建议类）
         # ChromaDB使用cosine距离，分数越小表示相似度越高
         # 通常分数范围在0-2之间，0表示完全相似
-        # 检索更多文档以提高召回率和知识库内容引用
-        # support阶段检索更多文档，以便引用更多相关知识
-        retrieval_k = 30 if conversation_stage == 'support' else 20
-        relevant_docs = self.vectorstore.similarity_search_with_score(
-            semantic_query,  # 使用优化的语义查询而非原始用户消息
-            k=retrieval_k  # support阶段检索更多文档
+        def make_retrieval_step(candidate_stage: str):
+            async def retrieval_step(results):
+                if results['analysis'] and results['analysis']['stage'] != candidate_stage:
+                    return None
+                if self.bm25_index is not None:
+                    # 混合检索：具体词语的匹配交给BM25，不再拼接手选的关键词
+                    semantic_query = results['message_en']
+                else:
+                    # 使用优化的语义查询而非原始用户消息
+                    semantic_query = self._build_semantic_search_query(
+                        results['message_en'],
+                        candidate_stage,
+                        results['emotion'],
+                        results['keywords']
+                    )
+                try:
+                    return await self._retrieve_for_stage(semantic_query, candidate_stage)
+                except Exception as e:
+                    # 检索是推测性执行的：失败不能打断风险检测，只有最终选中该阶段时才抛出
+                    return e
+            return retrieval_step
+        
+        graph.add('analysis', analysis_step)
+        graph.add('language', detect_language_step, deps=('analysis',))
+        graph.add('message_en', translate_input_step, deps=('analysis', 'language'))
+        graph.add('history_en', translate_history_step, deps=('language',))
+        graph.add('history_context', history_context_step, deps=('history_en',))
+        graph.add('risk', risk_step, deps=('language', 'message_en'))
+        graph.add('keywords', keywords_step, deps=('message_en',))
+        graph.add('emotion', emotion_step, deps=('keywords',))
+        graph.add('stage', stage_step, deps=('analysis', 'message_en', 'history_en'))
+        for candidate in RETRIEVAL_STAGES:
+            graph.add(f'docs_{candidate}', make_retrieval_step(candidate),
+                      deps=('analysis', 'message_en', 'emotion', 'keywords'))
+        
+        # 检测到高风险时立即返回，不再等待阶段检测和检索
+        results = await graph.run(
+            stop_when=lambda name, result: name == 'risk' and result['risk_level'] == 'high'
         )
+        critical_path = graph.critical_path()
+        for name, (step_started, step_finished) in graph.timings.items():
+            if name.startswith('docs_') and results.get(name) is None:
+                continue  # 轮次分析给出了其他阶段，没有检索
+            metrics.observe_step(_STEP_METRIC_NAMES.get(name, name), step_finished - step_started)
+        print(f"[DEBUG] Critical path: {' -> '.join(f'{name} {ms:.0f}ms' for name, ms in critical_path)}")
+        
+        user_language = results['language']
+        user_message_en = results['message_en']
+        risk_assessment = results['risk']
+        
+        # 如果检测到任何自杀倾向（均视为高风险），立即返回紧急响应
+        # _generate_crisis_response 已经根据用户语言返回了正确语言的响应
+        if risk_assessment['risk_level'] == 'high':
+            response = risk_assessment['response']  # 已经是用户的语言了
+            return {
+                'response': response,
+                'sources': [],
+                'risk_level': 'high',
+                'has_explicit_plan': risk_assessment.get('has_explicit_plan', False),
+                'stage': None,  # 高风险时不需要阶段
+                'critical_path': critical_path,
+                'language': user_language,
+                'message_en': user_message_en,
+                'response_en': response if user_language == 'en' else None
+            }
         
-        # 根据阶段过滤文档
+        recent_history_en, history_summary = results['history_context']
+        history_summary_state = context.history_summary
+        emotion_analysis = results['emotion']
+        conversation_stage = results['stage']
+        
+        stage_docs = results.get(f'docs_{conversation_stage}')
+        if isinstance(stage_docs, Exception):
+            raise stage_docs
+        
+        # 检索结果已经按阶段过滤（见 _retrieve_for_stage）
         if conversation_stage == 'empathy':
             # empathy阶段：完全不使用知识库内容，专注于倾听
             # 排除所有文档，因为empathy阶段不应分享知识库内容
-            filtered_by_stage = []
             relevant_docs = []
-        elif conversation_stage == 'reflection':
-            # 理解阶段：优先使用assessment目录的文档
-            # 同时允许general目录的文档通过（不特定于任何阶段）
-            filtered_by_stage = [
-                (doc, score) for doc, score in relevant_docs
-                if 'assessment' in doc.metadata.get('source', '').lower() or
-                'general' in doc.metadata.get('source', '').lower()
-            ]
-            # 如果没有找到，使用所有文档
-            if not filtered_by_stage:
-                filtered_by_stage = relevant_docs
-            relevant_docs = filtered_by_stage
-        elif conversation_stage == 'support':
-            # 引导阶段：优先使用support目录的文档
-            # 同时允许general目录的文档通过（不特定于任何阶段）
-            filtered_by_stage = [
-                (doc, score) for doc, score in relevant_docs
-                if 'support' in doc.metadata.get('source', '').lower() or
-                'general' in doc.metadata.get('source', '').lower()
-            ]
-            # 如果没有找到，使用所有文档
-            if not filtered_by_stage:
-                filtered_by_stage = relevant_docs
-            relevant_docs = filtered_by_stage
+        else:
+            relevant_docs = stage_docs
         
         # 2. 分析用户需求并检查相关性
         # ChromaDB使用cosine距离，分数越小越好
@@ -1728,20 +2125,27 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
         if len(filtered_docs) == 0:
             # 如果是empathy阶段，即使没有知识库内容，也继续让LLM处理（让LLM理解用户意图）
             if conversation_stage == 'empathy':
-                # 继续执行后续的LLM生成流程，context为空即可
+                # 继续执行后续的LLM生成流程，kb_context为空即可
                 pass
             else:
                 # 如果没有找到相关的知识库内容（reflection或support阶段）
-                # 统一使用英文生成回复，然后翻译回用户语言
-                response_en = "I understand your question. However, I don't currently have content in my knowledge base that directly relates to your question. To ensure I can provide you with accurate and helpful assistance, I suggest:\n\n1. Rephrase your question using more specific keywords\n2. Break the question down into smaller parts\n3. If you need urgent mental health support, please seek help from a mental health professional\n\nIf you have other mental health-related questions, I'm happy to help by finding relevant information from my knowledge base."
-                response_user_lang = self._translate_to_user_language(response_en, user_language)
+                # 统一使用英文原文，优先取预渲染目录中的译文，没有时再翻译回用户语言
+                response_en = NO_KB_RESPONSE_EN
+                response_user_lang = self.message_catalog.message('no_kb', user_language)
+                if response_user_lang is None:
+                    response_user_lang = await self._translate_to_user_language(response_en, user_language)
                 return {
                     "response": response_user_lang,
                     "sources": [],
                     "risk_level": risk_assessment['risk_level'],
                     "stage": conversation_stage,
                     "emotion_analysis": emotion_analysis,
-                    "has_explicit_plan": risk_assessment.get('has_explicit_plan', False)
+                    "has_explicit_plan": risk_assessment.get('has_explicit_plan', False),
+                    "critical_path": critical_path,
+                    "history_summary": history_summary_state,
+                    "language": user_language,
+                    "message_en": user_message_en,
+                    "response_en": response_en
                 }
         
         # Debug information (optional, can be removed in production)
@@ -1751,268 +2155,364 @@ I'm here with you, and I want to listen. Would you like to tell me more about ho
         
         # === 生成模块（统一使用英文） ===
         # 5. 组装上下文
-        context = "\n\n".join([
+        kb_context = "\n\n".join([
             f"[Knowledge Fragment {i+1}]:\n{doc.page_content}"
             for i, (doc, score) in enumerate(filtered_docs)
         ])
         
-        # 6. 构建消息（统一使用英文系统提示词，但明确指示要用用户语言回复）
-        # 注意：虽然系统prompt是英文，但我们需要明确告诉LLM要用用户的语言回复
-        system_prompt_en = self._get_system_prompt(stage=conversation_stage, language='en')
-        
-        # 如果用户语言不是英文，在系统prompt中添加语言指示
-        if user_language != 'en':
-            # 获取友好的语言名称
-            language_names_map = {
-                'zh': 'Chinese (Simplified Chinese)',
-                'es': 'Spanish',
-                'fr': 'French',
-                'de': 'German',
-                'hi': 'Hindi',
-                'ja': 'Japanese',
-                'ko': 'Korean',
-                'it': 'Italian',
-                'pt': 'Portuguese',
-                'ru': 'Russian',
-                'ar': 'Arabic',
-            }
-            target_lang_name = language_names_map.get(user_language, user_language)
-            
-            language_instruction = f"""
-
-**CRITICAL LANGUAGE REQUIREMENT**: 
-The user's input language is {target_lang_name} (language code: {user_language}). 
-You MUST respond ENTIRELY in {target_lang_name}, NOT in English. 
-- Translate ALL your responses into {target_lang_name}
-- Translate ALL knowledge base content into {target_lang_name}
-- Translate ALL examples and suggestions into {target_lang_name}
-- Do NOT mix languages - use ONLY {target_lang_name}
-- If you use any quotes or examples, translate them to {target_lang_name} as well
-
-This is extremely important - the user expects responses in {target_lang_name}, not English."""
-            system_prompt_en = system_prompt_en + language_instruction
-        
+        # 6. 构建消息：静态部分（阶段提示词 + 阶段指引 + 语言要求）在前，每次请求完全相同，可以命中提示词缓存；
+        # 随请求变化的部分（历史摘要、最近历史、知识库内容、用户消息）放在最后
         messages = [
-            {"role": "system", "content": system_prompt_en}
+            {"role": "system", "content": self._stage_prompt(conversation_stage, user_language)}
         ]
         
-        # 添加对话历史（上下文理解，使用英文版本）
-        if conversation_history_en:
-            # 只提取role和content，移除可能的metadata
-            messages.extend([
-                {"role": msg.get('role'), "content": msg.get('content')}
-                for msg in conversation_history_en[-10:]
-            ])
+        # 添加对话历史（上下文理解，使用英文版本）：较早内容的摘要 + token预算内的最近消息
+        if history_summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{history_summary}"})
+        messages.extend(recent_history_en)
         
-        # 7. 添加当前查询和上下文（统一使用英文版本，因为系统内部统一用英文处理）
+        # 7. 添加知识库内容和当前消息（统一使用英文版本，因为系统内部统一用英文处理）
         if conversation_stage == 'empathy':
             # empathy阶段：专注于倾听，不分享知识库内容
-            # 这个阶段的目标是让用户把心里的不开心讲出来，不要急于分享统计或知识
-            # 统一使用英文提示词（因为user_message_en已经是英文）
-            user_content = f"""User message: {user_message_en}
-
-⚠️ **Important: First, analyze the user's message to understand their intent**
-
-**Analyze the message type:**
-- **Simple greeting** (hi, hello, hey, etc.) → Respond naturally: "Hi! How can I help you today?"
-- **Casual conversation starter** → Respond warmly and invite them to share: "How are you doing?"
-- **Actually expressing emotions or distress** → Use empathy and acknowledge their feelings
-
-**Response Guidelines:**
-1. **For simple greetings or casual messages:**
-   - Respond naturally and warmly
-   - Invite them to share: "Is there something on your mind?" or "What brings you here today?"
-   - Keep it simple, friendly, and welcoming
-
-2. **For emotional expressions:**
-   - Acknowledge the emotion you hear (simple 1 sentence, avoid clichés)
-   - Example: "That sounds really hard." or "That must be heavy."
-   - **Don't** say "It sounds like you're really feeling sad right now" (too formal)
-   - **Don't** say "I can feel that you're going through some difficult times" (too long, too official)
-   - Encourage the user to continue expressing (Focus, 1-2 sentences)
-   - Example: "I'm here, tell me more."
-   - Example: "You can say anything."
-   - Example: "Keep going, I'm listening."
-
-3. **Simple response** (Optional, 1 sentence)
-   - "Yeah, I hear you."
-   - Don't say "I understand" or "This is really hard" (too cliché)
-
-4. **Ask a question to continue the conversation** (**Must**, last sentence)
-   - Ask naturally, make them want to keep talking
-   - Examples: "What happened?" "What else would you like to say?" "Want to talk?"
-   - Even if you've already invited sharing, end with a question
-   - Don't ask formal questions like "Would you like to continue sharing?"
-
-⚠️ **Strictly forbidden** (only when user is expressing distress):
-- ❌ Do NOT provide crisis resources or hotlines (988, Talk Suicide Canada, etc.) unless the user explicitly expresses suicidal thoughts or severe crisis
-- ❌ Do NOT share statistics ("many people have", "research shows")
-- ❌ Do NOT quote or reference knowledge base content (completely ignore any knowledge base content if provided)
-- ❌ Do NOT explain reasons (why this happens)
-- ❌ Do NOT give advice or provide resources
-- ❌ Do NOT use professional jargon
-
-✅ **Response should match intent:**
-- Simple greeting → Simple, warm greeting response
-- Emotional expression → Empathetic acknowledgment of their feelings
-- Encourage the user to continue expressing, let them share what's bothering them
-- Let the user know you're here listening
-
-**Important: You MUST end every response with a question** to keep the conversation going:
-- Natural, easy way to ask
-- Open-ended, easy for them to answer
-- Make them want to keep talking
-
-Goal: Understand what the user actually needs - is this a greeting or genuine emotional expression? Respond accordingly. Always end with a question."""
-        
-        elif conversation_stage == 'reflection':
-            # 统一使用英文提示词
-            user_content = f"""User message: {user_message_en}
-
-=== Knowledge Base Content (assessment - evaluation and statistics) ===
-{context}
-=== End of Knowledge Base Content ===
-
-⚠️ Important: You are now an **Understanding Guide**, follow the example style
-
-Your tasks (be natural, like chatting with a friend):
-1. **Acknowledge understanding** (simple 1 sentence)
-   - "I understand." or "Yeah, I know."
-   - Don't say "I understand this feeling", too formal
-
-2. **Naturally share similar experiences** (Key, but be natural)
-   - **Don't** say "the knowledge base mentions" or "an article says" (too stiff)
-   - **Do** like you suddenly remembered something: "Actually, many people have this feeling..."
-   - Or: "I remember reading that many people after a breakup..." (naturally integrate)
-   - **Can** quote specific warm statements, but with natural transition
-   - Example (good): "Actually, many people feel this way after a breakup. I've seen some articles mention, 'Losing someone important is like losing a world.' That's true."
-   - Example (bad): "The knowledge base mentions that post-breakup pain is normal. According to research..."
-
-3. **Give encouragement** (1 sentence, be real)
-   - "You don't have to carry this alone."
-   - "You're already brave." (Don't say "taking that first step", too official)
-   - Short, direct, warm
-
-4. **Ask a question to continue the conversation** (**Must**, last sentence)
-   - Ask naturally, make them want to keep talking
-   - Examples: "What else would you like to say?" "How are you feeling now?" "Want to talk more?"
-   - Don't ask formal: "Would you like to continue sharing?"
-   - Questions should be open-ended, easy to answer
-
-⚠️ Forbidden:
-- ❌ Don't say "the knowledge base mentions" (too stiff)
-- ❌ Don't write "according to research shows" (too academic)
-- ❌ Don't use "according to data", "research shows" (lacks warmth)
-- ❌ Don't act like "I looked up information"
-
-✅ Requirements:
-- ✅ Tone should be like chatting with a friend, not reading materials
-- ✅ Knowledge base content should naturally integrate into conversation, not stiff quotes
-- ✅ Goal is to make them feel understood and "not the only one"
-- ✅ **MUST end every response with a question** to keep the conversation going. Examples: 'What else would you like to say?' 'How are you feeling now?' 'Want to talk more?' """
-        
-        else:  # support阶段
-            # 统一使用英文提示词
-            user_content = f"""User question: {user_message_en}
-
-=== Knowledge Base Content (support - advice and resources) ===
-{context}
+            user_content = f"User message: {user_message_en}"
+        else:
+            user_content = f"""=== Knowledge Base Content ({KB_CONTENT_LABELS[conversation_stage]}) ===
+{kb_context}
 === End of Knowledge Base Content ===
 
-⚠️ Important: You are now a **Resource Guide**, follow the example style
-
-Your tasks (be natural, with companionship feeling):
-1. **Respond to their needs first** (Must respond first, don't jump to resources)
-   - If user asks "Can you counsel me?":
-     - Don't say: "I'm not a psychologist, but I can help you find appropriate resources" (too stiff)
-     - Do say: "I wish I could help you more. Although I'm not a professional psychologist, I can chat with you and listen. If you need more professional help, there are some good resources..."
-   - Express willingness to accompany first, then naturally introduce resources
-
-2. **MUST extensively use knowledge base content** (CRITICAL - This is the most important part)
-   - **You MUST reference and cite specific information from the knowledge base content above**
-   - **Use multiple knowledge fragments** - Don't just use one piece of information, combine insights from different fragments
-   - **Cite specific strategies, techniques, examples** from the knowledge base
-   - **Quote or paraphrase key concepts** from the knowledge base content
-   - Examples of good usage:
-     * "Based on what I know, there's a technique called 'empathetic curiosity' that can help..."
-     * "One approach that might work is the 'walk and talk' method - where you..."
-     * "Research shows that movement can release dopamine and serotonin, which..."
-     * "There's a concept called 'keystone habits' - small actions that..."
-   - **Don't** just give generic advice - use the specific content from knowledge base
-   - **Don't** say "the knowledge base mentions" (too stiff), but DO use the actual content naturally
-   - **Integrate multiple points** from different knowledge fragments into your response
-
-3. **Continue companionship** (**Must** have this sentence)
-   - "I'll still be here to chat with you, you can say anything."
-   - "I'll continue listening, anything you want to tell me."
-   - Let user know you're **here to accompany and support them**
-
-4. **Ask a question to continue the conversation** (**Must**, last sentence)
-   - Ask naturally, make them want to keep talking
-   - Examples: "What else would you like to talk about?" "How are you feeling now?" "Is there anything else you'd like to say?"
-   - Don't ask formal: "Would you like to continue our conversation?"
-
-⚠️ Key requirements:
-- ✅ **MOST IMPORTANT: Extensively use knowledge base content** - Reference multiple fragments, cite specific strategies, techniques, and concepts
-- ✅ **Most important is companionship feeling** - make user feel you're still here to support them
-- ✅ **DO NOT provide emergency resources** (988, 1-833-456-4566, 911) unless the user explicitly mentions serious crisis or danger
-- ✅ Focus on providing helpful advice and strategies from the knowledge base
-- ✅ Tone should be real, natural, like a friend sharing helpful information
-- ✅ **MUST end every response with a question** to keep the conversation going. Examples: 'What else would you like to talk about?' 'How are you feeling now?' 'Is there anything else you'd like to say?' """
-        
-        # 用户提示词已统一为英文版本（user_message_en）
-        
+{'User message' if conversation_stage == 'reflection' else 'User question'}: {user_message_en}"""
         messages.append({"role": "user", "content": user_content})
         
-        # 7. 调用fine-tuned模型
-        # support阶段增加max_tokens以便引用更多知识库内容
-        max_tokens = 1500 if conversation_stage == 'support' else 1000
-        response = self.client.chat.completions.create(
-            model=Settings.FINETUNED_MODEL,
-            messages=messages,
-            temperature=Settings.TEMPERATURE,
-            max_tokens=max_tokens
-        )
-        
-        assistant_response_en = response.choices[0].message.content
-        
-        # 8. 将英文回复翻译回用户原语言（如果用户语言是英文则跳过翻译）
-        # 优先使用本次检测到的语言，如果没有则使用保存的首选语言
-        target_language = user_language or self.user_preferred_language or 'en'
-        
-        if target_language == 'en':
-            assistant_response = assistant_response_en  # 直接使用，无需翻译
-        else:
-            # 检查回复是否已经是用户语言（LLM可能已经翻译了）
-            # 使用update_preferred=False避免检测响应语言时覆盖用户的首选语言
-            detected_response_lang = self._detect_language(assistant_response_en, update_preferred=False)
-            
-            # 如果回复已经是用户语言，直接使用；否则翻译
-            if detected_response_lang == target_language:
-                assistant_response = assistant_response_en
-            else:
-                # 翻译回用户语言（使用保存的语言）
-                assistant_response = self._translate_to_user_language(assistant_response_en, target_language)
-        
-        # 9. 提取来源信息
+        # 提取来源信息（不依赖生成结果，流式接口可以在生成前先发出）
         sources = [
             {
                 "content": doc.page_content[:200] + "...",
                 "score": float(score),
                 "distance": float(score),  # 距离分数（越小越相关）
-                "source_file": doc.metadata.get('source', 'Unknown').split('\\')[-1] if '\\' in doc.metadata.get('source', '') else doc.metadata.get('source', 'Unknown').split('/')[-1],
-                "category": self._extract_category(doc.metadata.get('source', ''))
+                # 入库时已写入文件名和类别；旧集合的文档块没有这两个字段时从来源路径推导
+                "source_file": doc.metadata.get('source_file') or source_file(doc.metadata.get('source', 'Unknown')),
+                "category": doc.metadata.get('category') or kb_category(relative_source(doc.metadata.get('source', '')))
             }
             for doc, score in filtered_docs[:Settings.TOP_K_RETRIEVAL]
         ]
         
-        # === 返回结果（包含所有模块信息） ===
         return {
-            "response": assistant_response,  # 已翻译为用户语言
+            "response": None,  # 尚未生成
+            "messages": messages,
+            # support阶段增加max_tokens以便引用更多知识库内容
+            "max_tokens": 1500 if conversation_stage == 'support' else 1000,
+            # 优先使用本次检测到的语言，如果没有则使用保存的首选语言
+            "target_language": user_language or context.preferred_language or 'en',
             "sources": sources,
             "risk_level": risk_assessment['risk_level'],
             "stage": conversation_stage,
             "emotion_analysis": emotion_analysis,  # 情绪识别模块的结果
-            "has_explicit_plan": risk_assessment.get('has_explicit_plan', False)
+            "has_explicit_plan": risk_assessment.get('has_explicit_plan', False),
+            "critical_path": critical_path,  # 本轮预生成步骤的关键路径 [(步骤名, 毫秒), ...]
+            "history_summary": history_summary_state,  # 滚动摘要状态（保存到会话）
+            "language": user_language,
+            "message_en": user_message_en
         }
-
+    
+    async def _localize_response(self, assistant_response_en: str, target_language: str, context: TurnContext) -> str:
+        """将英文回复翻译回用户原语言（如果用户语言是英文或LLM已直接用用户语言回复则跳过翻译）"""
+        if target_language == 'en':
+            return assistant_response_en  # 直接使用，无需翻译
+        
+        # 检查回复是否已经是用户语言（LLM可能已经翻译了）
+        # 使用update_preferred=False避免检测响应语言时覆盖用户的首选语言
+        detected_response_lang = await self._detect_language(assistant_response_en, context, update_preferred=False)
+        
+        # 如果回复已经是用户语言，直接使用；否则翻译
+        if detected_response_lang == target_language:
+            return assistant_response_en
+        
+        # 翻译回用户语言（使用保存的语言）
+        with metrics.timer('back_translation'):
+            return await self._translate_to_user_language(assistant_response_en, target_language)
+    
+    def cache_stats(self) -> Dict:
+        """各缓存的命中/未命中/淘汰统计，供监控使用"""
+        return {
+            'translation': self._translation_cache.stats(),
+            'embedding': embedding_cache_stats(self.embeddings),
+            'response': self.response_cache.stats() if self.response_cache is not None else None,
+            'prompt': self.prompt_usage.stats(),
+            'history_summary': self.history_manager.stats()
+        }
+    
+    def fast_path_stats(self) -> Optional[Dict]:
+        """快速通道处理的轮次占比，未启用时返回None"""
+        return self.fast_path.stats() if self.fast_path is not None else None
+    
+    async def _response_cache_embedding(self, turn: Dict, conversation_history: List[Dict]) -> Optional[List[float]]:
+        """本轮可以使用回复缓存时返回英文消息的查询向量，否则返回None
+        
+        只缓存倾听阶段、没有对话历史、风险级别为 none 的轮次：这时回复只取决于消息本身、阶段和语言，
+        不包含知识库内容，也不涉及危机处理
+        """
+        if (self.response_cache is None or turn['response'] is not None or turn['stage'] != 'empathy'
+                or turn['risk_level'] != 'none' or conversation_history or not turn.get('message_en')):
+            return None
+        try:
+            return await self.embeddings.aembed_query(turn['message_en'])
+        except Exception as e:
+            print(f"[WARNING] Response cache embedding failed: {e}")
+            metrics.record_fallback('response_cache_skipped')
+            return None
+    
+    def _public_result(self, turn: Dict, response: str) -> Dict:
+        """去掉内部字段，得到对外返回的结果"""
+        result = {key: value for key, value in turn.items() if key not in _INTERNAL_TURN_KEYS}
+        result['response'] = response
+        return result
+    
+    async def _load_session(self, session_id: Optional[str],
+                            conversation_history: List[Dict] = None) -> Tuple[str, Dict, bool]:
+        """读取会话
+        
+        会话ID只由服务端生成：没有提供会话ID，或会话不存在（已过期、服务重启、内存会话在其他worker上）时，
+        生成新ID开始新会话，并用请求携带的 conversation_history 初始化，客户端保留的历史因此不会丢失。
+        
+        Returns:
+            (会话ID, 会话, 请求的会话ID是否已失效)
+        """
+        session = await self.session_store.get(session_id) if session_id else None
+        if session is not None:
+            return session_id, session, False
+        if session_id:
+            print("[WARNING] Unknown or expired session, starting a new one")
+        session = new_session()
+        session['history'] = [dict(msg) for msg in (conversation_history or [])]
+        return new_session_id(), session, bool(session_id)
+    
+    async def _record_turn(self, session_id: str, session: Dict, user_message: str, turn: Dict,
+                           response: str, response_en: Optional[str]):
+        """把本轮的用户消息和回复（含英文版本）追加到会话并保存"""
+        session['history'].append({"role": "user", "content": user_message, "content_en": turn.get('message_en')})
+        session['history'].append({"role": "assistant", "content": response, "content_en": response_en})
+        dropped = max(0, len(session['history']) - Settings.SESSION_MAX_MESSAGES)
+        session['history'] = session['history'][dropped:]
+        summary = turn.get('history_summary', session.get('history_summary'))
+        if summary and dropped:
+            # 摘要覆盖的位置随裁掉的消息前移（摘要文本仍然保留最早的内容）
+            summary = dict(summary, covered=max(0, summary['covered'] - dropped))
+        session['history_summary'] = summary
+        session['language'] = turn.get('language') or session.get('language')
+        session['stage'] = turn.get('stage') or session.get('stage')
+        await self.session_store.save(session_id, session)
+    
+    async def chat(self, user_message: str, conversation_history: List[Dict] = None, session_id: str = None) -> Dict:
+        """RAG聊天 - 整合语义理解和上下文推理
+        
+        统一处理流程：
+        1. 检测用户语言
+        2. 将用户输入翻译成英文（如果已经是英文则跳过）
+        3. 系统内部统一使用英文处理
+        4. 将英文回复翻译回用户原语言返回
+        
+        提供 session_id 时使用服务端会话中的历史（已带英文版本，无需重复翻译），
+        此时 conversation_history 只在会话不存在时用于初始化。结果中的 session_id 是本轮实际使用的会话ID
+        （新会话时由服务端生成），session_reset 表示请求的会话已失效、换成了新会话。
+        """
+        turn_metrics = metrics.begin_turn()
+        try:
+            return await self._chat(user_message, conversation_history, session_id)
+        finally:
+            metrics.end_turn(turn_metrics)
+    
+    async def _chat(self, user_message: str, conversation_history: List[Dict], session_id: Optional[str]) -> Dict:
+        """chat() 的实现（本轮的指标由 chat() 统一记录）"""
+        session_id, session, session_reset = await self._load_session(session_id, conversation_history)
+        context = TurnContext(preferred_language=session.get('language'),
+                              history_summary=session.get('history_summary'))
+        history = session['history']
+        turn = await self._prepare_turn(user_message, history, context)
+        turn.update(session_id=session_id, session_reset=session_reset)
+        metrics.label_turn(stage=turn['stage'] or ('crisis' if turn['risk_level'] == 'high' else None),
+                           language=turn.get('language'))
+        
+        # 危机响应、无知识库内容提示等已经是最终回复
+        if turn['response'] is not None:
+            await self._record_turn(session_id, session, user_message, turn, turn['response'], turn.get('response_en'))
+            return self._public_result(turn, turn['response'])
+        
+        # 近似重复的开场消息直接使用缓存的回复
+        cache_embedding = await self._response_cache_embedding(turn, history)
+        if cache_embedding is not None:
+            cached = self.response_cache.get(turn['stage'], turn['target_language'], cache_embedding)
+            metrics.record_cache('response', cached is not None)
+            if cached is not None:
+                assistant_response, assistant_response_en = cached
+                await self._record_turn(session_id, session, user_message, turn, assistant_response, assistant_response_en)
+                return self._public_result(turn, assistant_response)
+        
+        # 7. 调用fine-tuned模型
+        with metrics.timer('generation'):
+            response = await self._create_completion(turn['messages'], turn['max_tokens'])
+        
+        assistant_response_en = response.choices[0].message.content
+        
+        # 8. 将英文回复翻译回用户原语言（如果用户语言是英文则跳过翻译）
+        assistant_response = await self._localize_response(assistant_response_en, turn['target_language'], context)
+        
+        await self._record_turn(session_id, session, user_message, turn, assistant_response, assistant_response_en)
+        if cache_embedding is not None:
+            self.response_cache.put(turn['stage'], turn['target_language'], cache_embedding,
+                                    assistant_response, assistant_response_en)
+        
+        # === 返回结果（包含所有模块信息） ===
+        return self._public_result(turn, assistant_response)  # response 已翻译为用户语言
+    
+    async def chat_stream(self, user_message: str, conversation_history: List[Dict] = None,
+                          session_id: str = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """流式RAG聊天，逐步产出 (事件名, 数据) 事件
+        
+        事件顺序：
+        - 'meta'：阶段、风险级别、来源、会话ID等元数据，在生成开始前发出
+        - 'token'：回复文本片段（需要回译时按句子翻译后发出）
+        - 'done'：完整回复
+        """
+        turn_metrics = metrics.begin_turn()
+        try:
+            async for event in self._chat_stream(user_message, conversation_history, session_id):
+                yield event
+        finally:
+            metrics.end_turn(turn_metrics)
+    
+    async def _chat_stream(self, user_message: str, conversation_history: List[Dict],
+                           session_id: Optional[str]) -> AsyncIterator[Tuple[str, Dict]]:
+        """chat_stream() 的实现（本轮的指标由 chat_stream() 统一记录）"""
+        session_id, session, session_reset = await self._load_session(session_id, conversation_history)
+        context = TurnContext(preferred_language=session.get('language'),
+                              history_summary=session.get('history_summary'))
+        history = session['history']
+        turn = await self._prepare_turn(user_message, history, context)
+        turn.update(session_id=session_id, session_reset=session_reset)
+        metrics.label_turn(stage=turn['stage'] or ('crisis' if turn['risk_level'] == 'high' else None),
+                           language=turn.get('language'))
+        
+        yield 'meta', {
+            "stage": turn.get('stage'),
+            "risk_level": turn.get('risk_level', 'none'),
+            "sources": turn.get('sources', []),
+            "has_explicit_plan": turn.get('has_explicit_plan', False),
+            "session_id": session_id,
+            "session_reset": session_reset
+        }
+        
+        # 危机响应等固定回复一次性发出
+        if turn['response'] is not None:
+            await self._record_turn(session_id, session, user_message, turn, turn['response'], turn.get('response_en'))
+            yield 'token', {"text": turn['response']}
+            yield 'done', {"response": turn['response']}
+            return
+        
+        # 近似重复的开场消息直接使用缓存的回复
+        cache_embedding = await self._response_cache_embedding(turn, history)
+        if cache_embedding is not None:
+            cached = self.response_cache.get(turn['stage'], turn['target_language'], cache_embedding)
+            metrics.record_cache('response', cached is not None)
+            if cached is not None:
+                response, response_en = cached
+                await self._record_turn(session_id, session, user_message, turn, response, response_en)
+                yield 'token', {"text": response}
+                yield 'done', {"response": response}
+                return
+        
+        generation_started = time.perf_counter()
+        stream = await self._create_completion(turn['messages'], turn['max_tokens'], stream=True)
+        usage = None
+        
+        target_language = turn['target_language']
+        translate = None  # None: 尚未判断；False: 直接透传；True: 按句子回译
+        buffer = ""
+        pending_translations: List[asyncio.Task] = []
+        response_parts = []
+        generated_parts = []  # 模型原始输出（回译时即英文版本）
+        
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+                self._record_prompt_usage(usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            if not generated_parts:
+                metrics.observe_step('generation_first_token', time.perf_counter() - generation_started)
+            generated_parts.append(delta)
+            
+            if translate is False:
+                response_parts.append(delta)
+                yield 'token', {"text": delta}
+                continue
+            
+            buffer += delta
+            sentences, buffer = _split_complete_sentences(buffer)
+            if not sentences:
+                continue
+            
+            if translate is None:
+                # 用第一句话判断LLM是否已经直接用用户语言回复
+                if target_language == 'en':
+                    translate = False
+                else:
+                    detected = await self._detect_language(sentences[0], context, update_preferred=False)
+                    translate = detected != target_language
+                
+                if translate is False:
+                    text = "".join(sentences) + buffer
+                    buffer = ""
+                    response_parts.append(text)
+                    yield 'token', {"text": text}
+                    continue
+            
+            # 需要回译：每个完整句子立即开始翻译，按原顺序发出
+            pending_translations.extend(
+                asyncio.create_task(self._translate_sentence(sentence, target_language))
+                for sentence in sentences
+            )
+            while pending_translations and pending_translations[0].done():
+                text = pending_translations.pop(0).result()
+                response_parts.append(text)
+                yield 'token', {"text": text}
+        
+        generation_seconds = time.perf_counter() - generation_started
+        metrics.observe_step('generation', generation_seconds)
+        metrics.record_llm_call('generation', generation_seconds, usage)
+        
+        # 处理剩余的未完结文本
+        if buffer:
+            if translate is None:
+                # 整个回复不足一句，此时再判断是否需要回译
+                translate = target_language != 'en' and \
+                    await self._detect_language(buffer, context, update_preferred=False) != target_language
+            if translate:
+                pending_translations.append(asyncio.create_task(self._translate_sentence(buffer, target_language)))
+            else:
+                response_parts.append(buffer)
+                yield 'token', {"text": buffer}
+        
+        for task in pending_translations:
+            text = await task
+            response_parts.append(text)
+            yield 'token', {"text": text}
+        
+        response = "".join(response_parts)
+        response_en = "".join(generated_parts) if (translate or target_language == 'en') else None
+        await self._record_turn(session_id, session, user_message, turn, response, response_en)
+        if cache_embedding is not None:
+            self.response_cache.put(turn['stage'], target_language, cache_embedding, response, response_en)
+        
+        yield 'done', {"response": response}
+    
+    async def _translate_sentence(self, sentence: str, target_language: str) -> str:
+        """翻译单个句子，保留句末的空白（换行、空格），便于流式拼接"""
+        stripped = sentence.rstrip()
+        if not stripped.strip():
+            return sentence
+        with metrics.timer('back_translation'):
+            translated = await self._translate_to_user_language(stripped, target_language)
+        return translated + sentence[len(stripped):]
@@ -0,0 +1,135 @@
+"""语义回复缓存
+
+大量首轮消息是问候和几乎相同的开场白（"hi"、"hello"、"I feel sad"、"I'm lonely"），每条都要完整生成一次。
+这里按 (对话阶段, 回复语言) 分组，用英文查询向量的余弦相似度找近似重复的消息，直接返回之前生成的回复：
+- 每条缓存保存若干个不同的回复（variants），凑满之前近似命中仍然正常生成并补充进来，凑满后随机返回其中一个
+- 按TTL过期、按条目上限LRU淘汰
+- 命中/未命中/补充/淘汰计数，供监控使用
+
+是否可以缓存由调用方决定（RAGEngine 只缓存倾听阶段、没有对话历史、风险级别为 none 的轮次）。
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ('bucket', 'vector', 'variants', 'created_at')
+
+    def __init__(self, bucket: Tuple[str, str], vector: np.ndarray):
+        self.bucket = bucket
+        self.vector = vector
+        self.variants: List[Tuple[str, Optional[str]]] = []  # (回复, 英文回复)
+        self.created_at = time.time()
+
+
+class ResponseCache:
+    """线程安全的语义回复缓存"""
+
+    def __init__(self, threshold: float, variants: int, max_entries: int, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            threshold: 视为同一条消息的余弦相似度下限
+            variants: 每条缓存保存的回复数
+            max_entries: 条目上限（超出时淘汰最久未使用的条目）
+            ttl_seconds: 条目有效期，None表示不过期
+        """
+        self.threshold = threshold
+        self.variants = variants
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str], List[int]] = {}
+        self._matrices: Dict[Tuple[str, str], np.ndarray] = {}  # 各分组的向量矩阵（分组变化时重建）
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0  # 找到近似消息但回复还没凑满，仍需生成
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._buckets[entry.bucket].remove(entry_id)
+        self._matrices.pop(entry.bucket, None)
+
+    def _nearest(self, bucket: Tuple[str, str], vector: np.ndarray) -> Optional[int]:
+        """分组中与查询向量最相似且超过阈值的条目（顺带清理过期条目）"""
+        if self.ttl_seconds:
+            now = time.time()
+            for entry_id in [i for i in self._buckets.get(bucket, ()) if now - self._entries[i].created_at > self.ttl_seconds]:
+                self._remove(entry_id)
+                self.expirations += 1
+        entry_ids = self._buckets.get(bucket)
+        if not entry_ids:
+            return None
+        matrix = self._matrices.get(bucket)
+        if matrix is None:
+            matrix = np.stack([self._entries[i].vector for i in entry_ids])
+            self._matrices[bucket] = matrix
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        return entry_ids[best] if similarities[best] >= self.threshold else None
+
+    def get(self, stage: str, language: str, embedding: Sequence[float]) -> Optional[Tuple[str, Optional[str]]]:
+        """查找近似消息的缓存回复，返回 (回复, 英文回复)；未命中或回复还没凑满时返回None"""
+        with self._lock:
+            entry_id = self._nearest((stage, language), self._normalize(embedding))
+            if entry_id is None:
+                self.misses += 1
+                return None
+            entry = self._entries[entry_id]
+            self._entries.move_to_end(entry_id)
+            if len(entry.variants) < self.variants:
+                self.fills += 1
+                return None
+            self.hits += 1
+            return random.choice(entry.variants)
+
+    def put(self, stage: str, language: str, embedding: Sequence[float], response: str, response_en: Optional[str]):
+        """保存一次生成的回复：加入近似消息的条目，没有时新建条目"""
+        bucket = (stage, language)
+        vector = self._normalize(embedding)
+        with self._lock:
+            entry_id = self._nearest(bucket, vector)
+            if entry_id is None:
+                entry_id = self._next_id
+                self._next_id += 1
+                self._entries[entry_id] = _Entry(bucket, vector)
+                self._buckets.setdefault(bucket, []).append(entry_id)
+                self._matrices.pop(bucket, None)
+                while len(self._entries) > self.max_entries:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+            entry = self._entries[entry_id]
+            if len(entry.variants) < self.variants and all(text != response for text, _ in entry.variants):
+                entry.variants.append((response, response_en))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """缓存统计（命中率、条目数、回复数等）"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.fills
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fills': self.fills,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'variants': sum(len(entry.variants) for entry in self._entries.values()),
+                'max_entries': self.max_entries
+            }
@@ -0,0 +1,231 @@
+"""自杀风险筛查
+
+两道防线：
+1. 翻译前：在用户原文上匹配多语言短语库（中文、西班牙语、法语等），命中即可立即返回危机响应，
+   不必等待语言检测和翻译两次LLM往返
+2. 翻译后：在英文译文上匹配英文正则（原有规则），覆盖短语库没有收录的表达
+
+所有短语和正则在导入时编译成少量合并后的正则，每条消息只需扫描一次。
+"""
+import re
+from typing import Dict, List, Optional, Set
+
+# 高风险：明确的计划和行动（更紧急）
+# 关键：模式必须包含真正的风险词，且风险词必须紧跟在动词后
+EXPLICIT_PLAN_PATTERNS = [
+    # 明确的计划 - 必须包含风险动作词
+    r'\bi\s+(want|plan|going|will|am)\s+to\s+(kill|end|suicide)\b',
+    r'\bi\s+(want|plan|going|will|am)\s+to\s+(jump|hang|cut|overdose)\b',
+    r'\bkill\s+myself\b',
+    r'\bend\s+(my\s+life|it\s+all)\b',  # 移除"everything"，太宽泛
+    r'\bcommit\s+suicide\b',
+    r'\bsuicide\s+(plan|method|way)\b',
+    r'\btonight.*?(kill|end|suicide)\b',
+    r'\blast\s+(time|goodbye|message)\b',
+    r'\bcut\s+(wrist|artery|vein)\b',
+    r'\boverdose\s+(on\s+)?(pills|medication)\b',
+    r'\bjump\s+(off|from|bridge|building)\b',
+    r'\bhang\s+myself\b',
+]
+
+# 高风险：任何自杀倾向、不想活的意图（严格的匹配，每个模式都必须包含明确的风险词）
+SUICIDE_INTENT_PATTERNS = [
+    # Want to die / Die - 必须明确包含"die"或"dead"
+    r'\bi\s+want\s+(to\s+)?die\b',
+    r'\bwanna\s+die\b',
+    r'\bwant\s+to\s+die\b',
+    r'\bi\s+want.*?\bdie\b',  # "i want" 后面必须有"die"
+    r'\bwish.*?\bdead\b',  # 必须包含"dead"
+    r'\bwish\s+i\s+.*?\bdie\b',
+    r'\bwish.*?(i|to).*?\bdie\b',
+
+    # Suicide - 必须明确包含"suicide"或"kill myself"
+    r'\bi\s+want.*?\bsuicide\b',  # "i want" 后面必须有"suicide"
+    r'\bcommit\s+suicide\b',
+    r'\bkilling\s+myself\b',
+    r'\bkill\s+myself\b',
+    r'\bsuicide\b',  # 单独的词，必须有边界
+
+    # Don't want to live - 必须明确包含"live"和否定词
+    r'\bdon\'?t\s+want\s+to\s+live\b',
+    r'\bnot\s+want\s+to\s+live\b',
+    r'\blife.*?\bnot.*?\bworth\b',
+    r'\bnot\s+worth\s+living\b',
+    r'\bdon\'?t\s+want\s+to\s+be\s+alive\b',
+
+    # End life - 必须明确包含"end"和"life"
+    r'\bend\s+(my\s+)?life\b',
+    r'\bend\s+it\s+all\b',
+    # 移除 "end.*?everything" - 太宽泛，会误匹配
+
+    # Leave / Gone - 必须明确包含上下文相关的词
+    r'\bwant\s+to\s+leave\s+(this\s+)?world\b',  # 必须包含"world"
+    r'\bbe\s+gone\b',  # 移除 "i.*?gone" - 太宽泛
+    r'\bwant\s+to\s+leave\b',  # 但只在特定语境中，需要更严格
+
+    # Other expressions - 必须明确
+    r'\bbetter\s+off\s+dead\b',
+    r'\bnot\s+want\s+to\s+be\s+here\b',  # 更严格："not want to be here"
+    r'\bworld.*?\bbetter.*?\bwithout.*?\bme\b',
+    r'\bnobody\s+(would\s+)?care\b',
+    r'\bno\s+one\s+(would\s+)?care\b',
+    r'\bno\s+point\s+in\s+living\b',
+    r'\bhopeless\b',
+    r'\bno\s+hope\b',
+]
+
+# 翻译前筛查使用的多语言短语库：语言 -> {'plan': 明确计划/方式, 'intent': 自杀意图/不想活}
+# 与英文规则保持同样的严格策略：任何自杀倾向都视为高风险，明确计划单独标记
+# 拉丁字母、西里尔字母语言的短语按词边界匹配，中日韩等按子串匹配；文本先转为小写
+MULTILINGUAL_RISK_LEXICON = {
+    'zh': {
+        'plan': ['我要自杀', '今晚自杀', '今晚就去死', '自杀计划', '跳楼', '割腕', '上吊', '吞药', '吃安眠药',
+                 '烧炭', '结束我的生命', '结束自己的生命', '结束这一切', '写好了遗书', '最后一次和你说话'],
+        'intent': ['想死', '不想活', '活不下去', '活着没意思', '活着没有意义', '没有活下去的理由', '自杀', '轻生',
+                   '死了算了', '不如死了', '一了百了', '离开这个世界', '消失算了', '没人会在乎我', '绝望', '没有希望'],
+    },
+    'es': {
+        'plan': ['me voy a suicidar', 'voy a suicidarme', 'voy a matarme', 'me voy a matar', 'plan para suicidarme',
+                 'cortarme las venas', 'tirarme de un puente', 'ahorcarme', 'sobredosis de pastillas'],
+        'intent': ['quiero morir', 'quiero morirme', 'suicidarme', 'suicidio', 'no quiero vivir',
+                   'no quiero seguir viviendo', 'quitarme la vida', 'acabar con mi vida', 'matarme',
+                   'mejor muerto', 'mejor muerta', 'no vale la pena vivir', 'sin esperanza'],
+    },
+    'fr': {
+        'plan': ['je vais me suicider', 'je vais me tuer', 'plan pour me suicider', 'me pendre',
+                 "me jeter d'un pont", 'me trancher les veines', 'overdose de médicaments'],
+        'intent': ['je veux mourir', 'envie de mourir', 'me suicider', 'suicide', 'je ne veux plus vivre',
+                   'me tuer', 'mettre fin à mes jours', 'mettre fin à ma vie', 'en finir avec la vie',
+                   'mieux mort', 'mieux morte', 'sans espoir'],
+    },
+    'de': {
+        'plan': ['ich werde mich umbringen', 'ich bringe mich heute um', 'mich erhängen', 'von der brücke springen',
+                 'pulsadern aufschneiden', 'überdosis tabletten'],
+        'intent': ['ich will sterben', 'ich möchte sterben', 'selbstmord', 'suizid', 'mich umbringen',
+                   'will nicht mehr leben', 'mein leben beenden', 'besser tot', 'hoffnungslos'],
+    },
+    'it': {
+        'plan': ['mi ucciderò', 'mi uccido stasera', 'impiccarmi', 'buttarmi da un ponte', 'tagliarmi le vene',
+                 'overdose di pillole'],
+        'intent': ['voglio morire', 'suicidarmi', 'suicidio', 'non voglio più vivere', 'togliermi la vita',
+                   'farla finita', 'meglio morto', 'meglio morta', 'senza speranza'],
+    },
+    'pt': {
+        'plan': ['vou me matar', 'vou me suicidar', 'me enforcar', 'pular da ponte', 'cortar os pulsos',
+                 'overdose de remédios'],
+        'intent': ['quero morrer', 'me matar', 'suicídio', 'suicidar', 'não quero mais viver', 'não quero viver',
+                   'tirar minha vida', 'acabar com a minha vida', 'melhor morto', 'melhor morta', 'sem esperança'],
+    },
+    'ja': {
+        'plan': ['今夜死ぬ', '飛び降りる', '首を吊る', '手首を切る'],
+        'intent': ['死にたい', '自殺', '消えたい', '生きていたくない', '生きる意味がない'],
+    },
+    'ko': {
+        'plan': ['오늘 밤 죽을', '뛰어내릴', '목을 매', '손목을 긋'],
+        'intent': ['죽고 싶', '자살', '살고 싶지 않', '사라지고 싶'],
+    },
+    'ru': {
+        'plan': ['покончу с собой', 'повешусь', 'спрыгну с моста', 'вскрою вены'],
+        'intent': ['хочу умереть', 'самоубийство', 'суицид', 'не хочу жить', 'покончить с собой'],
+    },
+    'ar': {
+        'plan': ['سأقتل نفسي', 'سأنتحر'],
+        'intent': ['أريد أن أموت', 'انتحار', 'لا أريد أن أعيش'],
+    },
+    'hi': {
+        'plan': ['मैं खुद को मार दूंगा', 'मैं खुद को मार दूंगी'],
+        'intent': ['मरना चाहता', 'मरना चाहती', 'आत्महत्या', 'जीना नहीं चाहता', 'जीना नहीं चाहती'],
+    },
+}
+
+# 这些文字没有空格分词，不能使用词边界
+_NO_WORD_BOUNDARY_LANGUAGES = {'zh', 'ja', 'ko'}
+
+# 词边界两侧不能出现的字符。re 的 \w 不包含组合用的元音符号（如天城文的 'ा'、'े'），
+# \b 在这些符号前后会判断失败，因此把整个天城文区段也当作词内字符
+_WORD_CHARS = r'\w\u0900-\u097f'
+
+
+def _phrase_pattern(phrase: str, language: str) -> str:
+    pattern = r'\s+'.join(re.escape(word) for word in phrase.lower().split())
+    if language in _NO_WORD_BOUNDARY_LANGUAGES:
+        return pattern
+    return rf'(?<![{_WORD_CHARS}]){pattern}(?![{_WORD_CHARS}])'
+
+
+def _compile(patterns: List[str]) -> re.Pattern:
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+class RiskScreener:
+    """把英文正则和多语言短语库编译成合并后的匹配器"""
+
+    def __init__(self):
+        # 英文规则（翻译后使用）
+        self._english_plan = _compile(EXPLICIT_PLAN_PATTERNS)
+        self._english_intent = _compile(SUICIDE_INTENT_PATTERNS)
+
+        # 多语言短语库 + 英文规则（翻译前在原文上使用）；每个短语所属的语言用于决定危机响应的语言
+        # 同一个短语可能出现在多种语言中（如 suicide 在法语和英文中、suicidio 在西班牙语和意大利语中），所以保存集合
+        self._phrase_languages: Dict[str, Set[str]] = {}
+        plan_patterns, intent_patterns = [], []
+        for language, groups in MULTILINGUAL_RISK_LEXICON.items():
+            for phrase in groups['plan']:
+                plan_patterns.append(_phrase_pattern(phrase, language))
+                self._phrase_languages.setdefault(phrase.lower(), set()).add(language)
+            for phrase in groups['intent']:
+                intent_patterns.append(_phrase_pattern(phrase, language))
+                self._phrase_languages.setdefault(phrase.lower(), set()).add(language)
+        self._multilingual_plan = _compile(plan_patterns + EXPLICIT_PLAN_PATTERNS)
+        self._multilingual_intent = _compile(intent_patterns + SUICIDE_INTENT_PATTERNS)
+
+    def _match(self, text: str, plan: re.Pattern, intent: re.Pattern) -> Optional[Dict]:
+        message_lower = text.lower().strip()
+        # 先检查明确的计划和行动（更紧急的情况）
+        for has_explicit_plan, pattern in ((True, plan), (False, intent)):
+            match = pattern.search(message_lower)
+            if match:
+                matched = ' '.join(match.group(0).split())
+                languages = set(self._phrase_languages.get(matched, ()))
+                # 命中文本本身也符合英文规则时，英文也是候选语言
+                if not languages or self._english_plan.search(matched) or self._english_intent.search(matched):
+                    languages.add('en')
+                return {
+                    'has_explicit_plan': has_explicit_plan,
+                    'matched': matched,
+                    'languages': sorted(languages),
+                    'language': next(iter(languages)) if len(languages) == 1 else None
+                }
+        return None
+
+    def screen(self, text: str) -> Optional[Dict]:
+        """翻译前筛查：在用户原文上匹配多语言短语库和英文规则
+
+        Returns:
+            未命中返回None；命中返回 {'has_explicit_plan': bool, 'matched': 命中文本,
+            'languages': 命中文本可能所属的语言, 'language': 唯一的所属语言（多种语言共有时为None）}
+        """
+        return self._match(text, self._multilingual_plan, self._multilingual_intent)
+
+    def screen_english(self, text_en: str) -> Optional[Dict]:
+        """翻译后筛查：在英文译文上匹配英文规则，返回格式同 screen()"""
+        return self._match(text_en, self._english_plan, self._english_intent)
+
+
+def crisis_language(hit: Dict, local_language: str, confidence: float, preferred_language: Optional[str],
+                    threshold: float) -> str:
+    """翻译前筛查命中时危机响应使用的语言
+
+    依次使用：有把握的本地检测结果、会话的首选语言；命中文本符合英文规则时用英文；
+    否则用候选语言中与本地检测一致的语言、命中短语唯一所属的语言，仍无法判断时用英文
+    """
+    if local_language != 'other' and confidence >= threshold:
+        return local_language
+    if preferred_language:
+        return preferred_language
+    candidates = hit.get('languages', ())
+    if 'en' in candidates:
+        return 'en'
+    if local_language in candidates:
+        return local_language
+    return hit.get('language') or 'en'
@@ -0,0 +1,141 @@
+"""服务端对话会话存储
+
+保存每个会话的规范化英文历史（content + content_en）、较早历史的滚动摘要、检测到的语言和对话阶段，
+客户端每轮只需要发送 session_id 和新消息，不必重复发送、重复翻译整段历史。
+
+- InMemorySessionStore：进程内字典，单worker默认使用
+- SQLiteSessionStore：多worker部署时共享同一个SQLite文件（读写放到线程池执行，不阻塞事件循环）
+两者都按最后访问时间做TTL淘汰。会话ID只由服务端生成（new_session_id），客户端无法指定或猜测。
+"""
+import abc
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config import Settings
+
+
+def new_session() -> Dict:
+    """创建空会话"""
+    return {'history': [], 'language': None, 'stage': None, 'history_summary': None}
+
+
+def new_session_id() -> str:
+    """生成新的会话ID（256位随机数）"""
+    return secrets.token_urlsafe(32)
+
+
+class SessionStore(abc.ABC):
+    """会话存储接口"""
+
+    @abc.abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict]:
+        """读取会话，不存在或已过期时返回None"""
+
+    @abc.abstractmethod
+    async def save(self, session_id: str, session: Dict):
+        """保存会话并刷新过期时间"""
+
+    @abc.abstractmethod
+    async def delete(self, session_id: str):
+        """删除会话"""
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内会话存储（带TTL淘汰）"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._sessions: Dict[str, tuple] = {}  # session_id -> (过期时间, 会话)
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + ttl_seconds
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if expires_at < time.time():
+                del self._sessions[session_id]
+                return None
+            return session
+
+    async def save(self, session_id: str, session: Dict):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now + self.ttl_seconds, session)
+            # 定期清理过期会话，避免从不再访问的会话一直占用内存
+            if now >= self._next_sweep:
+                expired = [sid for sid, (expires_at, _) in self._sessions.items() if expires_at < now]
+                for sid in expired:
+                    del self._sessions[sid]
+                self._next_sweep = now + self.ttl_seconds
+
+    async def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite会话存储，多个worker进程可以共享同一个数据库文件"""
+
+    def __init__(self, db_path: str, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # 多进程读写时读不阻塞写
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + ttl_seconds
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def save(self, session_id: str, session: Dict):
+        await asyncio.to_thread(self._save, session_id, session)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete, session_id)
+
+    def _get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND expires_at >= ?",
+                (session_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, session_id: str, session: Dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(session, ensure_ascii=False), now + self.ttl_seconds)
+            )
+            if now >= self._next_sweep:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+                self._next_sweep = now + self.ttl_seconds
+            self._conn.commit()
+
+    def _delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+def create_session_store() -> SessionStore:
+    """根据配置创建会话存储"""
+    if Settings.SESSION_BACKEND == 'sqlite':
+        return SQLiteSessionStore(Settings.SESSION_DB_PATH, Settings.SESSION_TTL_SECONDS)
+    return InMemorySessionStore(Settings.SESSION_TTL_SECONDS)
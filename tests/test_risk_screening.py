@@ -0,0 +1,65 @@
+"""翻译前风险筛查：多种语言共有的短语不能把英文消息的危机响应判成其他语言"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Settings  # noqa: E402
+from language_detector import detect_language  # noqa: E402
+from risk_screening import RiskScreener, crisis_language  # noqa: E402
+
+screener = RiskScreener()
+
+
+def _language(message, preferred_language=None):
+    hit = screener.screen(message)
+    assert hit is not None
+    local_language, confidence = detect_language(message)
+    return crisis_language(hit, local_language, confidence, preferred_language,
+                           Settings.LANGUAGE_DETECTION_CONFIDENCE_THRESHOLD)
+
+
+def test_shared_phrase_keeps_all_languages():
+    assert screener.screen("thinking about suicide")['languages'] == ['en', 'fr']
+    assert screener.screen("pienso en el suicidio")['languages'] == ['es', 'it']
+    assert screener.screen("thinking about suicide")['language'] is None
+
+
+@pytest.mark.parametrize('message', [
+    "thinking about suicide",
+    "I keep thinking about suicide lately",
+    "suicide",
+])
+def test_english_message_with_shared_phrase_gets_english_response(message):
+    assert _language(message) == 'en'
+
+
+def test_shared_phrase_uses_session_language():
+    assert _language("thinking about suicide", preferred_language='zh') == 'zh'
+
+
+def test_unambiguous_phrase_uses_its_language():
+    assert _language("我想自杀") == 'zh'
+    assert _language("je pense au suicide") == 'fr'
+
+
+@pytest.mark.parametrize('message, has_explicit_plan', [
+    ("मैं खुद को मार दूंगा", True),
+    ("आज रात मैं खुद को मार दूंगी", True),
+    ("आत्महत्या", False),
+    ("मुझे आत्महत्या के विचार आते हैं", False),
+    ("मैं अब जीना नहीं चाहता", False),
+])
+def test_hindi_phrases_match(message, has_explicit_plan):
+    """天城文的元音符号不是 \\w，短语两侧的词边界不能因此失败"""
+    hit = screener.screen(message)
+    assert hit is not None
+    assert hit['has_explicit_plan'] is has_explicit_plan
+    assert _language(message) == 'hi'
+
+
+def test_hindi_phrase_needs_word_boundary():
+    assert screener.screen("मैं बहुत खुश हूँ") is None
+    assert screener.screen("अमरना चाहता") is None  # 短语前面紧跟着其他字母
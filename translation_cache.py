@@ -0,0 +1,108 @@
+"""翻译缓存
+
+- 键：(方向, 语言, 模型, 原文) 的 SHA-256，跨进程、跨重启稳定（Python 内置 hash() 每个进程随机加盐）
+- 按字节数上限做LRU淘汰，而不是写满后不再接收新条目
+- 可选TTL
+- 命中/未命中/淘汰计数，供监控使用
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def make_translation_key(direction: str, language: str, model: str, text: str) -> str:
+    """生成稳定的缓存键
+
+    Args:
+        direction: 'to_en'（翻译成英文）或 'from_en'（翻译回用户语言）
+        language: 目标语言（翻译提示词只依赖目标语言，源语言不影响译文）
+        model: 翻译使用的模型
+        text: 原文
+    """
+    payload = "\x00".join((direction, language or '', model or '', text))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """线程安全的LRU翻译缓存，容量按字节计算"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (译文, 写入时间, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def get_first(self, keys: List[str]) -> Optional[Tuple[int, str]]:
+        """按顺序查找多个键，返回第一个命中的 (下标, 值)；整次查找只计一次命中或未命中"""
+        with self._lock:
+            for index, key in enumerate(keys):
+                value = self._lookup(key)
+                if value is not None:
+                    self.hits += 1
+                    return index, value
+            self.misses += 1
+            return None
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """查找并刷新LRU顺序（调用方持有锁，不计命中/未命中）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at, size = entry
+        if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        # 键（64字节十六进制）+ 译文的UTF-8字节数，近似条目占用
+        size = len(key) + len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, time.time(), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """缓存统计（命中率、条目数、占用字节等）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
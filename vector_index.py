@@ -0,0 +1,351 @@
+"""进程内的NumPy向量索引（可替代ChromaDB的检索后端）
+
+知识库只有几千个文档块，全部向量放进内存也只有几十MB。每轮对话的检索不必再走网络访问ChromaDB Cloud：
+- 向量保存为连续的矩阵（.npy，可用内存映射加载，多个worker进程共享同一份页缓存）；
+  可选 float16 或 int8（每个向量一个缩放系数）存储，分别把内存占用降到 1/2、约 1/4
+- 查询时一次矩阵乘法算出所有相似度，argpartition 取精确的 top-k
+- 返回与 similarity_search_with_score 相同的 (Document, 距离) 列表，距离的定义与导出时集合的
+  距离空间一致（l2 / cosine / ip），chat() 中的阈值逻辑无需任何修改
+
+索引由 init_kb.py 在构建知识库后导出，也可以直接从已有集合导出：
+    python vector_index.py
+"""
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+INDEX_VERSION = 1
+
+_EMBEDDINGS_FILE = 'embeddings.npy'
+_CHUNKS_FILE = 'chunks.json'
+_META_FILE = 'index.json'
+_SCALES_FILE = 'scales.npy'
+
+DTYPES = ('float32', 'float16', 'int8')
+# 低精度存储时分块反量化计算相似度：块小到能留在CPU缓存里，临时内存也不随索引大小增长
+_BLOCK_ROWS = 256
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """把 float32 向量转换为存储精度，返回 (存储矩阵, 每个向量的缩放系数)
+
+    int8 按向量对称量化：scale = max|v| / 127，v ≈ q * scale；其他精度没有缩放系数
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported index dtype: {dtype}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == 'float32':
+        return vectors, None
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """元数据是否满足 where 条件（见 NumpyVectorIndex._where_mask）"""
+    for field, condition in where.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                matched = value == operand
+            elif operator == '$ne':
+                matched = value != operand
+            elif operator == '$in':
+                matched = value in operand
+            elif operator == '$nin':
+                matched = value not in operand
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+            if not matched:
+                return False
+    return True
+
+
+def distances(query_embedding: Sequence[float], vectors: Sequence[Sequence[float]], space: str) -> np.ndarray:
+    """一个查询向量到少量向量的距离（定义与 NumpyVectorIndex、ChromaDB 一致）"""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, len(query))
+    dots = vectors @ query
+    if space == 'ip':
+        return 1.0 - dots
+    if space == 'cosine':
+        return 1.0 - dots / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12)
+    return np.maximum(np.einsum('ij,ij->i', vectors, vectors) + query @ query - 2.0 * dots, 0.0)
+
+
+class NumpyVectorIndex:
+    """精确最近邻检索（暴力矩阵乘法）"""
+
+    def __init__(self, embeddings: np.ndarray, texts: List[str], metadatas: List[Dict],
+                 ids: List[str] = None, space: str = 'l2', dtype: str = 'float32',
+                 scales: Optional[np.ndarray] = None):
+        """
+        Args:
+            embeddings: (n, dim) 的向量矩阵（float32；传入 scales 时为已量化的存储矩阵）
+            texts: 每个向量对应的文档块文本
+            metadatas: 每个向量对应的元数据
+            ids: 文档块ID
+            space: 距离空间，与ChromaDB集合的 hnsw:space 一致（'l2' / 'cosine' / 'ip'）
+            dtype: 存储精度（'float32' / 'float16' / 'int8'）
+            scales: int8 存储时每个向量的缩放系数（从磁盘加载已量化的索引时使用）
+        """
+        if space not in ('l2', 'cosine', 'ip'):
+            raise ValueError(f"Unsupported distance space: {space}")
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        if not (len(embeddings) == len(texts) == len(metadatas)):
+            raise ValueError("embeddings, texts and metadatas must have the same length")
+        if dtype == 'int8' and scales is not None:
+            self.embeddings = np.asarray(embeddings, dtype=np.int8)
+            self.scales = np.asarray(scales, dtype=np.float32)
+        elif dtype == 'float16' and np.asarray(embeddings).dtype == np.float16:
+            self.embeddings = np.asarray(embeddings)
+            self.scales = None
+        else:
+            self.embeddings, self.scales = quantize(embeddings, dtype)
+        self.texts = texts
+        self.metadatas = metadatas
+        self.ids = ids or [str(i) for i in range(len(texts))]
+        self.space = space
+        self.dtype = dtype
+        # 预先计算各向量（反量化后）的范数平方，l2/cosine 距离只需一次矩阵乘法
+        self._sq_norms = np.zeros(len(self), dtype=np.float32)
+        for start, stop, block in self._blocks():
+            self._sq_norms[start:stop] = np.einsum('ij,ij->i', block, block)
+        self._norms = np.sqrt(self._sq_norms)
+        self._where_masks: Dict[str, np.ndarray] = {}
+        self._rows: Optional[Dict[str, int]] = None  # 文档块ID -> 行号（首次按ID查询时建立）
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """每个文档块的向量占用（含缩放系数）"""
+        return self.dimension * self.embeddings.itemsize + (4 if self.scales is not None else 0)
+
+    def _blocks(self, scaled: bool = True):
+        """按行分块反量化为 float32，依次产出 (起始行, 结束行, 向量块)；float32 存储时整体产出一次
+
+        各块复用同一个缓冲区，产出的块只在下一次迭代前有效。
+        scaled=False 时 int8 块不乘缩放系数（由调用方在点积之后再乘，省掉一遍逐元素运算）
+        """
+        if self.dtype == 'float32':
+            yield 0, len(self), self.embeddings
+            return
+        buffer = np.empty((min(_BLOCK_ROWS, len(self)), self.dimension), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            stop = min(start + _BLOCK_ROWS, len(self))
+            block = buffer[:stop - start]
+            block[...] = self.embeddings[start:stop]
+            if scaled and self.scales is not None:
+                block *= self.scales[start:stop, None]
+            yield start, stop, block
+
+    def dequantize(self) -> np.ndarray:
+        """全部向量（float32）"""
+        vectors = np.empty((len(self), self.dimension), dtype=np.float32)
+        for start, stop, block in self._blocks():
+            vectors[start:stop] = block
+        return vectors
+
+    def _dots(self, queries: np.ndarray) -> np.ndarray:
+        if self.dtype == 'float32':
+            return queries @ self.embeddings.T
+        dots = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start, stop, block in self._blocks(scaled=False):
+            dots[:, start:stop] = queries @ block.T
+        if self.scales is not None:
+            dots *= self.scales
+        return dots
+
+    def _distances(self, queries: np.ndarray) -> np.ndarray:
+        """(m, dim) 的查询矩阵 → (m, n) 的距离矩阵"""
+        dots = self._dots(queries)
+        if self.space == 'ip':
+            return 1.0 - dots
+        query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+        if self.space == 'cosine':
+            denominators = np.sqrt(query_sq_norms)[:, None] * self._norms[None, :]
+            return 1.0 - dots / np.maximum(denominators, 1e-12)
+        # ChromaDB 的 l2 是欧氏距离的平方
+        return np.maximum(query_sq_norms[:, None] + self._sq_norms[None, :] - 2.0 * dots, 0.0)
+
+    def _where_mask(self, where: Dict) -> np.ndarray:
+        """元数据过滤条件对应的布尔掩码（按条件缓存，每种条件只计算一次）
+
+        支持ChromaDB where 语法的子集：{'字段': 值}、{'字段': {'$eq'/'$ne'/'$in'/'$nin': ...}}，
+        多个字段之间为"与"
+        """
+        key = json.dumps(where, sort_keys=True)
+        mask = self._where_masks.get(key)
+        if mask is None:
+            mask = np.array([matches_where(metadata, where) for metadata in self.metadatas], dtype=bool)
+            self._where_masks[key] = mask
+        return mask
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     where: Optional[Dict] = None) -> List[List[Tuple[Document, float]]]:
+        """批量检索，每个查询返回按距离升序排列的 top-k (Document, 距离)
+
+        Args:
+            query_embeddings: 查询向量
+            k: 每个查询返回的数量
+            where: 可选的元数据过滤条件（见 _where_mask）
+        """
+        if len(self) == 0:
+            return [[] for _ in query_embeddings]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dimension:
+            raise ValueError(
+                f"Query embeddings have shape {queries.shape} but the index is {self.dimension}-d; "
+                "EMBEDDING_DIMENSIONS must match the one used to build the index"
+            )
+        distances = self._distances(queries)
+        k = min(k, len(self))
+        if where:
+            mask = self._where_mask(where)
+            distances[:, ~mask] = np.inf
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+
+        if k < len(self):
+            candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(len(self)), distances.shape)
+        candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1)
+        top_indices = np.take_along_axis(candidates, order, axis=1)
+        top_distances = np.take_along_axis(candidate_distances, order, axis=1)
+
+        return [
+            [
+                (Document(page_content=self.texts[i], metadata=dict(self.metadatas[i]), id=self.ids[i]), float(distance))
+                for i, distance in zip(row_indices, row_distances)
+            ]
+            for row_indices, row_distances in zip(top_indices.tolist(), top_distances.tolist())
+        ]
+
+    def distances_for_ids(self, query_embedding: Sequence[float], ids: Sequence[str]) -> Dict[str, float]:
+        """查询向量到指定文档块的距离（索引中不存在的ID不返回）"""
+        if self._rows is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        if not rows:
+            return {}
+        vectors = self.embeddings[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows, None]
+        return {self.ids[row]: float(distance) for row, distance in zip(rows, distances(query_embedding, vectors, self.space))}
+
+    def search(self, query_embedding: Sequence[float], k: int, where: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """检索单个查询向量"""
+        return self.search_batch([query_embedding], k, where=where)[0]
+
+    def save(self, path: str):
+        """保存到目录（先写临时文件再替换，服务进程不会读到写了一半的索引）"""
+        os.makedirs(path, exist_ok=True)
+        files = {
+            _EMBEDDINGS_FILE: lambda f: np.save(f, self.embeddings),
+            _CHUNKS_FILE: lambda f: f.write(json.dumps(
+                {'ids': self.ids, 'texts': self.texts, 'metadatas': self.metadatas}, ensure_ascii=False
+            ).encode('utf-8')),
+            _META_FILE: lambda f: f.write(json.dumps(
+                {'version': INDEX_VERSION, 'space': self.space, 'count': len(self), 'dimension': self.dimension,
+                 'dtype': self.dtype}
+            ).encode('utf-8')),
+        }
+        if self.scales is not None:
+            files[_SCALES_FILE] = lambda f: np.save(f, self.scales)
+        # 元数据最后写入：其中的 dtype 决定如何读取前面的文件
+        files[_META_FILE] = files.pop(_META_FILE)
+        for name, write in files.items():
+            tmp_path = os.path.join(path, f"{name}.tmp")
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'NumpyVectorIndex':
+        """从目录加载索引
+
+        Args:
+            path: save() 写入的目录
+            mmap: 以只读内存映射方式加载向量矩阵（启动快，多进程共享物理内存）
+        """
+        meta_path = os.path.join(path, _META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(
+                f"Vector index not found at {path}. "
+                "Please run init_kb.py (or python vector_index.py) to export it"
+            )
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Vector index version {meta.get('version')} != {INDEX_VERSION}, please re-export it")
+        with open(os.path.join(path, _CHUNKS_FILE), encoding='utf-8') as f:
+            chunks = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        embeddings = np.load(os.path.join(path, _EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        dtype = meta.get('dtype', 'float32')
+        scales = np.load(os.path.join(path, _SCALES_FILE)) if dtype == 'int8' else None
+        return cls(embeddings, chunks['texts'], chunks['metadatas'], ids=chunks['ids'], space=meta['space'],
+                   dtype=dtype, scales=scales)
+
+
+def export_collection(collection, space: Optional[str] = None, page_size: int = 1000,
+                      dtype: str = 'float32') -> NumpyVectorIndex:
+    """从ChromaDB集合（chromadb 原生集合或 LangChain 的 Chroma 封装）导出全部向量、文本和元数据
+
+    Args:
+        dtype: 导出索引的存储精度（见 quantize）
+    """
+    if space is None:
+        chroma_collection = getattr(collection, '_collection', collection)
+        space = (getattr(chroma_collection, 'metadata', None) or {}).get('hnsw:space', 'l2')
+
+    # 分页读取，避免一次请求返回整个集合
+    ids, vectors, texts, metadatas = [], [], [], []
+    while True:
+        page = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=len(ids))
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        vectors.extend(page['embeddings'])
+        texts.extend(text or '' for text in page['documents'])
+        metadatas.extend(metadata or {} for metadata in page['metadatas'])
+        if len(page['ids']) < page_size:
+            break
+
+    embeddings = np.asarray(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return NumpyVectorIndex(embeddings, texts, metadatas, ids=ids, space=space, dtype=dtype)
+
+
+if __name__ == "__main__":
+    import chromadb
+    from config import Settings
+
+    if Settings.USE_CHROMA_CLOUD:
+        client = chromadb.CloudClient(
+            api_key=Settings.CHROMA_API_KEY,
+            tenant=Settings.CHROMA_TENANT,
+            database=Settings.CHROMA_DATABASE
+        )
+    else:
+        client = chromadb.PersistentClient(path=Settings.VECTOR_DB_PATH)
+    index = export_collection(client.get_collection(name=Settings.COLLECTION_NAME), dtype=Settings.VECTOR_INDEX_DTYPE)
+    index.save(Settings.VECTOR_INDEX_PATH)
+    print(f"✅ 已导出 {len(index)} 个向量（{index.dimension}维 {index.dtype}，{index.space}距离）到 {Settings.VECTOR_INDEX_PATH}")